@@ -3,25 +3,37 @@ Agente de IA para Atendimento de Supermercado usando LangGraph
 Versão com suporte a VISÃO, Pedidos com Comprovante e MEMÓRIA OTIMIZADA
 """
 
-from typing import Dict, Any, TypedDict, Sequence, List
+from typing import Dict, Any, TypedDict, Sequence, List, Callable, Optional
+from typing_extensions import NotRequired
 import re
 from langchain_openai import ChatOpenAI
 from langchain_core.messages import BaseMessage, SystemMessage, HumanMessage, AIMessage
-from langchain_core.tools import tool
-from langchain_core.runnables import RunnableConfig
+from langchain_core.tools import tool, StructuredTool
+from langchain_core.runnables import RunnableConfig, RunnableLambda
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langgraph.graph import StateGraph, END
 from langgraph.prebuilt import ToolNode, tools_condition, create_react_agent
-from langgraph.checkpoint.memory import MemorySaver
+from langgraph.prebuilt.chat_agent_executor import AgentState
 from pathlib import Path
+import asyncio
 import json
 import os
+import time
 
 from config.settings import settings
 from config.logger import setup_logger
-from tools.http_tools import estoque, pedidos, alterar, ean_lookup, estoque_preco
-from tools.time_tool import get_current_time, search_message_history
+from config.metrics import metrics
+from tools.http_tools import (
+    estoque, pedidos, alterar, ean_lookup, estoque_preco, estoque_preco_lote,
+    aestoque, apedidos, aalterar, aean_lookup, aestoque_preco, aestoque_preco_lote,
+)
+from tools.time_tool import get_current_time, search_message_history, asearch_message_history
+from tools.tool_guard import TurnDeadlineExceeded, guard_tool, turn_deadline, turn_remaining
 from memory.limited_postgres_memory import LimitedPostgresChatMessageHistory
+from memory.async_postgres_memory import AsyncLimitedPostgresChatMessageHistory
+from memory.checkpointer import abuild_checkpointer, build_checkpointer
+from memory.context_assembly import assemble_context
+from services.compaction import AsyncCompactionService, CompactionService
 
 # Se você criou o instructions_loader.py do passo anterior, mantenha o import. 
 # Caso contrário, use o load_system_prompt original.
@@ -33,51 +45,95 @@ logger = setup_logger(__name__)
 # Definição das Ferramentas (Tools)
 # ============================================
 
-@tool
+def _dual_tool(func: Callable, coroutine: Callable, name: Optional[str] = None) -> StructuredTool:
+    """Ferramenta com as duas versões: `func` no invoke (threads) e `coroutine` no ainvoke (asyncio)."""
+    return StructuredTool.from_function(
+        func=func,
+        coroutine=coroutine,
+        name=name or func.__name__,
+        description=func.__doc__,
+    )
+
 def estoque_tool(url: str) -> str:
     """Consultar estoque e preço atual."""
     return estoque(url)
 
-@tool
+async def _aestoque_tool(url: str) -> str:
+    return await aestoque(url)
+
 def pedidos_tool(json_body: str) -> str:
     """Enviar o pedido finalizado."""
     return pedidos(json_body)
 
-@tool
+async def _apedidos_tool(json_body: str) -> str:
+    return await apedidos(json_body)
+
 def alterar_tool(telefone: str, json_body: str) -> str:
     """Atualizar o pedido no painel."""
     return alterar(telefone, json_body)
 
-@tool
+async def _aalterar_tool(telefone: str, json_body: str) -> str:
+    return await aalterar(telefone, json_body)
+
 def search_history_tool(telefone: str, keyword: str = None) -> str:
     """Busca mensagens anteriores."""
     return search_message_history(telefone, keyword)
 
-@tool
+async def _asearch_history_tool(telefone: str, keyword: str = None) -> str:
+    return await asearch_message_history(telefone, keyword)
+
 def time_tool() -> str:
     """Retorna a data e hora atual."""
     return get_current_time()
 
-@tool("ean")
-def ean_tool_alias(query: str) -> str:
-    """Buscar EAN/infos do produto."""
+async def _atime_tool() -> str:
+    return get_current_time()
+
+def _ean_query(query: str) -> str:
     q = (query or "").strip()
     if q.startswith("{") and q.endswith("}"): q = ""
-    return ean_lookup(q)
+    return q
+
+def ean_tool_alias(query: str) -> str:
+    """Buscar EAN/infos do produto."""
+    return ean_lookup(_ean_query(query))
+
+async def _aean_tool_alias(query: str) -> str:
+    return await aean_lookup(_ean_query(query))
 
-@tool("estoque")
 def estoque_preco_alias(ean: str) -> str:
     """Consulta preço e disponibilidade pelo EAN."""
     return estoque_preco(ean)
 
-ACTIVE_TOOLS = [
+async def _aestoque_preco_alias(ean: str) -> str:
+    return await aestoque_preco(ean)
+
+def estoque_lote_tool(eans: List[str]) -> str:
+    """Consulta preço e disponibilidade de vários EANs de uma vez (lista de compras): uma chamada para todos os itens."""
+    return estoque_preco_lote(eans)
+
+async def _aestoque_lote_tool(eans: List[str]) -> str:
+    return await aestoque_preco_lote(eans)
+
+estoque_tool = _dual_tool(estoque_tool, _aestoque_tool)
+pedidos_tool = _dual_tool(pedidos_tool, _apedidos_tool)
+alterar_tool = _dual_tool(alterar_tool, _aalterar_tool)
+search_history_tool = _dual_tool(search_history_tool, _asearch_history_tool)
+time_tool = _dual_tool(time_tool, _atime_tool)
+ean_tool_alias = _dual_tool(ean_tool_alias, _aean_tool_alias, name="ean")
+estoque_preco_alias = _dual_tool(estoque_preco_alias, _aestoque_preco_alias, name="estoque")
+estoque_lote_tool = _dual_tool(estoque_lote_tool, _aestoque_lote_tool, name="estoque_lote")
+
+# Cada ferramenta com timeout próprio e sujeita ao prazo do turno (tools/tool_guard.py)
+ACTIVE_TOOLS = [guard_tool(t) for t in (
     ean_tool_alias,
     estoque_preco_alias,
+    estoque_lote_tool,
     estoque_tool,
     time_tool,
     search_history_tool,
     pedidos_tool,
-]
+)]
 
 # ============================================
 # Funções do Grafo
@@ -102,11 +158,86 @@ def _build_llm():
     temp = float(getattr(settings, "llm_temperature", 0.0))
     return ChatOpenAI(model=model, openai_api_key=settings.openai_api_key, temperature=temp)
 
-def create_agent_with_history():
+_checkpointer = None
+_checkpointer_lock: Optional[asyncio.Lock] = None
+def get_checkpointer():
+    """
+    Checkpointer do grafo. Com AGENT_ASYNC é o saver async, criado no event
+    loop por `aget_checkpointer` (None até o primeiro turno).
+    """
+    global _checkpointer
+    if _checkpointer is None and not settings.agent_async:
+        _checkpointer = build_checkpointer()
+    return _checkpointer
+
+async def aget_checkpointer():
+    """Checkpointer async (AsyncPostgresSaver/AsyncRedisSaver/memória) do caminho AGENT_ASYNC."""
+    global _checkpointer, _checkpointer_lock
+    if _checkpointer is None:
+        if _checkpointer_lock is None:
+            _checkpointer_lock = asyncio.Lock()
+        async with _checkpointer_lock:
+            if _checkpointer is None:
+                _checkpointer = await abuild_checkpointer()
+    return _checkpointer
+
+class SupermercadoState(AgentState):
+    """Estado do grafo: mensagens + resumo deslizante da sessão."""
+    summary: NotRequired[Optional[str]]
+
+def _build_prompt(system_prompt: str):
+    """Antes de cada chamada ao modelo: prompt + resumo + turnos recentes dentro do orçamento."""
+    def prompt(state: SupermercadoState) -> List[BaseMessage]:
+        messages, _ = assemble_context(
+            system_prompt,
+            state["messages"],
+            summary=state.get("summary"),
+            token_budget=settings.context_token_budget,
+            stub_tool_chars=settings.context_stub_tool_chars,
+        )
+        return messages
+    return prompt
+
+def _model_slot(model):
+    """
+    Chamada ao LLM ocupando uma vaga de LLM_MODEL_CONCURRENCY só enquanto o
+    modelo responde (caminho asyncio); ferramentas do turno rodam sem a vaga.
+    """
+    async def acall(messages, config):
+        waited = time.monotonic()
+        async with _model_semaphore(settings.llm_model):
+            metrics.observe("agent.model_wait_seconds", time.monotonic() - waited)
+            return await model.ainvoke(messages, config)
+
+    return RunnableLambda(lambda messages, config: model.invoke(messages, config), afunc=acall, name="llm")
+
+def _model_with_deadline(llm):
+    """
+    Modelo de cada passo do agente: o tempo restante do turno vira o timeout
+    da chamada ao LLM (o prazo do turno vale para o modelo, não só para as ferramentas).
+    """
+    model = llm.bind_tools(ACTIVE_TOOLS)
+
+    def resolve(state, runtime):
+        remaining = turn_remaining()
+        if remaining is None:
+            return _model_slot(model)
+        if remaining <= 0:
+            metrics.incr("agent.deadline_exceeded")
+            raise TurnDeadlineExceeded("Prazo do turno esgotado antes da chamada ao modelo")
+        return _model_slot(model.bind(timeout=remaining))
+    return resolve
+
+def create_agent_with_history(checkpointer=None):
     system_prompt = load_system_prompt()
     llm = _build_llm()
-    memory = MemorySaver()
-    agent = create_react_agent(llm, ACTIVE_TOOLS, prompt=system_prompt, checkpointer=memory)
+    agent = create_react_agent(
+        _model_with_deadline(llm),
+        ToolNode(ACTIVE_TOOLS),
+        prompt=_build_prompt(system_prompt),
+        state_schema=SupermercadoState,
+        checkpointer=checkpointer or get_checkpointer(),
+    )
     return agent
 
 _agent_graph = None
@@ -116,6 +247,13 @@ def get_agent_graph():
         _agent_graph = create_agent_with_history()
     return _agent_graph
 
+async def aget_agent_graph():
+    """Grafo do caminho asyncio, compilado com o checkpointer async."""
+    global _agent_graph
+    if _agent_graph is None:
+        _agent_graph = create_agent_with_history(await aget_checkpointer())
+    return _agent_graph
+
 def get_session_history(session_id: str) -> LimitedPostgresChatMessageHistory:
     return LimitedPostgresChatMessageHistory(
         connection_string=settings.postgres_connection_string,
@@ -124,17 +262,141 @@ def get_session_history(session_id: str) -> LimitedPostgresChatMessageHistory:
         max_messages=settings.postgres_message_limit
     )
 
-# ============================================
-# Função Principal (Modificada)
-# ============================================
+def compact_session(telefone: str) -> None:
+    """
+    Compacta a sessão se ela passou do limite: mantém as últimas mensagens
+    vivas e incorpora o resto ao resumo deslizante.
+    """
+    history_handler = get_session_history(telefone)
+    count = history_handler.get_message_count()
+    if count > settings.compaction_threshold:
+        logger.info(f"Verificando compressão de memória para {telefone} (msg count: {count})...")
+        history_handler.manage_rolling_summary(_build_llm(), group_size=settings.compaction_keep_messages)
+
+_compaction_service = None
+def get_compaction_service() -> CompactionService:
+    global _compaction_service
+    if _compaction_service is None:
+        _compaction_service = CompactionService(compact_session, concurrency=settings.compaction_concurrency)
+        _compaction_service.start()
+    return _compaction_service
+
+def get_async_session_history(session_id: str) -> AsyncLimitedPostgresChatMessageHistory:
+    return AsyncLimitedPostgresChatMessageHistory(
+        connection_string=settings.postgres_connection_string,
+        session_id=session_id,
+        table_name=settings.postgres_table_name,
+        max_messages=settings.postgres_message_limit
+    )
+
+async def acompact_session(telefone: str) -> None:
+    """Versão async de `compact_session` (pool async + `llm.ainvoke`)."""
+    history_handler = get_async_session_history(telefone)
+    count = await history_handler.aget_message_count()
+    if count > settings.compaction_threshold:
+        logger.info(f"Verificando compressão de memória para {telefone} (msg count: {count})...")
+        await history_handler.amanage_rolling_summary(_build_llm(), group_size=settings.compaction_keep_messages)
 
-def run_agent_langgraph(telefone: str, mensagem: str) -> Dict[str, Any]:
+_acompaction_service = None
+def get_async_compaction_service() -> AsyncCompactionService:
+    global _acompaction_service
+    if _acompaction_service is None:
+        _acompaction_service = AsyncCompactionService(acompact_session, concurrency=settings.compaction_concurrency)
+    return _acompaction_service
+
+def _recent_for_rehydration(context: List[BaseMessage]) -> List[BaseMessage]:
+    # O resumo entra pelo estado (summary); aqui só as mensagens recentes
+    recent = [m for m in context if not isinstance(m, SystemMessage)][-settings.postgres_message_limit:]
+    if recent:
+        logger.info(f"♻️ Contexto reidratado do histórico: {len(recent)} mensagens")
+    return recent
+
+def _rehydrate_messages(config: Dict[str, Any], history_handler: LimitedPostgresChatMessageHistory) -> List[BaseMessage]:
     """
-    Executa o agente e gerencia a memória automaticamente.
+    Thread sem estado no checkpointer (processo reiniciado ou despejada por
+    LRU/TTL): recupera o contexto salvo no Postgres (resumo + mensagens recentes).
     """
-    print(f"[AGENT] Telefone: {telefone} | Msg bruta: {mensagem[:50]}...")
-    
-    # 1. Tratamento de Imagem
+    try:
+        if get_checkpointer().get_tuple(config) is not None:
+            return []
+        return _recent_for_rehydration(history_handler.get_optimized_context())
+    except Exception as e:
+        logger.error(f"Erro ao reidratar contexto: {e}")
+        return []
+
+async def _arehydrate_messages(config: Dict[str, Any], history_handler: AsyncLimitedPostgresChatMessageHistory) -> List[BaseMessage]:
+    """Versão async de `_rehydrate_messages`."""
+    try:
+        if await (await aget_checkpointer()).aget_tuple(config) is not None:
+            return []
+        return _recent_for_rehydration(await history_handler.aget_messages())
+    except Exception as e:
+        logger.error(f"Erro ao reidratar contexto: {e}")
+        return []
+
+class _SegmentSplitter:
+    """
+    Junta os chunks do modelo e entrega cada parte (separada por \n\n)
+    assim que ela fica completa, inclusive o texto gerado antes das
+    chamadas de ferramenta ("Deixa eu ver o preço...").
+    """
+
+    def __init__(self, on_segment: Callable[[str], None]):
+        self.on_segment = on_segment
+        self.sent: List[str] = []
+        self._buffer = ""
+        self._current_id = None
+
+    def _emit(self, text: str):
+        text = text.strip()
+        if text:
+            self.on_segment(text)
+            self.sent.append(text)
+
+    def feed(self, chunk, meta: Dict[str, Any]):
+        # Só o texto do modelo (nó "agent"); resultados de ferramentas não vão ao cliente
+        if meta.get("langgraph_node") != "agent" or not isinstance(chunk, AIMessage):
+            return
+        if chunk.id != self._current_id:
+            # Nova mensagem do modelo: o que sobrou da anterior é uma parte completa
+            self._emit(self._buffer)
+            self._buffer, self._current_id = "", chunk.id
+        if isinstance(chunk.content, str):
+            self._buffer += chunk.content
+        while "\n\n" in self._buffer:
+            part, self._buffer = self._buffer.split("\n\n", 1)
+            self._emit(part)
+
+    def finish(self) -> List[str]:
+        self._emit(self._buffer)
+        self._buffer = ""
+        return self.sent
+
+def _stream_agent(agent, initial_state: Dict[str, Any], config: Dict[str, Any], on_segment: Callable[[str], None]) -> List[str]:
+    """Executa o grafo em streaming entregando cada parte pronta. Retorna as partes entregues."""
+    splitter = _SegmentSplitter(on_segment)
+    for chunk, meta in agent.stream(initial_state, config, stream_mode="messages"):
+        splitter.feed(chunk, meta)
+    return splitter.finish()
+
+async def _astream_agent(agent, initial_state: Dict[str, Any], config: Dict[str, Any], on_segment: Callable[[str], None]) -> List[str]:
+    """Versão async de `_stream_agent` (astream no event loop)."""
+    splitter = _SegmentSplitter(on_segment)
+    async for chunk, meta in agent.astream(initial_state, config, stream_mode="messages"):
+        splitter.feed(chunk, meta)
+    return splitter.finish()
+
+def _final_output(result: Any) -> str:
+    output = "Desculpe, não entendi."
+    if isinstance(result, dict) and "messages" in result:
+        messages = result["messages"]
+        if messages:
+            last = messages[-1]
+            output = last.content if isinstance(last.content, str) else str(last.content)
+    return output
+
+def _build_human_message(mensagem: str) -> HumanMessage:
+    """Mensagem do cliente, com a imagem anexada quando houver [MEDIA_URL: ...]."""
     image_url = None
     clean_message = mensagem
     media_match = re.search(r"\[MEDIA_URL:\s*(.*?)\]", mensagem)
@@ -145,11 +407,63 @@ def run_agent_langgraph(telefone: str, mensagem: str) -> Dict[str, Any]:
             clean_message = "Analise esta imagem/comprovante enviada."
         logger.info(f"📸 Mídia detectada: {image_url}")
 
-    # 2. Salvar histórico (User)
+    if image_url:
+        message_content = [
+            {"type": "text", "text": clean_message},
+            {"type": "image_url", "image_url": {"url": image_url}}
+        ]
+        return HumanMessage(content=message_content)
+    return HumanMessage(content=clean_message)
+
+# ============================================
+# Limites de concorrência do caminho asyncio
+# ============================================
+
+# Semáforos por event loop: global (turnos simultâneos) e por modelo (chamadas ao LLM em andamento)
+_turn_semaphores: Dict[int, asyncio.Semaphore] = {}
+_model_semaphores: Dict[tuple, asyncio.Semaphore] = {}
+
+def _turn_semaphore() -> asyncio.Semaphore:
+    loop_id = id(asyncio.get_running_loop())
+    if loop_id not in _turn_semaphores:
+        _turn_semaphores[loop_id] = asyncio.Semaphore(settings.agent_max_concurrency)
+    return _turn_semaphores[loop_id]
+
+def _model_semaphore(model: str) -> asyncio.Semaphore:
+    key = (id(asyncio.get_running_loop()), model)
+    if key not in _model_semaphores:
+        _model_semaphores[key] = asyncio.Semaphore(settings.llm_model_concurrency)
+    return _model_semaphores[key]
+
+def _turn_config(telefone: str) -> Dict[str, Any]:
+    """Config do turno: thread do checkpointer + limite de ferramentas simultâneas por passo."""
+    return {"configurable": {"thread_id": telefone}, "max_concurrency": settings.tool_max_concurrency}
+
+# ============================================
+# Função Principal (Modificada)
+# ============================================
+
+def run_agent_langgraph(telefone: str, mensagem: str, on_segment: Optional[Callable[[str], None]] = None) -> Dict[str, Any]:
+    """
+    Executa o agente e gerencia a memória automaticamente.
+    Com `on_segment`, a resposta é gerada em streaming e cada parte
+    (\n\n) é entregue ao callback assim que fica pronta.
+    """
+    print(f"[AGENT] Telefone: {telefone} | Msg bruta: {mensagem[:50]}...")
+    
+    # 1. Tratamento de Imagem
+    initial_message = _build_human_message(mensagem)
+
+    config = _turn_config(telefone)
+
+    # 2. Recuperar contexto de threads frias (a mensagem do cliente é gravada junto com a resposta)
     history_handler = None
+    prior_messages: List[BaseMessage] = []
+    summary = None
     try:
         history_handler = get_session_history(telefone)
-        history_handler.add_user_message(mensagem)
+        prior_messages = _rehydrate_messages(config, history_handler)
+        summary = history_handler.get_summary()
     except Exception as e:
         logger.error(f"Erro DB User: {e}")
 
@@ -157,55 +471,113 @@ def run_agent_langgraph(telefone: str, mensagem: str) -> Dict[str, Any]:
         agent = get_agent_graph()
         
         # 3. Construir mensagem
-        if image_url:
-            message_content = [
-                {"type": "text", "text": clean_message},
-                {"type": "image_url", "image_url": {"url": image_url}}
-            ]
-            initial_message = HumanMessage(content=message_content)
-        else:
-            initial_message = HumanMessage(content=clean_message)
-
-        initial_state = {"messages": [initial_message]}
-        config = {"configurable": {"thread_id": telefone}}
+        initial_state = {"messages": prior_messages + [initial_message], "summary": summary}
         
         # 4. Executa Agente
         logger.info("Executando agente...")
-        result = agent.invoke(initial_state, config)
-        
+        started = time.monotonic()
         output = "Desculpe, não entendi."
-        if isinstance(result, dict) and "messages" in result:
-            messages = result["messages"]
-            if messages:
-                last = messages[-1]
-                output = last.content if isinstance(last.content, str) else str(last.content)
+        streamed = False
+        with turn_deadline():
+            if on_segment:
+                parts = _stream_agent(agent, initial_state, config, on_segment)
+                if parts:
+                    output = "\n\n".join(parts)
+                    streamed = True
+            else:
+                output = _final_output(agent.invoke(initial_state, config))
         
+        metrics.observe("agent.turn_seconds", time.monotonic() - started)
         logger.info("✅ Agente executado")
         
-        # 5. Salvar histórico (IA)
+        # 5. Salvar histórico do turno (cliente + IA) num único round trip
         if history_handler:
+            count = None
             try:
-                history_handler.add_ai_message(output)
+                count = history_handler.add_messages([HumanMessage(content=mensagem), AIMessage(content=output)])
             except Exception as e:
                 logger.error(f"Erro DB AI: {e}")
 
-            # 6. MANUTENÇÃO INTELIGENTE DA MEMÓRIA (O PULO DO GATO 🐈)
-            # Verifica e comprime o histórico se necessário
+            # 6. MANUTENÇÃO DA MEMÓRIA (em background, fora do caminho da resposta)
+            if count is None or count > settings.compaction_threshold:
+                get_compaction_service().request(telefone)
+
+        return {"output": output, "error": None, "streamed": streamed}
+        
+    except Exception as e:
+        logger.error(f"Falha agente: {e}", exc_info=True)
+        if history_handler:
+            try:
+                history_handler.add_user_message(mensagem)
+            except Exception as db_error:
+                logger.error(f"Erro DB User: {db_error}")
+        return {"output": "Tive um problema técnico, tente novamente.", "error": str(e)}
+
+async def arun_agent_langgraph(telefone: str, mensagem: str, on_segment: Optional[Callable[[str], None]] = None) -> Dict[str, Any]:
+    """
+    Versão asyncio de `run_agent_langgraph`: memória, ferramentas e modelo
+    rodam no event loop (ainvoke/astream), sem uma thread por conversa.
+    Turnos simultâneos são limitados por AGENT_MAX_CONCURRENCY (global); as
+    chamadas ao LLM em andamento, por LLM_MODEL_CONCURRENCY (por modelo).
+    """
+    logger.info(f"[AGENT] Telefone: {telefone} | Msg bruta: {mensagem[:50]}...")
+
+    initial_message = _build_human_message(mensagem)
+    config = _turn_config(telefone)
+
+    history_handler = None
+    prior_messages: List[BaseMessage] = []
+    summary = None
+    try:
+        history_handler = get_async_session_history(telefone)
+        prior_messages = await _arehydrate_messages(config, history_handler)
+        summary = await history_handler.aget_summary()
+    except Exception as e:
+        logger.error(f"Erro DB User: {e}")
+
+    try:
+        agent = await aget_agent_graph()
+        initial_state = {"messages": prior_messages + [initial_message], "summary": summary}
+
+        waited = time.monotonic()
+        async with _turn_semaphore():
+            metrics.observe("agent.semaphore_wait_seconds", time.monotonic() - waited)
+            logger.info("Executando agente (async)...")
+            started = time.monotonic()
+            output = "Desculpe, não entendi."
+            streamed = False
+            with turn_deadline():
+                if on_segment:
+                    parts = await _astream_agent(agent, initial_state, config, on_segment)
+                    if parts:
+                        output = "\n\n".join(parts)
+                        streamed = True
+                else:
+                    output = _final_output(await agent.ainvoke(initial_state, config))
+
+        metrics.observe("agent.turn_seconds", time.monotonic() - started)
+        logger.info("✅ Agente executado")
+
+        if history_handler:
+            count = None
             try:
-                # Se tiver mais de 8 mensagens (6 recentes + 2 para resumir), aciona a compressão
-                count = history_handler.get_message_count()
-                if count > 8:
-                    logger.info(f"Verificando compressão de memória para {telefone} (msg count: {count})...")
-                    llm_compressor = _build_llm()
-                    # Mantém as últimas 6 mensagens vivas e resume o resto
-                    history_handler.manage_rolling_summary(llm_compressor, group_size=6)
+                count = await history_handler.aadd_messages([HumanMessage(content=mensagem), AIMessage(content=output)])
             except Exception as e:
-                logger.error(f"Erro na manutenção de memória: {e}")
+                logger.error(f"Erro DB AI: {e}")
+
+            if count is None or count > settings.compaction_threshold:
+                get_async_compaction_service().request(telefone)
+
+        return {"output": output, "error": None, "streamed": streamed}
 
-        return {"output": output, "error": None}
-        
     except Exception as e:
         logger.error(f"Falha agente: {e}", exc_info=True)
+        if history_handler:
+            try:
+                await history_handler.aadd_messages([HumanMessage(content=mensagem)])
+            except Exception as db_error:
+                logger.error(f"Erro DB User: {db_error}")
         return {"output": "Tive um problema técnico, tente novamente.", "error": str(e)}
 
 run_agent = run_agent_langgraph
+arun_agent = arun_agent_langgraph
@@ -3,5 +3,6 @@ Módulo de configuração do Agente de Supermercado
 """
 from .settings import settings
 from .logger import setup_logger, app_logger
+from .metrics import metrics
 
-__all__ = ['settings', 'setup_logger', 'app_logger']
+__all__ = ['settings', 'setup_logger', 'app_logger', 'metrics']
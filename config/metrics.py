@@ -0,0 +1,81 @@
+"""
+Métricas em memória do Agente de Supermercado
+Contadores, gauges e histogramas simples expostos em /metrics
+"""
+import threading
+from collections import deque
+from typing import Any, Deque, Dict
+
+
+class _Histogram:
+    """Histograma com contagem/soma totais e amostra das últimas N observações."""
+
+    def __init__(self, sample_size: int = 1024):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.samples: Deque[float] = deque(maxlen=sample_size)
+
+    def observe(self, value: float) -> None:
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+        self.samples.append(value)
+
+    def snapshot(self) -> Dict[str, float]:
+        ordered = sorted(self.samples)
+
+        def pct(p: float) -> float:
+            if not ordered:
+                return 0.0
+            return ordered[min(len(ordered) - 1, int(p * len(ordered)))]
+
+        return {
+            "count": self.count,
+            "avg": (self.total / self.count) if self.count else 0.0,
+            "p50": pct(0.50),
+            "p95": pct(0.95),
+            "p99": pct(0.99),
+            "max": self.max,
+        }
+
+
+class MetricsRegistry:
+    """Registro de métricas thread-safe (processo único)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, float] = {}
+        self._gauges: Dict[str, float] = {}
+        self._histograms: Dict[str, _Histogram] = {}
+
+    def incr(self, name: str, value: float = 1) -> None:
+        """Incrementa um contador."""
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def set_gauge(self, name: str, value: float) -> None:
+        """Define o valor atual de um gauge."""
+        with self._lock:
+            self._gauges[name] = value
+
+    def observe(self, name: str, value: float) -> None:
+        """Registra uma observação (ex: latência em segundos) num histograma."""
+        with self._lock:
+            hist = self._histograms.get(name)
+            if hist is None:
+                hist = self._histograms[name] = _Histogram()
+            hist.observe(value)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Retorna uma cópia de todas as métricas."""
+        with self._lock:
+            return {
+                "counters": dict(self._counters),
+                "gauges": dict(self._gauges),
+                "histograms": {k: h.snapshot() for k, h in self._histograms.items()},
+            }
+
+
+# Registro global da aplicação
+metrics = MetricsRegistry()
@@ -20,6 +20,18 @@ class Settings(BaseSettings):
     llm_model: str = "gpt-5-mini"
     llm_temperature: float = 0.0
     llm_provider: str = "openai"
+    agent_stream_output: bool = True
+    # Caminho asyncio do agente (ainvoke + ferramentas httpx) em vez de threads
+    agent_async: bool = False
+    agent_max_concurrency: int = 64
+    llm_model_concurrency: int = 32
+    # Ferramentas de um mesmo passo rodam em paralelo, com teto por ferramenta e prazo por turno
+    tool_timeout_seconds: float = 12.0
+    tool_max_concurrency: int = 10
+    tool_max_workers: int = 32
+    agent_turn_deadline_seconds: float = 45.0
+    # Máximo de produtos por resultado de estoque/EAN enviado ao modelo
+    tool_result_max_items: int = 10
     moonshot_api_key: Optional[str] = None
     moonshot_api_url: str = "https://api.moonshot.ai/anthropic"
     
@@ -27,13 +39,68 @@ class Settings(BaseSettings):
     postgres_connection_string: str
     postgres_table_name: str = "memoria"
     postgres_message_limit: int = 12
+    postgres_pool_min_size: int = 1
+    postgres_pool_max_size: int = 10
+    postgres_pool_timeout: float = 10.0
+    postgres_pool_max_idle: float = 300.0
+
+    # Retenção da memoria particionada (scripts/memoria_retention.py)
+    postgres_retention_months: int = 6
+    postgres_partitions_ahead: int = 2
+    postgres_archive_dir: str = "archive"
+
+    # Contexto enviado ao modelo a cada chamada
+    context_token_budget: int = 4000
+    context_stub_tool_chars: int = 300
+
+    # Cache Redis da janela recente de cada sessão (write-through)
+    context_cache_enabled: bool = True
+    context_cache_max_messages: int = 30  # janela recente: mesmo limite no cache e na leitura do banco
+    context_cache_ttl_seconds: int = 6 * 3600
+
+    # Compactação da memória (resumo deslizante em background)
+    compaction_threshold: int = 8
+    compaction_keep_messages: int = 6
+    compaction_concurrency: int = 2
+
+    # Checkpointer do LangGraph (memory | postgres | redis)
+    checkpointer_backend: str = "memory"
+    checkpointer_max_mb: int = 256
+    checkpointer_ttl_seconds: int = 6 * 3600
+    checkpointer_keep_checkpoints: int = 2
+    checkpointer_pool_size: int = 10
     
     # Redis
     redis_host: str = "localhost"
     redis_port: int = 6379
     redis_password: Optional[str] = None
     redis_db: int = 0
+    webhook_dedup_ttl_seconds: int = 3600
     
+    # Modo de execução: inline (tudo no web) | stream (web + workers via Redis Streams)
+    execution_mode: str = "inline"
+    stream_prefix: str = "agent:inbound"
+    stream_partitions: int = 16
+    stream_group: str = "agent-workers"
+    stream_lease_seconds: int = 30
+    stream_maxlen: int = 100000
+
+    # Buffer de mensagens (debounce)
+    buffer_window_seconds: float = 4.0
+    buffer_max_wait_seconds: float = 20.0
+    buffer_ttl_seconds: int = 900  # msgbuf; no modo stream nunca abaixo da recuperação de um lease perdido
+    buffer_adaptive: bool = True
+    buffer_window_min_seconds: float = 1.5
+    buffer_window_max_seconds: float = 12.0
+    buffer_window_percentile: float = 0.9
+
+    # Pool do agente (backpressure)
+    agent_workers: int = 8
+    agent_queue_size: int = 100
+    agent_overload_policy: str = "reply"  # reply | defer | reject
+    agent_overload_retry_seconds: float = 15.0
+    agent_overload_message: str = "Recebi sua mensagem! Já já te respondo 😊"
+
     # API do Supermercado
     supermercado_base_url: str
     supermercado_auth_token: str
@@ -47,6 +114,26 @@ class Settings(BaseSettings):
     smart_responder_auth: str = ""
     smart_responder_apikey: str = ""
     pre_resolver_enabled: bool = False
+
+    # Snapshot local do catálogo (tools/catalog.py)
+    catalog_enabled: bool = False
+    catalog_full_url: str = ""
+    catalog_delta_url: str = ""
+    catalog_full_interval_seconds: float = 3600.0
+    catalog_refresh_seconds: float = 120.0
+    catalog_max_age_seconds: float = 900.0
+    catalog_sync_timeout: float = 60.0
+
+    # Cache da consulta por EAN: LRU local + Redis, com cache negativo para 404 (tools/ean_cache.py)
+    ean_cache_enabled: bool = True
+    ean_cache_ttl_seconds: int = 60
+    ean_cache_negative_ttl_seconds: int = 120
+    ean_cache_local_size: int = 2048
+    ean_cache_local_ttl_seconds: float = 10.0
+    ean_cache_wait_seconds: float = 15.0
+    # Ferramenta de preço em lote (estoque_lote)
+    ean_batch_max_items: int = 30
+    ean_batch_concurrency: int = 8
     
     # WhatsApp / UAZ API
     # WHATSAPP_API_URL mantido para compatibilidade, mas UAZ_API_URL tem prioridade
@@ -56,6 +143,19 @@ class Settings(BaseSettings):
     whatsapp_token: str
     whatsapp_method: str = "POST"
     whatsapp_agent_number: str | None = None
+    whatsapp_send_timeout: float = 10.0
+    whatsapp_max_connections: int = 20
+    media_concurrency: int = 4
+    media_pending_ttl_seconds: int = 120  # Marcador mediapend:{tel} do modo stream (expira se o web cair)
+    http_async_max_connections: int = 50
+    # Camada HTTP do ERP/Smart Responder (tools/http_client.py)
+    http_connect_timeout: float = 3.0
+    http_read_timeout: float = 10.0
+    http_pool_hosts: int = 10
+    http_pool_per_host: int = 20
+    http_retries: int = 2
+    http_backoff_base: float = 0.2
+    http_backoff_max: float = 2.0
     
     # Servidor
     server_host: str = "0.0.0.0"
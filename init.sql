@@ -1,19 +1,58 @@
 -- Script de inicialização do banco de dados PostgreSQL
 -- Cria a tabela de memória de conversação
 
--- Criar tabela de histórico de mensagens
+-- Extensão para busca por trigramas (ILIKE indexado)
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+-- Cria (se faltar) a partição mensal que contém `mes`
+CREATE OR REPLACE FUNCTION memoria_criar_particao(mes DATE, tabela TEXT DEFAULT 'memoria')
+RETURNS TEXT AS $$
+DECLARE
+    inicio DATE := date_trunc('month', mes)::date;
+    nome TEXT := format('%s_p%s', tabela, to_char(inicio, 'YYYYMM'));
+BEGIN
+    EXECUTE format(
+        'CREATE TABLE IF NOT EXISTS %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+        nome, tabela, inicio, (inicio + interval '1 month')::date
+    );
+    RETURN nome;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Criar tabela de histórico de mensagens (particionada por mês em created_at)
 CREATE TABLE IF NOT EXISTS memoria (
-    id SERIAL PRIMARY KEY,
+    id BIGSERIAL,
     session_id TEXT NOT NULL,
     message JSONB NOT NULL,
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-);
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    content TEXT GENERATED ALWAYS AS (message->'data'->>'content') STORED,
+    tsv TSVECTOR GENERATED ALWAYS AS (to_tsvector('portuguese', COALESCE(message->'data'->>'content', ''))) STORED,
+    PRIMARY KEY (id, created_at)
+) PARTITION BY RANGE (created_at);
 
--- Criar índice para melhorar performance de consultas por session_id
-CREATE INDEX IF NOT EXISTS idx_session_id ON memoria(session_id);
+-- Partição padrão + mês atual e os dois seguintes
+-- (scripts/memoria_retention.py ensure mantém a janela à frente). A DEFAULT
+-- só recebe linhas se faltar partição: o ensure alerta e move essas linhas
+-- para a partição do mês, senão a criação daquele mês falharia.
+CREATE TABLE IF NOT EXISTS memoria_default PARTITION OF memoria DEFAULT;
+SELECT memoria_criar_particao((date_trunc('month', now()) + make_interval(months => m))::date)
+FROM generate_series(0, 2) AS m;
 
--- Criar índice para consultas por data
-CREATE INDEX IF NOT EXISTS idx_created_at ON memoria(created_at);
+-- Índice composto: histórico de uma sessão em ordem cronológica (cobre buscas por session_id)
+CREATE INDEX IF NOT EXISTS idx_memoria_session_created ON memoria(session_id, created_at);
+
+-- Busca por palavra-chave (search_message_history)
+CREATE INDEX IF NOT EXISTS idx_memoria_content_trgm ON memoria USING GIN (content gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_memoria_tsv ON memoria USING GIN (tsv);
+
+-- Resumo deslizante por sessão (marca d'água sobre memoria.id)
+CREATE TABLE IF NOT EXISTS memoria_resumo (
+    session_id TEXT PRIMARY KEY,
+    summary TEXT NOT NULL,
+    summarized_up_to BIGINT NOT NULL DEFAULT 0,
+    summarized_at TIMESTAMP,  -- created_at da linha da marca (limite inferior das leituras)
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
 
 -- Comentários
 COMMENT ON TABLE memoria IS 'Histórico de mensagens do agente de supermercado';
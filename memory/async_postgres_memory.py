@@ -0,0 +1,169 @@
+"""
+Histórico de chat PostgreSQL async (psycopg 3 + AsyncConnectionPool).
+
+Mesmo esquema, SQL e cache da versão síncrona (`LimitedPostgresChatMessageHistory`),
+mas cada acesso ao banco é `await` numa conexão do pool async (e ao cache,
+via redis.asyncio): o caminho asyncio do agente usa a memória no próprio
+event loop, sem threads. A compactação desse caminho roda no
+`AsyncCompactionService` com `amanage_rolling_summary`.
+"""
+from typing import List, Optional, Sequence, Tuple
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import BaseMessage, SystemMessage, message_to_dict, messages_from_dict
+from psycopg.types.json import Jsonb
+
+from config.logger import setup_logger
+from memory.db_pool import async_connection
+from memory.limited_postgres_memory import (
+    SUMMARY_PREFIX,
+    LimitedPostgresChatMessageHistory,
+    _summary_tables_ready,
+)
+
+logger = setup_logger(__name__)
+
+
+class AsyncLimitedPostgresChatMessageHistory(LimitedPostgresChatMessageHistory):
+    """
+    Versão async do histórico com resumo deslizante.
+
+    Os métodos síncronos herdados continuam funcionando (pool síncrono);
+    `aadd_messages`, `aget_messages`, `aget_summary`, `aclear` e
+    `amanage_rolling_summary` não saem do event loop.
+    """
+
+    async def _aensure_summary_table(self, cursor) -> None:
+        key = (self.connection_string, self.summary_table_name)
+        if key in _summary_tables_ready:
+            return
+        await cursor.execute(self._summary_table_sql())
+        await cursor.execute(self._summary_column_sql())
+        _summary_tables_ready.add(key)
+
+    async def _aload_window(self, cursor, limit: Optional[int] = None) -> Tuple[Optional[str], List[Tuple[int, BaseMessage]]]:
+        await self._aensure_summary_table(cursor)
+        await cursor.execute(self._summary_sql(), (self.session_id,))
+        row = await cursor.fetchone()
+        summary = row[0] if row else None
+
+        await cursor.execute(self._window_sql(limit), self._window_params())
+        rows = [(r[0], self._row_to_message(r[1])) for r in await cursor.fetchall()]
+        return summary, rows
+
+    async def _aload_context(self) -> Tuple[Optional[str], List[BaseMessage]]:
+        version = None
+        if self._cache:
+            cached, version = await self._cache.aget(self.session_id)
+            if cached is not None:
+                summary, dicts = cached
+                return summary, messages_from_dict(dicts)
+
+        async with async_connection(self.connection_string) as conn:
+            async with conn.cursor() as cursor:
+                summary, rows = await self._aload_window(cursor, self.window_limit)
+        messages = [msg for _, msg in rows]
+        if self._cache:
+            await self._cache.afill(self.session_id, summary, [message_to_dict(m) for m in messages], version)
+        return summary, messages
+
+    async def aadd_messages(self, messages: Sequence[BaseMessage]) -> Optional[int]:
+        """Grava as mensagens do turno num único round trip e retorna o tamanho da sessão."""
+        if not messages:
+            return None
+        try:
+            dicts = [message_to_dict(m) for m in messages]
+            payload = [Jsonb(d) for d in dicts]
+
+            async with async_connection(self.connection_string) as conn:
+                async with conn.cursor() as cursor:
+                    await self._aensure_summary_table(cursor)
+                    await cursor.execute(self._insert_sql(), (self.session_id, payload, *self._window_params()))
+                    row = await cursor.fetchone()
+
+            logger.info(f"📝 {len(messages)} mensagem(ns) persistida(s) no DB para {self.session_id}")
+            if self._cache:
+                await self._cache.aappend(self.session_id, dicts)
+            return int(row[0]) if row else None
+
+        except Exception as e:
+            logger.error(f"❌ Erro CRÍTICO ao salvar mensagem no Postgres: {e}")
+            if self._cache:
+                await self._cache.ainvalidate(self.session_id)
+            if self._postgres_history:
+                await self._postgres_history.aadd_messages(messages)
+            return None
+
+    async def aget_messages(self) -> List[BaseMessage]:
+        """Contexto otimizado: resumo (se houver) + mensagens depois da marca d'água."""
+        try:
+            summary, recent = await self._aload_context()
+            messages = [SystemMessage(content=summary)] if summary else []
+            messages.extend(recent)
+            return messages
+        except Exception as e:
+            logger.error(f"Erro ao ler mensagens manualmente: {e}")
+            return []
+
+    async def aget_summary(self) -> Optional[str]:
+        try:
+            summary, _ = await self._aload_context()
+            return summary
+        except Exception as e:
+            logger.error(f"Erro ao ler resumo: {e}")
+            return None
+
+    async def aget_message_count(self) -> int:
+        try:
+            async with async_connection(self.connection_string) as conn:
+                async with conn.cursor() as cursor:
+                    await self._aensure_summary_table(cursor)
+                    await cursor.execute(self._count_sql(), self._window_params())
+                    result = await cursor.fetchone()
+                    return result[0] if result else 0
+        except Exception:
+            return 0
+
+    async def aclear(self) -> None:
+        try:
+            async with async_connection(self.connection_string) as conn:
+                async with conn.cursor() as cursor:
+                    await self._aensure_summary_table(cursor)
+                    await cursor.execute(f"DELETE FROM {self.table_name} WHERE session_id = %s", (self.session_id,))
+                    await cursor.execute(f"DELETE FROM {self.summary_table_name} WHERE session_id = %s", (self.session_id,))
+        except Exception as e:
+            logger.error(f"Erro ao limpar histórico: {e}")
+        finally:
+            if self._cache:
+                await self._cache.ainvalidate(self.session_id)
+
+    async def amanage_rolling_summary(self, llm: BaseChatModel, group_size: int = 6) -> None:
+        """Resumo deslizante async (mesma regra de `manage_rolling_summary`, com `llm.ainvoke`)."""
+        try:
+            async with async_connection(self.connection_string) as conn:
+                async with conn.cursor() as cursor:
+                    existing_summary, rows = await self._aload_window(cursor)
+        except Exception as e:
+            logger.error(f"Erro ao ler sessão para resumo: {e}")
+            return
+
+        plan = self._plan_summary(existing_summary, rows, group_size)
+        if plan is None:
+            return
+        prompt, watermark, compacted = plan
+
+        try:
+            new_summary_text = (await llm.ainvoke(prompt)).content
+            final_summary = f"{SUMMARY_PREFIX}{new_summary_text}"
+
+            async with async_connection(self.connection_string) as conn:
+                async with conn.cursor() as cursor:
+                    await cursor.execute(self._upsert_summary_sql(), self._upsert_params(final_summary, watermark))
+
+            if self._cache:
+                await self._cache.ainvalidate(self.session_id)
+
+            logger.info(f"🔄 Resumo atualizado! {compacted} msgs antigas foram compactadas.")
+
+        except Exception as e:
+            logger.error(f"Erro ao atualizar resumo: {e}")
@@ -0,0 +1,306 @@
+"""
+Checkpointer do grafo (estado das conversas no LangGraph)
+
+Camada plugável escolhida por `CHECKPOINTER_BACKEND`:
+- memory (padrão): `BoundedMemorySaver`, em memória com LRU, TTL e
+  orçamento de bytes; mantém só os checkpoints mais recentes de cada thread.
+- postgres / redis: persistência via langgraph-checkpoint-postgres /
+  langgraph-checkpoint-redis (dependências opcionais).
+
+O caminho asyncio (AGENT_ASYNC) usa `abuild_checkpointer`: as versões
+async dos savers (AsyncPostgresSaver num AsyncConnectionPool próprio,
+AsyncRedisSaver), criadas no event loop que roda o agente. O saver
+síncrono bloquearia o loop (ou nem implementa aget_tuple/aput).
+
+Threads despejadas da memória não perdem o contexto: o agente reidrata a
+conversa a partir do histórico no Postgres (resumo + mensagens recentes).
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from langgraph.checkpoint.base import BaseCheckpointSaver
+from langgraph.checkpoint.memory import InMemorySaver
+
+from config.settings import settings
+from config.logger import setup_logger
+from config.metrics import metrics
+
+logger = setup_logger(__name__)
+
+
+class BoundedMemorySaver(InMemorySaver):
+    """
+    InMemorySaver com limites.
+
+    - `keep_checkpoints`: checkpoints mantidos por thread (o MemorySaver
+      padrão guarda todos os passos de todas as conversas).
+    - `max_bytes`: orçamento total; acima dele as threads menos usadas
+      recentemente são despejadas.
+    - `ttl_seconds`: threads sem acesso há mais tempo que isso são despejadas.
+    """
+
+    def __init__(self, max_bytes: int = 256 * 1024 * 1024, ttl_seconds: float = 6 * 3600, keep_checkpoints: int = 2):
+        super().__init__()
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.keep_checkpoints = max(1, keep_checkpoints)
+
+        self._lock = threading.RLock()
+        self._lru: "OrderedDict[str, float]" = OrderedDict()  # thread -> último acesso
+        self._sizes: Dict[str, int] = {}
+        self._total_bytes = 0
+        self._blob_keys: Dict[str, Set[Tuple[str, str, str, Any]]] = {}
+        self._write_keys: Dict[str, Set[Tuple[str, str, str]]] = {}
+
+    # ----------------------------------------
+    # Overrides
+    # ----------------------------------------
+
+    def get_tuple(self, config):
+        thread_id = config["configurable"]["thread_id"]
+        with self._lock:
+            self._expire()
+            result = super().get_tuple(config)
+            if result is not None:
+                self._touch(thread_id)
+            return result
+
+    def list(self, config, *, filter=None, before=None, limit=None):
+        with self._lock:
+            items = list(super().list(config, filter=filter, before=before, limit=limit))
+        yield from items
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"]["checkpoint_ns"]
+        with self._lock:
+            result = super().put(config, checkpoint, metadata, new_versions)
+            keys = self._blob_keys.setdefault(thread_id, set())
+            for channel, version in new_versions.items():
+                keys.add((thread_id, checkpoint_ns, channel, version))
+            self._prune(thread_id, checkpoint_ns)
+            self._after_write(thread_id)
+            return result
+
+    def put_writes(self, config, writes, task_id, task_path=""):
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+        with self._lock:
+            super().put_writes(config, writes, task_id, task_path)
+            self._write_keys.setdefault(thread_id, set()).add((thread_id, checkpoint_ns, checkpoint_id))
+            self._after_write(thread_id)
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self._lock:
+            self._drop(thread_id)
+
+    # ----------------------------------------
+    # Métricas
+    # ----------------------------------------
+
+    @property
+    def total_bytes(self) -> int:
+        return self._total_bytes
+
+    def thread_sizes(self, top: Optional[int] = None) -> Dict[str, int]:
+        """Bytes por thread (as maiores primeiro)."""
+        with self._lock:
+            ordered = sorted(self._sizes.items(), key=lambda kv: kv[1], reverse=True)
+        return dict(ordered[:top] if top else ordered)
+
+    # ----------------------------------------
+    # Internos
+    # ----------------------------------------
+
+    def _touch(self, thread_id: str) -> None:
+        self._lru[thread_id] = time.monotonic()
+        self._lru.move_to_end(thread_id)
+
+    def _after_write(self, thread_id: str) -> None:
+        self._touch(thread_id)
+        self._recount(thread_id)
+        self._expire()
+        self._evict(keep=thread_id)
+        metrics.set_gauge("checkpointer.bytes", self._total_bytes)
+        metrics.set_gauge("checkpointer.threads", len(self._lru))
+
+    def _prune(self, thread_id: str, checkpoint_ns: str) -> None:
+        """Remove checkpoints antigos da thread, com writes e blobs órfãos."""
+        checkpoints = self.storage[thread_id][checkpoint_ns]
+        if len(checkpoints) <= self.keep_checkpoints:
+            return
+        # IDs de checkpoint são ordenáveis no tempo (uuid6)
+        ordered = sorted(checkpoints)
+        for checkpoint_id in ordered[:-self.keep_checkpoints]:
+            del checkpoints[checkpoint_id]
+            key = (thread_id, checkpoint_ns, checkpoint_id)
+            self.writes.pop(key, None)
+            self._write_keys.get(thread_id, set()).discard(key)
+
+        # Blobs ainda referenciados pelos checkpoints mantidos
+        live = set()
+        for saved in checkpoints.values():
+            versions = self.serde.loads_typed(saved[0]).get("channel_versions", {})
+            live.update((thread_id, checkpoint_ns, ch, v) for ch, v in versions.items())
+        keys = self._blob_keys.get(thread_id, set())
+        for key in [k for k in keys if k[1] == checkpoint_ns and k not in live]:
+            self.blobs.pop(key, None)
+            keys.discard(key)
+
+    def _recount(self, thread_id: str) -> None:
+        size = 0
+        for ns in self.storage.get(thread_id, {}).values():
+            for checkpoint, meta, _ in ns.values():
+                size += len(checkpoint[1]) + len(meta[1])
+        for key in self._blob_keys.get(thread_id, ()):
+            blob = self.blobs.get(key)
+            if blob:
+                size += len(blob[1])
+        for key in self._write_keys.get(thread_id, ()):
+            for write in self.writes.get(key, {}).values():
+                size += len(write[2][1])
+        self._total_bytes += size - self._sizes.get(thread_id, 0)
+        self._sizes[thread_id] = size
+        metrics.observe("checkpointer.thread_bytes", size)
+
+    def _drop(self, thread_id: str) -> None:
+        self.storage.pop(thread_id, None)
+        for key in self._write_keys.pop(thread_id, set()):
+            self.writes.pop(key, None)
+        for key in self._blob_keys.pop(thread_id, set()):
+            self.blobs.pop(key, None)
+        self._total_bytes -= self._sizes.pop(thread_id, 0)
+        self._lru.pop(thread_id, None)
+
+    def _expire(self) -> None:
+        if not self.ttl_seconds:
+            return
+        limit = time.monotonic() - self.ttl_seconds
+        while self._lru:
+            thread_id, last = next(iter(self._lru.items()))
+            if last > limit:
+                break
+            self._drop(thread_id)
+            metrics.incr("checkpointer.evicted.ttl")
+
+    def _evict(self, keep: Optional[str] = None) -> None:
+        while self._total_bytes > self.max_bytes and len(self._lru) > 1:
+            thread_id = next(iter(self._lru))
+            if thread_id == keep:
+                self._lru.move_to_end(thread_id)
+                thread_id = next(iter(self._lru))
+            self._drop(thread_id)
+            metrics.incr("checkpointer.evicted.lru")
+            logger.info(f"🧹 Thread {thread_id} despejada do checkpointer (orçamento de memória)")
+
+
+# Pool do AsyncPostgresSaver (fechado em `aclose_checkpointer`)
+_async_saver_pool = None
+
+
+def _redis_url() -> str:
+    auth = f":{settings.redis_password}@" if settings.redis_password else ""
+    return f"redis://{auth}{settings.redis_host}:{settings.redis_port}/{settings.redis_db}"
+
+
+def _memory_saver() -> BoundedMemorySaver:
+    return BoundedMemorySaver(
+        max_bytes=settings.checkpointer_max_mb * 1024 * 1024,
+        ttl_seconds=settings.checkpointer_ttl_seconds,
+        keep_checkpoints=settings.checkpointer_keep_checkpoints,
+    )
+
+
+def build_checkpointer() -> BaseCheckpointSaver:
+    """Cria o checkpointer configurado em CHECKPOINTER_BACKEND (fallback: memória limitada)."""
+    backend = (settings.checkpointer_backend or "memory").lower()
+
+    if backend == "postgres":
+        try:
+            from langgraph.checkpoint.postgres import PostgresSaver
+            from psycopg.rows import dict_row
+            from psycopg_pool import ConnectionPool
+
+            pool = ConnectionPool(
+                settings.postgres_connection_string,
+                max_size=settings.checkpointer_pool_size,
+                kwargs={"autocommit": True, "prepare_threshold": 0, "row_factory": dict_row},
+            )
+            saver = PostgresSaver(pool)
+            saver.setup()
+            logger.info("💾 Checkpointer: Postgres")
+            return saver
+        except ImportError:
+            logger.warning("langgraph-checkpoint-postgres não instalado; usando checkpointer em memória")
+        except Exception as e:
+            logger.error(f"Erro ao iniciar checkpointer Postgres: {e}; usando checkpointer em memória")
+
+    elif backend == "redis":
+        try:
+            from langgraph.checkpoint.redis import RedisSaver
+
+            saver = RedisSaver(redis_url=_redis_url())
+            saver.setup()
+            logger.info("💾 Checkpointer: Redis")
+            return saver
+        except ImportError:
+            logger.warning("langgraph-checkpoint-redis não instalado; usando checkpointer em memória")
+        except Exception as e:
+            logger.error(f"Erro ao iniciar checkpointer Redis: {e}; usando checkpointer em memória")
+
+    return _memory_saver()
+
+
+async def abuild_checkpointer() -> BaseCheckpointSaver:
+    """Versão async de `build_checkpointer` (chamar no event loop do agente)."""
+    global _async_saver_pool
+    backend = (settings.checkpointer_backend or "memory").lower()
+
+    if backend == "postgres":
+        try:
+            from langgraph.checkpoint.postgres.aio import AsyncPostgresSaver
+            from psycopg.rows import dict_row
+            from psycopg_pool import AsyncConnectionPool
+
+            pool = AsyncConnectionPool(
+                settings.postgres_connection_string,
+                max_size=settings.checkpointer_pool_size,
+                kwargs={"autocommit": True, "prepare_threshold": 0, "row_factory": dict_row},
+                open=False,
+            )
+            await pool.open()
+            saver = AsyncPostgresSaver(pool)
+            await saver.setup()
+            _async_saver_pool = pool
+            logger.info("💾 Checkpointer: Postgres (async)")
+            return saver
+        except ImportError:
+            logger.warning("langgraph-checkpoint-postgres não instalado; usando checkpointer em memória")
+        except Exception as e:
+            logger.error(f"Erro ao iniciar checkpointer Postgres: {e}; usando checkpointer em memória")
+
+    elif backend == "redis":
+        try:
+            from langgraph.checkpoint.redis.aio import AsyncRedisSaver
+
+            saver = AsyncRedisSaver(redis_url=_redis_url())
+            await saver.asetup()
+            logger.info("💾 Checkpointer: Redis (async)")
+            return saver
+        except ImportError:
+            logger.warning("langgraph-checkpoint-redis não instalado; usando checkpointer em memória")
+        except Exception as e:
+            logger.error(f"Erro ao iniciar checkpointer Redis: {e}; usando checkpointer em memória")
+
+    return _memory_saver()
+
+
+async def aclose_checkpointer() -> None:
+    """Fecha o pool do AsyncPostgresSaver (shutdown)."""
+    global _async_saver_pool
+    if _async_saver_pool is not None:
+        await _async_saver_pool.close()
+        _async_saver_pool = None
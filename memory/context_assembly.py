@@ -0,0 +1,131 @@
+"""
+Montagem do contexto de cada chamada ao modelo
+
+O checkpointer guarda a thread inteira; a cada chamada ao LLM o prompt é
+montado a partir de:
+- prompt de sistema
+- resumo deslizante da conversa (RESUMO DO CONTEXTO)
+- as mensagens mais recentes que couberem no orçamento de tokens
+Resultados de ferramentas de turnos anteriores viram um stub curto
+(o modelo já respondeu com base neles).
+
+Cada montagem registra os tokens antes e depois do corte (histogramas
+context.tokens_before / context.tokens_after, context.tokens_trimmed) e
+`context_stats()` resume os totais para a seção "context" do /metrics.
+"""
+import threading
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage, ToolMessage
+from langchain_core.messages.utils import trim_messages
+
+try:
+    from langchain_core.messages.utils import count_tokens_approximately
+except ImportError:
+    def count_tokens_approximately(messages: Sequence[BaseMessage], **kwargs) -> int:
+        return sum(len(str(m.content)) // 4 + 3 for m in messages)
+
+from config.metrics import metrics
+
+STALE_TOOL_STUB = "[resultado de ferramenta de turno anterior omitido]"
+
+# Totais do processo para `context_stats`
+_totals_lock = threading.Lock()
+_totals: Dict[str, float] = {"calls": 0, "trimmed_calls": 0, "tokens_before": 0, "tokens_after": 0}
+
+
+def _record(stats: Dict[str, float]) -> None:
+    trimmed = max(0, stats["tokens_before"] - stats["tokens_after"])
+    metrics.observe("context.tokens_before", stats["tokens_before"])
+    metrics.observe("context.tokens_after", stats["tokens_after"])
+    metrics.observe("context.tokens_trimmed", trimmed)
+    metrics.observe("context.messages_before", stats["messages_before"])
+    metrics.observe("context.messages_after", stats["messages_after"])
+    metrics.observe("context.assembly_seconds", stats["seconds"])
+    with _totals_lock:
+        _totals["calls"] += 1
+        _totals["trimmed_calls"] += int(trimmed > 0)
+        _totals["tokens_before"] += stats["tokens_before"]
+        _totals["tokens_after"] += stats["tokens_after"]
+
+
+def context_stats() -> Dict[str, float]:
+    """Tokens do prompt antes/depois do corte, somados e por chamada, e a redução."""
+    with _totals_lock:
+        totals = dict(_totals)
+    calls = totals["calls"] or 1
+    return {
+        "calls": totals["calls"],
+        "trimmed_calls": totals["trimmed_calls"],
+        "tokens_before_total": totals["tokens_before"],
+        "tokens_after_total": totals["tokens_after"],
+        "tokens_before_avg": round(totals["tokens_before"] / calls, 1),
+        "tokens_after_avg": round(totals["tokens_after"] / calls, 1),
+        "reduction": round(1 - totals["tokens_after"] / totals["tokens_before"], 3) if totals["tokens_before"] else 0.0,
+    }
+
+
+def _last_human_index(messages: Sequence[BaseMessage]) -> int:
+    for i in range(len(messages) - 1, -1, -1):
+        if isinstance(messages[i], HumanMessage):
+            return i
+    return 0
+
+
+def stub_stale_tool_outputs(messages: Sequence[BaseMessage], max_chars: int = 300) -> List[BaseMessage]:
+    """Troca por um stub os ToolMessages longos anteriores ao turno atual."""
+    current = _last_human_index(messages)
+    result: List[BaseMessage] = []
+    for i, msg in enumerate(messages):
+        if i < current and isinstance(msg, ToolMessage) and len(str(msg.content)) > max_chars:
+            msg = msg.model_copy(update={"content": STALE_TOOL_STUB})
+        result.append(msg)
+    return result
+
+
+def assemble_context(
+    system_prompt: str,
+    messages: Sequence[BaseMessage],
+    summary: Optional[str] = None,
+    token_budget: int = 6000,
+    stub_tool_chars: int = 300,
+) -> Tuple[List[BaseMessage], Dict[str, float]]:
+    """
+    Monta a entrada do modelo dentro do orçamento de tokens.
+    O orçamento vale para a conversa (resumo + mensagens); o prompt de
+    sistema é fixo e fica fora dele.
+    Retorna (mensagens, estatísticas) e registra as métricas de contexto.
+    """
+    started = time.perf_counter()
+    head: List[BaseMessage] = [SystemMessage(content=system_prompt)]
+    summary_msgs: List[BaseMessage] = [SystemMessage(content=summary)] if summary else []
+    head += summary_msgs
+
+    tokens_before = count_tokens_approximately(head + list(messages))
+
+    history = stub_stale_tool_outputs(messages, stub_tool_chars)
+    budget = max(0, token_budget - count_tokens_approximately(summary_msgs))
+    recent = trim_messages(
+        history,
+        max_tokens=budget,
+        strategy="last",
+        token_counter=count_tokens_approximately,
+        start_on="human",
+        allow_partial=False,
+    )
+    # O turno atual (pergunta + chamadas de ferramenta em andamento) vai sempre inteiro
+    current = history[_last_human_index(history):]
+    if len(recent) < len(current):
+        recent = current
+
+    assembled = head + list(recent)
+    stats = {
+        "tokens_before": tokens_before,
+        "tokens_after": count_tokens_approximately(assembled),
+        "messages_before": len(messages),
+        "messages_after": len(recent),
+        "seconds": time.perf_counter() - started,
+    }
+    _record(stats)
+    return assembled, stats
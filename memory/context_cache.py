@@ -0,0 +1,268 @@
+"""
+Cache Redis da janela recente de cada sessão (write-through)
+
+O Postgres continua sendo a fonte da verdade; o Redis guarda, por
+`session_id`, as últimas mensagens ainda não resumidas (lista limitada,
+JSON de `message_to_dict`) e o resumo deslizante. Conversas quentes são
+lidas sem tocar no banco:
+
+- leitura: hit → resumo + mensagens do Redis; miss → o chamador lê o banco
+  e preenche o cache (`fill`)
+- escrita: `append` acrescenta ao cache só se ele já existe (sessão quente)
+- compactação: `invalidate` (a própria compactação lê direto do banco)
+
+Toda escrita (`append`, `invalidate`) incrementa a versão da sessão
+(`ctx:{sessão}:ver`). `get` devolve a versão lida junto com o cache e
+`fill` só grava se ela não mudou: uma leitura do banco que ficou velha
+durante uma escrita concorrente não sobrescreve o cache por 6h.
+
+Cada operação tem a versão async (`aget`, `afill`, `aappend`,
+`ainvalidate`) sobre redis.asyncio, usada pelo histórico async no event loop.
+
+Métricas: context_cache.hit/miss, context_cache.hit_ratio,
+context_cache.read_seconds e context_cache.stale_fill.
+"""
+import json
+import time
+from typing import List, Optional, Sequence, Tuple
+
+import redis
+
+from config.logger import setup_logger
+from config.metrics import metrics
+from config.settings import settings
+from tools.redis_tools import get_async_redis_client, get_redis_client
+
+logger = setup_logger(__name__)
+
+# (resumo, mensagens serializadas) da sessão em cache
+CachedContext = Tuple[Optional[str], List[dict]]
+
+# Acrescenta só se a sessão já está em cache (a chave do resumo marca "presente");
+# a versão sobe sempre, para invalidar leituras do banco em andamento
+_APPEND_SCRIPT = """
+redis.call('INCR', KEYS[3])
+redis.call('EXPIRE', KEYS[3], ARGV[2])
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return 0
+end
+for i = 3, #ARGV do
+    redis.call('RPUSH', KEYS[2], ARGV[i])
+end
+redis.call('LTRIM', KEYS[2], -tonumber(ARGV[1]), -1)
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+redis.call('EXPIRE', KEYS[2], ARGV[2])
+return 1
+"""
+
+# Preenche a sessão somente se a versão ainda é a lida antes da consulta ao banco
+_FILL_SCRIPT = """
+if (redis.call('GET', KEYS[3]) or '') ~= ARGV[1] then
+    return 0
+end
+redis.call('DEL', KEYS[2])
+for i = 4, #ARGV do
+    redis.call('RPUSH', KEYS[2], ARGV[i])
+end
+if #ARGV >= 4 then
+    redis.call('EXPIRE', KEYS[2], ARGV[2])
+end
+redis.call('SET', KEYS[1], ARGV[3], 'EX', ARGV[2])
+return 1
+"""
+
+
+def summary_key(session_id: str) -> str:
+    """Resumo em cache ("" = sessão sem resumo); a existência marca a sessão como carregada."""
+    return f"ctx:{session_id}:sum"
+
+
+def window_key(session_id: str) -> str:
+    """Lista das mensagens recentes (JSON de message_to_dict), mais antiga primeiro."""
+    return f"ctx:{session_id}:msgs"
+
+
+def version_key(session_id: str) -> str:
+    """Contador de escritas da sessão (guarda do `fill`)."""
+    return f"ctx:{session_id}:ver"
+
+
+class SessionContextCache:
+    """Janela recente por sessão no Redis (limitada a `max_messages`, com TTL)."""
+
+    def __init__(self, max_messages: int = 30, ttl_seconds: int = 6 * 3600):
+        self.max_messages = max(1, max_messages)
+        self.ttl_seconds = ttl_seconds
+        self._append_script = None
+        self._fill_script = None
+        self._hits = 0
+        self._lookups = 0
+
+    def _client(self) -> Optional[redis.Redis]:
+        client = get_redis_client()
+        if client is not None and self._append_script is None:
+            self._append_script = client.register_script(_APPEND_SCRIPT)
+            self._fill_script = client.register_script(_FILL_SCRIPT)
+        return client
+
+    def _record(self, hit: bool, started: float) -> None:
+        self._lookups += 1
+        self._hits += int(hit)
+        metrics.incr("context_cache.hit" if hit else "context_cache.miss")
+        metrics.observe("context_cache.read_seconds", time.monotonic() - started)
+        metrics.set_gauge("context_cache.hit_ratio", round(self._hits / self._lookups, 3))
+
+    def _result(self, summary: Optional[str], raw: List[str], version: Optional[str], started: float) -> Tuple[Optional[CachedContext], str]:
+        if summary is None:
+            self._record(False, started)
+            return None, version or ""
+        self._record(True, started)
+        return ((summary or None), [json.loads(item) for item in raw]), version or ""
+
+    def _keys(self, session_id: str) -> List[str]:
+        return [summary_key(session_id), window_key(session_id), version_key(session_id)]
+
+    def _fill_args(self, version: str, summary: Optional[str], messages: Sequence[dict]) -> list:
+        recent = [json.dumps(m) for m in list(messages)[-self.max_messages:]]
+        return [version, self.ttl_seconds, summary or ""] + recent
+
+    def _filled(self, session_id: str, ok: int) -> None:
+        if not ok:
+            # Houve escrita entre a leitura do banco e o preenchimento: a próxima leitura recarrega
+            metrics.incr("context_cache.stale_fill")
+            logger.info(f"Cache de contexto de {session_id} não preenchido (versão mudou)")
+
+    def get(self, session_id: str) -> Tuple[Optional[CachedContext], Optional[str]]:
+        """
+        ((resumo, mensagens serializadas) ou None em miss, versão da sessão).
+        Em miss, passe a versão para `fill` depois de ler o banco.
+        """
+        client = self._client()
+        if client is None:
+            return None, None
+        started = time.monotonic()
+        try:
+            pipe = client.pipeline(transaction=False)
+            pipe.get(summary_key(session_id))
+            pipe.lrange(window_key(session_id), 0, -1)
+            pipe.get(version_key(session_id))
+            summary, raw, version = pipe.execute()
+        except redis.exceptions.RedisError as e:
+            logger.error(f"Erro ao ler contexto em cache: {e}")
+            return None, None
+        return self._result(summary, raw, version, started)
+
+    def fill(self, session_id: str, summary: Optional[str], messages: Sequence[dict], version: Optional[str]) -> None:
+        """Carrega a sessão lida do banco, se nenhuma escrita aconteceu desde `get` (versão igual)."""
+        client = self._client()
+        if client is None or version is None:
+            return
+        try:
+            ok = self._fill_script(keys=self._keys(session_id), args=self._fill_args(version, summary, messages))
+            self._filled(session_id, ok)
+        except redis.exceptions.RedisError as e:
+            logger.error(f"Erro ao preencher contexto em cache: {e}")
+
+    def append(self, session_id: str, messages: Sequence[dict]) -> None:
+        """Write-through: acrescenta as mensagens já gravadas no banco (só em sessão quente)."""
+        client = self._client()
+        if client is None or not messages:
+            return
+        try:
+            self._append_script(
+                keys=self._keys(session_id),
+                args=[self.max_messages, self.ttl_seconds] + [json.dumps(m) for m in messages],
+            )
+        except redis.exceptions.RedisError as e:
+            # Cache possivelmente desatualizado: melhor descartar
+            logger.error(f"Erro ao atualizar contexto em cache: {e}")
+            self.invalidate(session_id)
+
+    def invalidate(self, session_id: str) -> None:
+        client = self._client()
+        if client is None:
+            return
+        try:
+            pipe = client.pipeline(transaction=True)
+            pipe.delete(summary_key(session_id), window_key(session_id))
+            pipe.incr(version_key(session_id))
+            pipe.expire(version_key(session_id), self.ttl_seconds)
+            pipe.execute()
+            metrics.incr("context_cache.invalidated")
+        except redis.exceptions.RedisError as e:
+            logger.error(f"Erro ao invalidar contexto em cache: {e}")
+
+    # ----------------------------------------
+    # Versões async (redis.asyncio)
+    # ----------------------------------------
+
+    async def aget(self, session_id: str) -> Tuple[Optional[CachedContext], Optional[str]]:
+        client = await get_async_redis_client()
+        if client is None:
+            return None, None
+        started = time.monotonic()
+        try:
+            pipe = client.pipeline(transaction=False)
+            pipe.get(summary_key(session_id))
+            pipe.lrange(window_key(session_id), 0, -1)
+            pipe.get(version_key(session_id))
+            summary, raw, version = await pipe.execute()
+        except redis.exceptions.RedisError as e:
+            logger.error(f"Erro ao ler contexto em cache: {e}")
+            return None, None
+        return self._result(summary, raw, version, started)
+
+    async def afill(self, session_id: str, summary: Optional[str], messages: Sequence[dict], version: Optional[str]) -> None:
+        client = await get_async_redis_client()
+        if client is None or version is None:
+            return
+        try:
+            ok = await client.register_script(_FILL_SCRIPT)(
+                keys=self._keys(session_id), args=self._fill_args(version, summary, messages),
+            )
+            self._filled(session_id, ok)
+        except redis.exceptions.RedisError as e:
+            logger.error(f"Erro ao preencher contexto em cache: {e}")
+
+    async def aappend(self, session_id: str, messages: Sequence[dict]) -> None:
+        client = await get_async_redis_client()
+        if client is None or not messages:
+            return
+        try:
+            await client.register_script(_APPEND_SCRIPT)(
+                keys=self._keys(session_id),
+                args=[self.max_messages, self.ttl_seconds] + [json.dumps(m) for m in messages],
+            )
+        except redis.exceptions.RedisError as e:
+            logger.error(f"Erro ao atualizar contexto em cache: {e}")
+            await self.ainvalidate(session_id)
+
+    async def ainvalidate(self, session_id: str) -> None:
+        client = await get_async_redis_client()
+        if client is None:
+            return
+        try:
+            pipe = client.pipeline(transaction=True)
+            pipe.delete(summary_key(session_id), window_key(session_id))
+            pipe.incr(version_key(session_id))
+            pipe.expire(version_key(session_id), self.ttl_seconds)
+            await pipe.execute()
+            metrics.incr("context_cache.invalidated")
+        except redis.exceptions.RedisError as e:
+            logger.error(f"Erro ao invalidar contexto em cache: {e}")
+
+
+_context_cache: Optional[SessionContextCache] = None
+
+
+def get_context_cache() -> Optional[SessionContextCache]:
+    """Cache compartilhado (None se CONTEXT_CACHE_ENABLED=false)."""
+    global _context_cache
+    if not settings.context_cache_enabled:
+        return None
+    if _context_cache is None:
+        _context_cache = SessionContextCache(
+            max_messages=settings.context_cache_max_messages,
+            ttl_seconds=settings.context_cache_ttl_seconds,
+        )
+    return _context_cache
@@ -0,0 +1,188 @@
+"""
+Pool de conexões Postgres compartilhado (psycopg 3 + psycopg_pool).
+
+Toda leitura/escrita de memória e das tools passa por `connection()`, em vez
+de abrir um `connect()` (TCP + auth) a cada chamada. O pool é limitado
+(POSTGRES_POOL_MAX_SIZE), valida a conexão ao emprestá-la e publica tempo de
+espera e utilização em `config.metrics` (db_pool.*).
+"""
+import asyncio
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import AsyncIterator, Dict, Iterator, Optional
+
+import psycopg
+
+from config.logger import setup_logger
+from config.metrics import metrics
+from config.settings import settings
+
+try:
+    from psycopg_pool import AsyncConnectionPool, ConnectionPool, PoolTimeout
+except ImportError:  # pragma: no cover - dependência opcional
+    AsyncConnectionPool = None
+    ConnectionPool = None
+    PoolTimeout = None
+
+logger = setup_logger(__name__)
+
+_pools: Dict[str, "ConnectionPool"] = {}
+_lock = threading.Lock()
+# Pools async são presos ao event loop que os abriu: (conninfo, id do loop) -> pool
+_async_pools: Dict[tuple, "AsyncConnectionPool"] = {}
+_warned_no_pool = False
+
+
+def get_pool(conninfo: Optional[str] = None) -> Optional["ConnectionPool"]:
+    """Retorna (criando na primeira chamada) o pool da string de conexão."""
+    conninfo = conninfo or settings.postgres_connection_string
+    pool = _pools.get(conninfo)
+    if pool is not None or ConnectionPool is None:
+        return pool
+
+    with _lock:
+        pool = _pools.get(conninfo)
+        if pool is None:
+            pool = ConnectionPool(
+                conninfo,
+                min_size=settings.postgres_pool_min_size,
+                max_size=settings.postgres_pool_max_size,
+                timeout=settings.postgres_pool_timeout,
+                max_idle=settings.postgres_pool_max_idle,
+                check=ConnectionPool.check_connection,
+                name="memoria",
+                open=True,
+            )
+            _pools[conninfo] = pool
+            logger.info(
+                f"🐘 Pool Postgres aberto (min={settings.postgres_pool_min_size}, "
+                f"max={settings.postgres_pool_max_size})"
+            )
+    return pool
+
+
+@contextmanager
+def connection(conninfo: Optional[str] = None) -> Iterator["psycopg.Connection"]:
+    """
+    Empresta uma conexão do pool.
+
+    Commit ao sair sem erro, rollback em exceção; a conexão volta ao pool.
+    Sem psycopg_pool instalado, cai para uma conexão avulsa por chamada.
+    """
+    global _warned_no_pool
+    pool = get_pool(conninfo)
+
+    if pool is None:
+        if not _warned_no_pool:
+            logger.warning("psycopg_pool não instalado; usando uma conexão por chamada")
+            _warned_no_pool = True
+        with psycopg.connect(conninfo or settings.postgres_connection_string) as conn:
+            yield conn
+        return
+
+    started = time.monotonic()
+    try:
+        with pool.connection() as conn:
+            metrics.observe("db_pool.wait_seconds", time.monotonic() - started)
+            _record_utilization(pool)
+            yield conn
+    except PoolTimeout:
+        metrics.incr("db_pool.timeouts")
+        logger.error(f"⏳ Pool Postgres esgotado ({settings.postgres_pool_timeout}s sem conexão livre)")
+        raise
+    finally:
+        _record_utilization(pool)
+
+
+async def get_async_pool(conninfo: Optional[str] = None) -> Optional["AsyncConnectionPool"]:
+    """Pool async do event loop atual (criado e aberto na primeira chamada)."""
+    if AsyncConnectionPool is None:
+        return None
+    conninfo = conninfo or settings.postgres_connection_string
+    key = (conninfo, id(asyncio.get_running_loop()))
+    pool = _async_pools.get(key)
+    if pool is None:
+        pool = AsyncConnectionPool(
+            conninfo,
+            min_size=settings.postgres_pool_min_size,
+            max_size=settings.postgres_pool_max_size,
+            timeout=settings.postgres_pool_timeout,
+            max_idle=settings.postgres_pool_max_idle,
+            check=AsyncConnectionPool.check_connection,
+            name="memoria-async",
+            open=False,
+        )
+        await pool.open()
+        existing = _async_pools.setdefault(key, pool)
+        if existing is not pool:
+            # Outra corrotina abriu o pool primeiro: descarta este
+            await pool.close()
+            pool = existing
+        else:
+            logger.info(f"🐘 Pool Postgres async aberto (max={settings.postgres_pool_max_size})")
+    return pool
+
+
+@asynccontextmanager
+async def async_connection(conninfo: Optional[str] = None) -> AsyncIterator["psycopg.AsyncConnection"]:
+    """Versão async de `connection()`: mesmo contrato, sem bloquear o event loop."""
+    pool = await get_async_pool(conninfo)
+
+    if pool is None:
+        async with await psycopg.AsyncConnection.connect(conninfo or settings.postgres_connection_string) as conn:
+            yield conn
+        return
+
+    started = time.monotonic()
+    try:
+        async with pool.connection() as conn:
+            metrics.observe("db_pool.async.wait_seconds", time.monotonic() - started)
+            _record_utilization(pool, prefix="db_pool.async")
+            yield conn
+    except PoolTimeout:
+        metrics.incr("db_pool.async.timeouts")
+        logger.error(f"⏳ Pool Postgres async esgotado ({settings.postgres_pool_timeout}s sem conexão livre)")
+        raise
+    finally:
+        _record_utilization(pool, prefix="db_pool.async")
+
+
+def _record_utilization(pool, prefix: str = "db_pool") -> None:
+    stats = pool.get_stats()
+    size = stats.get("pool_size", 0)
+    in_use = size - stats.get("pool_available", 0)
+    metrics.set_gauge(f"{prefix}.size", size)
+    metrics.set_gauge(f"{prefix}.in_use", in_use)
+    metrics.set_gauge(f"{prefix}.waiting", stats.get("requests_waiting", 0))
+    metrics.set_gauge(f"{prefix}.utilization", round(in_use / max(pool.max_size, 1), 3))
+
+
+def pool_stats() -> Dict[str, Dict[str, int]]:
+    """Estatísticas brutas de cada pool aberto (para GET /metrics)."""
+    stats = {pool.name: pool.get_stats() for pool in _pools.values()}
+    for pool in _async_pools.values():
+        stats[pool.name] = pool.get_stats()
+    return stats
+
+
+def close_pools() -> None:
+    """Fecha todos os pools (shutdown do processo)."""
+    with _lock:
+        for pool in _pools.values():
+            try:
+                pool.close()
+            except Exception as e:
+                logger.error(f"Erro ao fechar pool Postgres: {e}")
+        _pools.clear()
+
+
+async def close_async_pools() -> None:
+    """Fecha os pools async abertos no event loop atual."""
+    loop_id = id(asyncio.get_running_loop())
+    for key in [k for k in _async_pools if k[1] == loop_id]:
+        pool = _async_pools.pop(key)
+        try:
+            await pool.close()
+        except Exception as e:
+            logger.error(f"Erro ao fechar pool Postgres async: {e}")
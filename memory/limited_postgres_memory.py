@@ -1,25 +1,46 @@
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Sequence, Tuple
 import json
 import logging
 from langchain_community.chat_message_histories import PostgresChatMessageHistory
 from langchain_core.messages import BaseMessage, message_to_dict, messages_from_dict, SystemMessage
 from langchain_core.chat_history import BaseChatMessageHistory
 from langchain_core.language_models import BaseChatModel
+from psycopg.types.json import Jsonb
 
-try:
-    import psycopg2
-    import psycopg2.extras
-except ImportError:
-    # Fallback para psycopg 3.x
-    import psycopg as psycopg2
-    from psycopg import sql
+from config.settings import settings
+from memory.db_pool import connection
+from memory.context_cache import get_context_cache
 
 # Configurar logger
 logger = logging.getLogger(__name__)
 
+SUMMARY_PREFIX = "RESUMO DO CONTEXTO: "
+
+# Tabelas de resumo já verificadas neste processo
+_summary_tables_ready = set()
+
+# Folga do limite inferior em created_at: created_at é o início da transação
+# do INSERT, então um id maior pode ter created_at um pouco menor
+_WATERMARK_SLACK = "1 hour"
+
+
 class LimitedPostgresChatMessageHistory(BaseChatMessageHistory):
     """
     Histórico de chat PostgreSQL com suporte a Resumo Deslizante (Rolling Summary).
+
+    O resumo fica numa tabela própria (`{table_name}_resumo`) com uma marca
+    d'água: `summarized_up_to` é o maior `id` de `{table_name}` já incorporado
+    ao resumo. O contexto é "resumo + linhas depois da marca"; a compactação
+    é um único upsert e as linhas do histórico nunca são reescritas.
+
+    `summarized_at` guarda o `created_at` da linha da marca: as leituras do
+    caminho quente também filtram `created_at >=` esse instante (menos uma
+    folga), para o Postgres podar as partições mensais antigas.
+
+    Leituras passam pelo cache Redis da janela recente (`memory.context_cache`):
+    gravações fazem write-through e a compactação invalida a sessão. Banco e
+    cache devolvem a mesma janela: as últimas CONTEXT_CACHE_MAX_MESSAGES
+    mensagens depois da marca (a compactação lê a janela inteira).
     """
     
     def __init__(
@@ -28,23 +49,33 @@ class LimitedPostgresChatMessageHistory(BaseChatMessageHistory):
         connection_string: str,
         table_name: str = "memoria",
         max_messages: int = 20,
+        summary_table_name: Optional[str] = None,
         **kwargs
     ):
         self.session_id = session_id
         self.connection_string = connection_string
         self.table_name = table_name
+        self.summary_table_name = summary_table_name or f"{table_name}_resumo"
         self.max_messages = max_messages
-        
-        try:
-            self._postgres_history = PostgresChatMessageHistory(
-                session_id=session_id,
-                connection_string=connection_string,
-                table_name=table_name,
-                **kwargs
-            )
-        except Exception as e:
-            logger.warning(f"Erro ao iniciar PostgresChatMessageHistory padrão: {e}")
-            self._postgres_history = None
+        self.window_limit = max(1, settings.context_cache_max_messages)
+        self._fallback_kwargs = kwargs
+        self._fallback_history = None
+        self._cache = get_context_cache()
+
+    @property
+    def _postgres_history(self) -> Optional[PostgresChatMessageHistory]:
+        """Histórico padrão do LangChain, criado só quando o fallback é usado (abre conexão própria)."""
+        if self._fallback_history is None:
+            try:
+                self._fallback_history = PostgresChatMessageHistory(
+                    session_id=self.session_id,
+                    connection_string=self.connection_string,
+                    table_name=self.table_name,
+                    **self._fallback_kwargs
+                )
+            except Exception as e:
+                logger.warning(f"Erro ao iniciar PostgresChatMessageHistory padrão: {e}")
+        return self._fallback_history
     
     @property
     def messages(self) -> List[BaseMessage]:
@@ -53,110 +84,275 @@ class LimitedPostgresChatMessageHistory(BaseChatMessageHistory):
     
     def add_message(self, message: BaseMessage) -> None:
         """
-        Adiciona uma mensagem ao banco de dados com SQL manual e COMMIT explícito.
+        Adiciona uma mensagem ao banco de dados com SQL manual (conexão do pool, commit ao sair).
+        """
+        self.add_messages([message])
+
+    def add_messages(self, messages: Sequence[BaseMessage]) -> Optional[int]:
+        """
+        Persiste as mensagens de um turno num único round trip.
+
+        INSERT multi-linha (unnest de jsonb[]) e contagem da sessão no mesmo
+        comando: retorna quantas mensagens ainda não resumidas a sessão tem
+        depois da escrita (None se o banco falhou e o fallback foi usado).
         """
-        conn = None
+        if not messages:
+            return None
         try:
-            msg_dict = message_to_dict(message)
-            msg_json = json.dumps(msg_dict)
-            
-            conn = psycopg2.connect(self.connection_string)
-            cursor = conn.cursor()
+            dicts = [message_to_dict(m) for m in messages]
+            payload = [Jsonb(d) for d in dicts]
             
-            query = f"""
-                INSERT INTO {self.table_name} (session_id, message)
-                VALUES (%s, %s)
-            """
-            
-            cursor.execute(query, (self.session_id, msg_json))
-            conn.commit()
+            with connection(self.connection_string) as conn:
+                with conn.cursor() as cursor:
+                    self._ensure_summary_table(cursor)
+                    cursor.execute(self._insert_sql(), (self.session_id, payload, *self._window_params()))
+                    row = cursor.fetchone()
             
-            logger.info(f"📝 Mensagem persistida manualmente no DB para {self.session_id}")
-            cursor.close()
+            logger.info(f"📝 {len(messages)} mensagem(ns) persistida(s) no DB para {self.session_id}")
+            if self._cache:
+                self._cache.append(self.session_id, dicts)
+            return int(row[0]) if row else None
             
         except Exception as e:
             logger.error(f"❌ Erro CRÍTICO ao salvar mensagem no Postgres: {e}")
-            if conn:
-                conn.rollback()
+            if self._cache:
+                self._cache.invalidate(self.session_id)
             if self._postgres_history:
-                self._postgres_history.add_message(message)
-        finally:
-            if conn:
-                conn.close()
+                self._postgres_history.add_messages(messages)
+            return None
     
+    # --- SQL (compartilhado com a versão async) ---
+
+    def _summary_table_sql(self) -> str:
+        return f"""
+            CREATE TABLE IF NOT EXISTS {self.summary_table_name} (
+                session_id TEXT PRIMARY KEY,
+                summary TEXT NOT NULL,
+                summarized_up_to BIGINT NOT NULL DEFAULT 0,
+                summarized_at TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """
+
+    def _summary_column_sql(self) -> str:
+        """Tabelas de resumo criadas antes de `summarized_at` (migração 004)."""
+        return f"ALTER TABLE {self.summary_table_name} ADD COLUMN IF NOT EXISTS summarized_at TIMESTAMP"
+
+    def _watermark_sql(self) -> str:
+        """Subquery da marca d'água da sessão (0 se ainda não houver resumo)."""
+        return f"COALESCE((SELECT summarized_up_to FROM {self.summary_table_name} WHERE session_id = %s), 0)"
+
+    def _since_sql(self) -> str:
+        """Subquery do limite inferior em created_at (sem resumo: sem limite)."""
+        return (
+            f"COALESCE((SELECT summarized_at FROM {self.summary_table_name} WHERE session_id = %s), "
+            f"'-infinity'::timestamp) - interval '{_WATERMARK_SLACK}'"
+        )
+
+    def _after_watermark_sql(self) -> str:
+        """Linhas da sessão depois da marca d'água. Parâmetros: (sessão, sessão, sessão)."""
+        return f"session_id = %s AND id > {self._watermark_sql()} AND created_at >= {self._since_sql()}"
+
+    def _window_params(self) -> tuple:
+        return (self.session_id, self.session_id, self.session_id)
+
+    def _insert_sql(self) -> str:
+        """INSERT multi-linha + tamanho da sessão. Parâmetros: (sessão, jsonb[], sessão, sessão, sessão)."""
+        # O snapshot do SELECT externo não enxerga as linhas do CTE: soma as duas partes
+        return f"""
+            WITH ins AS (
+                INSERT INTO {self.table_name} (session_id, message)
+                SELECT %s, m.message
+                FROM unnest(%s::jsonb[]) WITH ORDINALITY AS m(message, ord)
+                ORDER BY m.ord
+                RETURNING id
+            )
+            SELECT (SELECT COUNT(*) FROM ins)
+                 + (SELECT COUNT(*) FROM {self.table_name}
+                    WHERE {self._after_watermark_sql()})
+        """
+
+    def _summary_sql(self) -> str:
+        return f"SELECT summary FROM {self.summary_table_name} WHERE session_id = %s"
+
+    def _window_sql(self, limit: Optional[int] = None) -> str:
+        """Linhas depois da marca d'água (as `limit` mais recentes, se informado). Parâmetros: `_window_params()`."""
+        if limit is None:
+            return f"""
+                SELECT id, message FROM {self.table_name}
+                WHERE {self._after_watermark_sql()}
+                ORDER BY id ASC
+            """
+        return f"""
+            SELECT id, message FROM (
+                SELECT id, message FROM {self.table_name}
+                WHERE {self._after_watermark_sql()}
+                ORDER BY id DESC
+                LIMIT {int(limit)}
+            ) recentes
+            ORDER BY id ASC
+        """
+
+    def _count_sql(self) -> str:
+        return f"""
+            SELECT COUNT(*) FROM {self.table_name}
+            WHERE {self._after_watermark_sql()}
+        """
+
+    def _upsert_summary_sql(self) -> str:
+        """
+        Grava o resumo e avança a marca d'água (nunca volta), junto com o
+        created_at da linha da marca. Parâmetros: `_upsert_params(resumo, id)`.
+        """
+        resumo = self.summary_table_name
+        return f"""
+            INSERT INTO {resumo} (session_id, summary, summarized_up_to, summarized_at, updated_at)
+            VALUES (%s, %s, %s, (
+                SELECT created_at FROM {self.table_name}
+                WHERE session_id = %s AND id = %s AND created_at >= {self._since_sql()}
+            ), CURRENT_TIMESTAMP)
+            ON CONFLICT (session_id) DO UPDATE SET
+                summary = EXCLUDED.summary,
+                summarized_up_to = GREATEST({resumo}.summarized_up_to, EXCLUDED.summarized_up_to),
+                summarized_at = CASE
+                    WHEN EXCLUDED.summarized_up_to >= {resumo}.summarized_up_to THEN EXCLUDED.summarized_at
+                    ELSE {resumo}.summarized_at
+                END,
+                updated_at = EXCLUDED.updated_at
+        """
+
+    def _upsert_params(self, summary: str, watermark: int) -> tuple:
+        return (self.session_id, summary, watermark, self.session_id, watermark, self.session_id)
+
+    def _ensure_summary_table(self, cursor) -> None:
+        """Cria a tabela de resumo se ainda não existir (uma vez por processo)."""
+        key = (self.connection_string, self.summary_table_name)
+        if key in _summary_tables_ready:
+            return
+        cursor.execute(self._summary_table_sql())
+        cursor.execute(self._summary_column_sql())
+        _summary_tables_ready.add(key)
+
+    @staticmethod
+    def _row_to_message(msg_data: Any) -> BaseMessage:
+        if isinstance(msg_data, str):
+            msg_data = json.loads(msg_data)
+        return messages_from_dict([msg_data])[0]
+
+    @staticmethod
+    def _is_legacy_summary(message: BaseMessage) -> bool:
+        """Resumo no formato antigo (linha SystemMessage dentro da própria tabela)."""
+        return isinstance(message, SystemMessage) and "RESUMO DO CONTEXTO:" in str(message.content)
+
     def clear(self) -> None:
         """Limpa todas as mensagens da sessão."""
         try:
-            with psycopg2.connect(self.connection_string) as conn:
+            with connection(self.connection_string) as conn:
                 with conn.cursor() as cursor:
+                    self._ensure_summary_table(cursor)
                     cursor.execute(f"DELETE FROM {self.table_name} WHERE session_id = %s", (self.session_id,))
-                    conn.commit()
+                    cursor.execute(f"DELETE FROM {self.summary_table_name} WHERE session_id = %s", (self.session_id,))
         except Exception as e:
             logger.error(f"Erro ao limpar histórico: {e}")
+        finally:
+            if self._cache:
+                self._cache.invalidate(self.session_id)
+
+    def _load_window(self, cursor, limit: Optional[int] = None) -> tuple:
+        """
+        Lê (resumo, [(id, mensagem)...]) com as linhas depois da marca d'água
+        (só as `limit` mais recentes, se informado).
+        """
+        self._ensure_summary_table(cursor)
+        cursor.execute(self._summary_sql(), (self.session_id,))
+        row = cursor.fetchone()
+        summary = row[0] if row else None
+
+        cursor.execute(self._window_sql(limit), self._window_params())
+        rows = [(r[0], self._row_to_message(r[1])) for r in cursor.fetchall()]
+        return summary, rows
+    
+    def _load_context(self) -> Tuple[Optional[str], List[BaseMessage]]:
+        """
+        (resumo, mensagens depois da marca d'água): do cache se a sessão está
+        quente; senão do banco, preenchendo o cache para as próximas leituras.
+        """
+        version = None
+        if self._cache:
+            cached, version = self._cache.get(self.session_id)
+            if cached is not None:
+                summary, dicts = cached
+                return summary, messages_from_dict(dicts)
+
+        with connection(self.connection_string) as conn:
+            with conn.cursor() as cursor:
+                summary, rows = self._load_window(cursor, self.window_limit)
+        messages = [msg for _, msg in rows]
+        if self._cache:
+            self._cache.fill(self.session_id, summary, [message_to_dict(m) for m in messages], version)
+        return summary, messages
     
     def get_optimized_context(self) -> List[BaseMessage]:
         """
-        Obtém contexto otimizado lendo diretamente do banco.
+        Obtém o contexto: resumo (se houver) + mensagens depois da marca d'água.
         """
         try:
-            with psycopg2.connect(self.connection_string) as conn:
-                with conn.cursor() as cursor:
-                    cursor.execute(f"""
-                        SELECT message FROM {self.table_name} 
-                        WHERE session_id = %s 
-                        ORDER BY created_at ASC
-                    """, (self.session_id,))
-                    
-                    rows = cursor.fetchall()
-                    messages = []
-                    for row in rows:
-                        msg_data = row[0]
-                        if isinstance(msg_data, str):
-                            msg_data = json.loads(msg_data)
-                        msgs = messages_from_dict([msg_data])
-                        messages.extend(msgs)
-                    
-                    return messages # Retorna tudo (a otimização agora é feita pelo manage_rolling_summary)
-                    
+            summary, recent = self._load_context()
+            messages = [SystemMessage(content=summary)] if summary else []
+            messages.extend(recent)
+            return messages
         except Exception as e:
             logger.error(f"Erro ao ler mensagens manualmente: {e}")
             return []
 
+    def get_summary(self) -> Optional[str]:
+        """
+        Retorna o resumo deslizante da sessão (RESUMO DO CONTEXTO), se existir.
+        """
+        try:
+            summary, _ = self._load_context()
+            return summary
+        except Exception as e:
+            logger.error(f"Erro ao ler resumo: {e}")
+            return None
+
     def get_message_count(self) -> int:
+        """Quantidade de mensagens ainda não incorporadas ao resumo."""
         try:
-            with psycopg2.connect(self.connection_string) as conn:
+            with connection(self.connection_string) as conn:
                 with conn.cursor() as cursor:
-                    cursor.execute(f"SELECT COUNT(*) FROM {self.table_name} WHERE session_id = %s", (self.session_id,))
+                    self._ensure_summary_table(cursor)
+                    cursor.execute(self._count_sql(), self._window_params())
                     result = cursor.fetchone()
                     return result[0] if result else 0
         except Exception:
             return 0
 
-    def manage_rolling_summary(self, llm: BaseChatModel, group_size: int = 6):
+    def _plan_summary(
+        self, existing_summary: Optional[str], rows: List[Tuple[int, BaseMessage]], group_size: int
+    ) -> Optional[Tuple[str, int, int]]:
         """
-        Estratégia: Resumo Deslizante (Rolling Summary).
-        A cada 'group_size' mensagens novas, incorpora as antigas ao resumo.
-        MANTÉM sempre as últimas 'group_size' mensagens vivas (texto bruto).
+        Decide a compactação da janela lida do banco.
+        Retorna (prompt do resumo, nova marca d'água, qtd. de mensagens resumidas) ou None.
         """
-        messages = self.get_optimized_context()
-        
         # Só ativa se tivermos mensagens suficientes (recente + margem para resumir)
-        if len(messages) < (group_size + 3):
-            return
+        if len(rows) < (group_size + 3):
+            return None
 
         # Separa o que fica vivo (recente) do que será resumido (antigo)
-        msgs_to_keep = messages[-group_size:]
-        msgs_to_summarize = messages[:-group_size]
-
-        # Verifica se já existe um resumo anterior para atualizar
-        existing_summary = ""
-        if isinstance(msgs_to_summarize[0], SystemMessage) and "RESUMO DO CONTEXTO:" in str(msgs_to_summarize[0].content):
-            existing_summary = msgs_to_summarize[0].content
-            # Remove o resumo antigo da lista para não duplicar
-            msgs_to_summarize = msgs_to_summarize[1:]
-        
+        rows_to_summarize = rows[:-group_size]
+        watermark = rows_to_summarize[-1][0]
+
+        # Resumo legado (linha dentro da própria tabela) vira o resumo anterior
+        msgs_to_summarize = []
+        for _, msg in rows_to_summarize:
+            if self._is_legacy_summary(msg):
+                existing_summary = str(msg.content)
+            else:
+                msgs_to_summarize.append(msg)
+
         if not msgs_to_summarize:
-            return
+            return None
 
         # Gera o texto para o LLM processar
         conversation_text = "\n".join([f"{m.type}: {m.content}" for m in msgs_to_summarize])
@@ -165,7 +361,7 @@ class LimitedPostgresChatMessageHistory(BaseChatMessageHistory):
         Atualize o resumo da conversa com as novas informações.
         
         RESUMO ANTERIOR:
-        {existing_summary}
+        {existing_summary or ""}
         
         NOVAS MENSAGENS ANTIGAS PARA INCORPORAR:
         {conversation_text}
@@ -178,33 +374,44 @@ class LimitedPostgresChatMessageHistory(BaseChatMessageHistory):
         IGNORE saudações e conversas irrelevantes.
         Seja técnico e direto.
         """
+        return prompt, watermark, len(msgs_to_summarize)
+
+    def manage_rolling_summary(self, llm: BaseChatModel, group_size: int = 6):
+        """
+        Estratégia: Resumo Deslizante (Rolling Summary).
+        A cada 'group_size' mensagens novas, incorpora as antigas ao resumo.
+        MANTÉM sempre as últimas 'group_size' mensagens vivas (texto bruto).
+        A compactação só avança a marca d'água: nenhuma linha é apagada ou reinserida.
+        Lê direto do banco (nunca do cache) e invalida o cache ao terminar.
+        """
+        try:
+            with connection(self.connection_string) as conn:
+                with conn.cursor() as cursor:
+                    existing_summary, rows = self._load_window(cursor)
+        except Exception as e:
+            logger.error(f"Erro ao ler sessão para resumo: {e}")
+            return
+
+        plan = self._plan_summary(existing_summary, rows, group_size)
+        if plan is None:
+            return
+        prompt, watermark, compacted = plan
         
         try:
             # Chama o LLM para gerar o novo resumo
             new_summary_text = llm.invoke(prompt).content
-            final_summary_msg = SystemMessage(content=f"RESUMO DO CONTEXTO: {new_summary_text}")
+            final_summary = f"{SUMMARY_PREFIX}{new_summary_text}"
             
-            # ATUALIZA O BANCO (Transação única)
-            with psycopg2.connect(self.connection_string) as conn:
+            # ATUALIZA O BANCO (um único upsert; a marca d'água nunca volta)
+            with connection(self.connection_string) as conn:
                 with conn.cursor() as cursor:
-                    # 1. Limpa tudo dessa sessão
-                    cursor.execute(f"DELETE FROM {self.table_name} WHERE session_id = %s", (self.session_id,))
-                    
-                    # 2. Insere o Novo Resumo
-                    cursor.execute(
-                        f"INSERT INTO {self.table_name} (session_id, message) VALUES (%s, %s)",
-                        (self.session_id, json.dumps(message_to_dict(final_summary_msg)))
-                    )
-                    
-                    # 3. Reinsere as mensagens recentes
-                    for msg in msgs_to_keep:
-                        cursor.execute(
-                            f"INSERT INTO {self.table_name} (session_id, message) VALUES (%s, %s)",
-                            (self.session_id, json.dumps(message_to_dict(msg)))
-                        )
-                    conn.commit()
+                    cursor.execute(self._upsert_summary_sql(), self._upsert_params(final_summary, watermark))
+            
+            # A janela em cache ainda tem as mensagens agora resumidas
+            if self._cache:
+                self._cache.invalidate(self.session_id)
             
-            logger.info(f"🔄 Resumo atualizado! {len(msgs_to_summarize)} msgs antigas foram compactadas.")
+            logger.info(f"🔄 Resumo atualizado! {compacted} msgs antigas foram compactadas.")
 
         except Exception as e:
             logger.error(f"Erro ao atualizar resumo: {e}")
@@ -0,0 +1,26 @@
+-- Migração 001: resumo deslizante fora da tabela de histórico
+-- O resumo passa a viver em memoria_resumo com uma marca d'água
+-- (summarized_up_to = maior memoria.id já incorporado ao resumo).
+-- As linhas de memoria deixam de ser apagadas/reinseridas na compactação.
+
+CREATE TABLE IF NOT EXISTS memoria_resumo (
+    session_id TEXT PRIMARY KEY,
+    summary TEXT NOT NULL,
+    summarized_up_to BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Resumos legados (SystemMessage "RESUMO DO CONTEXTO:" dentro de memoria):
+-- copia o mais recente de cada sessão e posiciona a marca d'água nele.
+INSERT INTO memoria_resumo (session_id, summary, summarized_up_to)
+SELECT DISTINCT ON (session_id)
+       session_id,
+       message->'data'->>'content',
+       id
+FROM memoria
+WHERE message->>'type' = 'system'
+  AND message->'data'->>'content' LIKE 'RESUMO DO CONTEXTO:%'
+ORDER BY session_id, id DESC
+ON CONFLICT (session_id) DO NOTHING;
+
+SELECT 'Migração 001 aplicada (memoria_resumo)' AS status;
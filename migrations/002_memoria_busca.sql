@@ -0,0 +1,31 @@
+-- Migração 002: busca no histórico por índice (search_message_history)
+-- Antes: message->>'content' ILIKE '%x%' (extração JSON + varredura por linha)
+-- Depois: coluna gerada `content` com GIN pg_trgm, `tsv` em português e
+-- índice composto (session_id, created_at) para a leitura cronológica.
+--
+-- ATENÇÃO: ADD COLUMN ... STORED reescreve a tabela. Rode numa janela de
+-- manutenção; os índices usam CONCURRENTLY (fora de transação).
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+ALTER TABLE memoria
+    ADD COLUMN IF NOT EXISTS content TEXT
+        GENERATED ALWAYS AS (message->'data'->>'content') STORED;
+
+ALTER TABLE memoria
+    ADD COLUMN IF NOT EXISTS tsv TSVECTOR
+        GENERATED ALWAYS AS (to_tsvector('portuguese', COALESCE(message->'data'->>'content', ''))) STORED;
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_memoria_content_trgm
+    ON memoria USING GIN (content gin_trgm_ops);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_memoria_tsv
+    ON memoria USING GIN (tsv);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_memoria_session_created
+    ON memoria (session_id, created_at);
+
+-- O composto cobre as buscas só por session_id
+DROP INDEX CONCURRENTLY IF EXISTS idx_session_id;
+
+SELECT 'Migração 002 aplicada (busca no histórico)' AS status;
@@ -0,0 +1,93 @@
+-- Migração 003: memoria particionada por mês (RANGE em created_at)
+-- Cada mês vira uma partição: leituras recentes e o vacuum tocam só as
+-- partições quentes, e a retenção (scripts/memoria_retention.py) desanexa
+-- e arquiva meses antigos sem DELETE em massa.
+--
+-- Requer as migrações 001 e 002. Copia os dados para a nova tabela dentro
+-- de uma transação (bloqueia escritas em memoria durante a cópia): rode
+-- numa janela de manutenção. A tabela antiga fica como memoria_legacy.
+
+BEGIN;
+
+-- Cria (se faltar) a partição mensal que contém `mes`
+CREATE OR REPLACE FUNCTION memoria_criar_particao(mes DATE, tabela TEXT DEFAULT 'memoria')
+RETURNS TEXT AS $$
+DECLARE
+    inicio DATE := date_trunc('month', mes)::date;
+    nome TEXT := format('%s_p%s', tabela, to_char(inicio, 'YYYYMM'));
+BEGIN
+    EXECUTE format(
+        'CREATE TABLE IF NOT EXISTS %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+        nome, tabela, inicio, (inicio + interval '1 month')::date
+    );
+    RETURN nome;
+END;
+$$ LANGUAGE plpgsql;
+
+ALTER SEQUENCE memoria_id_seq AS BIGINT;
+
+CREATE TABLE memoria_part (
+    id BIGINT NOT NULL DEFAULT nextval('memoria_id_seq'),
+    session_id TEXT NOT NULL,
+    message JSONB NOT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    content TEXT GENERATED ALWAYS AS (message->'data'->>'content') STORED,
+    tsv TSVECTOR GENERATED ALWAYS AS (to_tsvector('portuguese', COALESCE(message->'data'->>'content', ''))) STORED,
+    PRIMARY KEY (id, created_at)
+) PARTITION BY RANGE (created_at);
+
+-- Linhas fora de qualquer mês criado caem aqui (nunca falha um INSERT)
+CREATE TABLE memoria_part_default PARTITION OF memoria_part DEFAULT;
+
+-- Um mês por partição, do mais antigo registro até 2 meses à frente
+DO $$
+DECLARE
+    mes DATE;
+BEGIN
+    FOR mes IN
+        SELECT generate_series(
+            date_trunc('month', COALESCE((SELECT min(created_at) FROM memoria), now())),
+            date_trunc('month', now()) + interval '2 months',
+            interval '1 month'
+        )::date
+    LOOP
+        PERFORM memoria_criar_particao(mes, 'memoria_part');
+    END LOOP;
+END $$;
+
+INSERT INTO memoria_part (id, session_id, message, created_at)
+SELECT id, session_id, message, COALESCE(created_at, now())
+FROM memoria;
+
+-- Índices no pai (propagados para cada partição)
+CREATE INDEX idx_memoria_part_session_created ON memoria_part (session_id, created_at);
+CREATE INDEX idx_memoria_part_content_trgm ON memoria_part USING GIN (content gin_trgm_ops);
+CREATE INDEX idx_memoria_part_tsv ON memoria_part USING GIN (tsv);
+
+-- Troca de nomes: a aplicação passa a usar a tabela particionada
+ALTER TABLE memoria RENAME TO memoria_legacy;
+ALTER TABLE memoria_legacy ALTER COLUMN id DROP DEFAULT;
+ALTER SEQUENCE memoria_id_seq OWNED BY NONE;
+ALTER TABLE memoria_part RENAME TO memoria;
+ALTER TABLE memoria_part_default RENAME TO memoria_default;
+ALTER SEQUENCE memoria_id_seq OWNED BY memoria.id;
+
+DO $$
+DECLARE
+    r RECORD;
+BEGIN
+    FOR r IN
+        SELECT c.relname FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'memoria'::regclass AND c.relname LIKE 'memoria_part_p%'
+    LOOP
+        EXECUTE format('ALTER TABLE %I RENAME TO %I', r.relname, replace(r.relname, 'memoria_part_', 'memoria_'));
+    END LOOP;
+END $$;
+
+COMMIT;
+
+-- Conferido o volume (SELECT count(*) nas duas), apague a tabela antiga:
+-- DROP TABLE memoria_legacy;
+
+SELECT 'Migração 003 aplicada (memoria particionada por mês)' AS status;
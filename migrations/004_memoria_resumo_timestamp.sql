@@ -0,0 +1,18 @@
+-- Migração 004: instante da marca d'água do resumo
+-- summarized_at = created_at da linha summarized_up_to. As leituras do
+-- caminho quente filtram created_at >= summarized_at (menos uma folga) além
+-- de id > summarized_up_to, e o Postgres poda as partições mensais antigas
+-- (migração 003) em vez de consultar o índice de cada uma.
+--
+-- Requer as migrações 001 e 003.
+
+ALTER TABLE memoria_resumo ADD COLUMN IF NOT EXISTS summarized_at TIMESTAMP;
+
+UPDATE memoria_resumo r
+SET summarized_at = m.created_at
+FROM memoria m
+WHERE m.session_id = r.session_id
+  AND m.id = r.summarized_up_to
+  AND r.summarized_at IS NULL;
+
+SELECT 'Migração 004 aplicada (memoria_resumo.summarized_at)' AS status;
@@ -0,0 +1,185 @@
+"""
+Benchmark da busca no histórico (search_message_history).
+
+Cria uma tabela sintética com milhões de mensagens no formato de `memoria`
+e compara a consulta antiga (ILIKE sobre o JSON, índices separados de
+session_id/created_at) com a nova (coluna gerada `content`, GIN pg_trgm,
+tsvector em português e índice composto session_id/created_at).
+
+Uso:
+  python scripts/bench_search_history.py --rows 3000000 --sessions 150000
+
+Usa POSTGRES_CONNECTION_STRING do .env. A tabela `memoria_bench` é apagada
+ao final (use --keep para mantê-la).
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import psycopg
+
+from config.settings import settings
+
+TABLE = "memoria_bench"
+
+WORDS = [
+    "arroz", "feijão", "leite", "café", "açúcar", "óleo", "macarrão", "farinha",
+    "frango", "carne", "sabão", "detergente", "biscoito", "refrigerante", "cerveja",
+    "queijo", "presunto", "banana", "tomate", "cebola", "batata", "pão", "manteiga",
+    "entrega", "pix", "cartão", "troco", "endereço", "pedido", "promoção",
+]
+
+KEYWORDS = ["arroz", "feijao", "leite", "cerveja", "entrega", "pix", "tomates", "promoç"]
+
+
+def _create_table(conn, rows: int, sessions: int) -> None:
+    print(f"🧱 Gerando {rows:,} mensagens em {sessions:,} sessões...")
+    started = time.perf_counter()
+    conn.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    conn.execute(f"DROP TABLE IF EXISTS {TABLE}")
+    conn.execute(f"""
+        CREATE UNLOGGED TABLE {TABLE} (
+            id BIGSERIAL PRIMARY KEY,
+            session_id TEXT NOT NULL,
+            message JSONB NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    conn.execute(f"""
+        INSERT INTO {TABLE} (session_id, message, created_at)
+        SELECT
+            (5511900000000 + (random() * %s)::bigint)::text,
+            jsonb_build_object(
+                'type', CASE WHEN g %% 2 = 0 THEN 'human' ELSE 'ai' END,
+                'data', jsonb_build_object(
+                    'content',
+                    'quero ' || w[1 + (random() * (cardinality(w) - 1))::int]
+                    || ' e ' || w[1 + (random() * (cardinality(w) - 1))::int]
+                    || ', quanto fica com ' || w[1 + (random() * (cardinality(w) - 1))::int] || '?'
+                )
+            ),
+            now() - (random() * interval '180 days')
+        FROM generate_series(1, %s) AS g,
+             (SELECT %s::text[] AS w) AS words
+    """, (sessions - 1, rows, WORDS))
+    conn.execute(f"ANALYZE {TABLE}")
+    print(f"   pronto em {time.perf_counter() - started:.1f}s")
+
+
+def _legacy_schema(conn) -> None:
+    conn.execute(f"CREATE INDEX {TABLE}_session ON {TABLE} (session_id)")
+    conn.execute(f"CREATE INDEX {TABLE}_created ON {TABLE} (created_at)")
+    conn.execute(f"ANALYZE {TABLE}")
+
+
+def _indexed_schema(conn) -> None:
+    started = time.perf_counter()
+    conn.execute(f"""
+        ALTER TABLE {TABLE}
+            ADD COLUMN content TEXT GENERATED ALWAYS AS (message->'data'->>'content') STORED,
+            ADD COLUMN tsv TSVECTOR GENERATED ALWAYS AS
+                (to_tsvector('portuguese', COALESCE(message->'data'->>'content', ''))) STORED
+    """)
+    conn.execute(f"CREATE INDEX {TABLE}_content_trgm ON {TABLE} USING GIN (content gin_trgm_ops)")
+    conn.execute(f"CREATE INDEX {TABLE}_tsv ON {TABLE} USING GIN (tsv)")
+    conn.execute(f"CREATE INDEX {TABLE}_session_created ON {TABLE} (session_id, created_at)")
+    conn.execute(f"DROP INDEX {TABLE}_session")
+    conn.execute(f"ANALYZE {TABLE}")
+    print(f"🔧 Migração (colunas geradas + índices) em {time.perf_counter() - started:.1f}s")
+
+
+LEGACY_QUERIES = {
+    "sessão + palavra": f"""
+        SELECT message->>'type', message->'data'->>'content', created_at FROM {TABLE}
+        WHERE session_id = %(tel)s AND message->'data'->>'content' ILIKE %(like)s
+        ORDER BY created_at ASC LIMIT 10
+    """,
+    "sessão (recentes)": f"""
+        SELECT message->>'type', message->'data'->>'content', created_at FROM {TABLE}
+        WHERE session_id = %(tel)s
+        ORDER BY created_at ASC LIMIT 15
+    """,
+    "global + palavra": f"""
+        SELECT count(*) FROM {TABLE}
+        WHERE message->'data'->>'content' ILIKE %(like)s
+    """,
+}
+
+INDEXED_QUERIES = {
+    "sessão + palavra": f"""
+        SELECT message->>'type', content, created_at FROM {TABLE}
+        WHERE session_id = %(tel)s
+        AND (tsv @@ plainto_tsquery('portuguese', %(kw)s) OR content ILIKE %(like)s)
+        ORDER BY created_at ASC LIMIT 10
+    """,
+    "sessão (recentes)": f"""
+        SELECT message->>'type', content, created_at FROM {TABLE}
+        WHERE session_id = %(tel)s
+        ORDER BY created_at ASC LIMIT 15
+    """,
+    "global + palavra": f"""
+        SELECT count(*) FROM {TABLE}
+        WHERE content ILIKE %(like)s
+    """,
+}
+
+
+def _run(conn, queries, sessions: int, repeat: int, global_repeat: int, seed: int):
+    rng = random.Random(seed)
+    results = {}
+    for name, sql in queries.items():
+        n = global_repeat if name.startswith("global") else repeat
+        timings = []
+        for _ in range(n):
+            kw = rng.choice(KEYWORDS)
+            params = {
+                "tel": str(5511900000000 + rng.randrange(sessions)),
+                "kw": kw,
+                "like": f"%{kw}%",
+            }
+            started = time.perf_counter()
+            conn.execute(sql, params).fetchall()
+            timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+        results[name] = (
+            statistics.median(timings),
+            timings[max(0, int(len(timings) * 0.95) - 1)],
+        )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=3_000_000)
+    parser.add_argument("--sessions", type=int, default=150_000)
+    parser.add_argument("--repeat", type=int, default=200, help="consultas por sessão sorteada")
+    parser.add_argument("--global-repeat", type=int, default=5, help="consultas sem filtro de sessão")
+    parser.add_argument("--keep", action="store_true", help="não apagar a tabela ao final")
+    args = parser.parse_args()
+
+    with psycopg.connect(settings.postgres_connection_string, autocommit=True) as conn:
+        _create_table(conn, args.rows, args.sessions)
+        try:
+            _legacy_schema(conn)
+            before = _run(conn, LEGACY_QUERIES, args.sessions, args.repeat, args.global_repeat, seed=42)
+            _indexed_schema(conn)
+            after = _run(conn, INDEXED_QUERIES, args.sessions, args.repeat, args.global_repeat, seed=42)
+        finally:
+            if not args.keep:
+                conn.execute(f"DROP TABLE IF EXISTS {TABLE}")
+
+    print(f"\n📊 {args.rows:,} linhas | p50 / p95 em ms")
+    print(f"{'consulta':<20} {'antes':>18} {'depois':>18} {'ganho p50':>10}")
+    for name in LEGACY_QUERIES:
+        b50, b95 = before[name]
+        a50, a95 = after[name]
+        print(f"{name:<20} {b50:>8.2f} / {b95:>7.2f} {a50:>8.2f} / {a95:>7.2f} {b50 / max(a50, 1e-6):>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+Benchmark de tokens do resultado das ferramentas estoque/estoque_preco.
+
+Compara, por consulta, o formato antigo (json indent=2, INSTRUCAO_IA em
+cada item, meta_original/meta_emb) com o formato compacto atual
+(`_resultado_compacto`: sem indentação nem metadados, instruções uma vez
+por tipo_venda e no máximo TOOL_RESULT_MAX_ITEMS itens por relevância).
+
+Uso:
+  python scripts/bench_tool_tokens.py                   # catálogo sintético
+  python scripts/bench_tool_tokens.py --file resp.json  # resposta real do ERP (lista de produtos)
+
+Conta tokens com tiktoken (o200k_base) quando instalado; senão estima
+por caracteres/4.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tools.http_tools import INSTRUCOES_TIPO_VENDA, _processar_produto_para_agente, _resultado_compacto
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("o200k_base")
+except Exception:
+    _encoding = None
+
+QUERIES = {
+    "arroz": ["ARROZ TIO JOAO 5KG", "ARROZ CAMIL PCT 1KG", "ARROZ INTEGRAL URBANO 1KG", "ARROZ PRATO FINO 5KG"],
+    "carne": ["CARNE MOIDA RESF KG", "ALCATRA BOVINA KG", "PICANHA CBOX KG", "COSTELA C/OSSO KG", "CONTRA FILE RESF KG"],
+    "refrigerante": ["COCA COLA 2L", "GUARANA ANTARCTICA 2L", "FANTA LARANJA 2L", "COCA COLA LATA 350ML", "PEPSI 2L"],
+    "salsicha": ["SALSICHA PERDIGAO PCT 500G", "SALSICHA SADIA KG", "SALSICHA HOT DOG SEARA PCT 3KG"],
+    "biscoito": ["BISCOITO TRAKINAS", "BISCOITO OREO", "BISCOITO MARIA VITARELLA", "BISCOITO CREAM CRACKER PCT"],
+}
+
+
+def _tokens(texto: str) -> int:
+    if _encoding is not None:
+        return len(_encoding.encode(texto))
+    return len(texto) // 4
+
+
+def _produto_sintetico(nome: str, rng: random.Random) -> dict:
+    emb = "KG" if nome.endswith(" KG") else ("PCT" if " PCT " in f" {nome} " else "UN")
+    preco = round(rng.uniform(2, 80), 2)
+    return {
+        "id_produto": rng.randint(1000, 99999),
+        "produto": nome,
+        "vl_produto": preco,
+        "vl_promocao": round(preco * 0.9, 2) if rng.random() < 0.3 else 0,
+        "qtd_produto": rng.choice([0, 3, 12, 40]),
+        "ativo": True,
+        "emb": emb,
+        "fracionado": emb == "KG",
+    }
+
+
+def _catalogo_sintetico(consulta: str, n: int, rng: random.Random) -> list:
+    nomes = QUERIES[consulta]
+    return [_produto_sintetico(f"{rng.choice(nomes)} {i:02d}" if i >= len(nomes) else nomes[i], rng) for i in range(n)]
+
+
+def _formato_antigo(produtos: list) -> str:
+    """Formato anterior: item completo, instrução com preço e metadados em cada produto, indent=2."""
+    itens = []
+    for bruto in produtos:
+        item = _processar_produto_para_agente(bruto)
+        instrucao = INSTRUCOES_TIPO_VENDA[item["tipo_venda"]]
+        if item["tipo_venda"] != "UNITARIO":
+            instrucao = f"Preço: R$ {item['preco']:.2f} por {item['unidade']}. {instrucao}"
+        itens.append({
+            **item,
+            "INSTRUCAO_IA": instrucao,
+            "meta_original": bruto.get("produto"),
+            "meta_emb": str(bruto.get("emb", "")).upper(),
+        })
+    return json.dumps(itens, indent=2, ensure_ascii=False)
+
+
+def _formato_novo(produtos: list, consulta: str) -> str:
+    return _resultado_compacto([_processar_produto_para_agente(p) for p in produtos], consulta)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Tokens por consulta: formato antigo x compacto")
+    parser.add_argument("--items", type=int, default=20, help="produtos por consulta sintética")
+    parser.add_argument("--file", help="JSON com a resposta real do ERP (lista de produtos)")
+    parser.add_argument("--query", default="", help="termo buscado (com --file)")
+    args = parser.parse_args()
+
+    if args.file:
+        with open(args.file, encoding="utf-8") as f:
+            data = json.load(f)
+        casos = {args.query or os.path.basename(args.file): data if isinstance(data, list) else [data]}
+    else:
+        rng = random.Random(42)
+        casos = {q: _catalogo_sintetico(q, args.items, rng) for q in QUERIES}
+
+    print(f"tokenizer: {'tiktoken o200k_base' if _encoding else 'chars/4'}")
+    print(f"{'consulta':<16}{'itens':>6}{'antes':>9}{'depois':>9}{'redução':>10}")
+    total_antes = total_depois = 0
+    for consulta, produtos in casos.items():
+        antes = _tokens(_formato_antigo(produtos))
+        depois = _tokens(_formato_novo(produtos, consulta))
+        total_antes += antes
+        total_depois += depois
+        print(f"{consulta:<16}{len(produtos):>6}{antes:>9}{depois:>9}{1 - depois / antes:>10.0%}")
+    print(f"{'total':<16}{'':>6}{total_antes:>9}{total_depois:>9}{1 - total_depois / max(total_antes, 1):>10.0%}")
+
+
+if __name__ == "__main__":
+    main()
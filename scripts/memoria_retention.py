@@ -0,0 +1,234 @@
+"""
+Manutenção da tabela `memoria` particionada por mês (migração 003).
+
+  ensure   move para a partição do mês as linhas que caíram na DEFAULT
+           (alerta: faltou partição) e cria as partições dos próximos
+           meses (POSTGRES_PARTITIONS_AHEAD); sai com código 1 se a DEFAULT
+           tinha linhas
+  check    só confere a DEFAULT (código 1 se tiver linhas), para monitoração
+  archive  desanexa os meses além de POSTGRES_RETENTION_MONTHS, grava cada
+           um em <POSTGRES_ARCHIVE_DIR>/<partição>.csv.gz (COPY) e apaga a
+           partição depois de conferir o número de linhas
+
+Uso (ex.: cron diário):
+  python scripts/memoria_retention.py ensure
+  python scripts/memoria_retention.py check
+  python scripts/memoria_retention.py archive --dry-run
+  python scripts/memoria_retention.py archive --months 12 --dir /backups/memoria
+
+Desanexar e apagar uma partição não gera DELETE nem vacuum na tabela viva.
+
+A DEFAULT precisa ficar vazia: ela não é podada (toda leitura a consulta) e,
+com linhas de um mês, impede criar a partição daquele mês.
+"""
+import argparse
+import datetime
+import gzip
+import os
+import sys
+from typing import Optional
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import psycopg
+from psycopg import sql
+
+from config.logger import setup_logger
+from config.settings import settings
+
+logger = setup_logger(__name__)
+
+
+def _month_start(d: datetime.date, offset: int = 0) -> datetime.date:
+    months = d.year * 12 + (d.month - 1) + offset
+    return datetime.date(months // 12, months % 12 + 1, 1)
+
+
+def ensure_partitions(conn, table: str, ahead: int) -> None:
+    """Cria as partições do mês atual até `ahead` meses à frente."""
+    today = datetime.date.today()
+    for offset in range(ahead + 1):
+        name = conn.execute(
+            "SELECT memoria_criar_particao(%s, %s)", (_month_start(today, offset), table)
+        ).fetchone()[0]
+        logger.info(f"📅 Partição pronta: {name}")
+
+
+def _partitions(conn, table: str):
+    """[(nome, limites)] das partições de `table`."""
+    return conn.execute("""
+        SELECT c.relname, pg_get_expr(c.relpartbound, c.oid)
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = %s::regclass
+        ORDER BY c.relname
+    """, (table,)).fetchall()
+
+
+def default_partition(conn, table: str) -> Optional[str]:
+    for name, bound in _partitions(conn, table):
+        if bound == "DEFAULT":
+            return name
+    return None
+
+
+def default_rows(conn, table: str):
+    """(partição DEFAULT, [(mês, linhas)]) das linhas que caíram na DEFAULT."""
+    name = default_partition(conn, table)
+    if name is None:
+        return None, []
+    rows = conn.execute(sql.SQL("""
+        SELECT date_trunc('month', created_at)::date, count(*)
+        FROM {} GROUP BY 1 ORDER BY 1
+    """).format(sql.Identifier(name))).fetchall()
+    return name, rows
+
+
+def drain_default(conn, table: str) -> int:
+    """
+    Move as linhas da DEFAULT para a partição do mês delas (criando-a).
+    Cada mês numa transação: copia, apaga da DEFAULT, cria a partição e
+    reinsere (mesmos ids). Retorna as linhas movidas.
+    """
+    name, rows = default_rows(conn, table)
+    if not rows:
+        return 0
+    logger.error(
+        f"⚠️ {sum(n for _, n in rows)} mensagens na partição {name} "
+        f"({', '.join(f'{mes:%Y-%m}: {n}' for mes, n in rows)}): faltou partição, rode 'ensure' com mais antecedência"
+    )
+
+    default = sql.Identifier(name)
+    moved = 0
+    for mes, _ in rows:
+        fim = _month_start(mes, 1)
+        with conn.transaction():
+            conn.execute(sql.SQL("""
+                CREATE TEMP TABLE memoria_mover ON COMMIT DROP AS
+                SELECT id, session_id, message, created_at FROM {}
+                WHERE created_at >= %s AND created_at < %s
+            """).format(default), (mes, fim))
+            conn.execute(
+                sql.SQL("DELETE FROM {} WHERE created_at >= %s AND created_at < %s").format(default), (mes, fim)
+            )
+            part = conn.execute("SELECT memoria_criar_particao(%s, %s)", (mes, table)).fetchone()[0]
+            count = conn.execute(sql.SQL("""
+                INSERT INTO {} (id, session_id, message, created_at)
+                SELECT id, session_id, message, created_at FROM memoria_mover
+            """).format(sql.Identifier(table))).rowcount
+        moved += count
+        logger.info(f"🚚 {count} mensagens movidas de {name} para {part}")
+    return moved
+
+
+def old_partitions(conn, table: str, months: int):
+    """Partições mensais inteiramente anteriores ao corte (mês atual - `months`)."""
+    cutoff = _month_start(datetime.date.today(), -months)
+    rows = _partitions(conn, table)
+
+    prefix = f"{table}_p"
+    result = []
+    for name, bound in rows:
+        # Só partições mensais (<tabela>_pYYYYMM); a DEFAULT nunca é arquivada
+        if not name.startswith(prefix) or "DEFAULT" in bound:
+            continue
+        try:
+            start = datetime.datetime.strptime(name[len(prefix):], "%Y%m").date()
+        except ValueError:
+            continue
+        if _month_start(start, 1) <= cutoff:
+            result.append((name, start))
+    return result, cutoff
+
+
+def archive_partition(conn, table: str, name: str, start: datetime.date, archive_dir: str) -> int:
+    """Desanexa, exporta com COPY para .csv.gz e apaga a partição. Retorna as linhas arquivadas."""
+    os.makedirs(archive_dir, exist_ok=True)
+    path = os.path.join(archive_dir, f"{name}.csv.gz")
+    part = sql.Identifier(name)
+
+    conn.execute(sql.SQL("ALTER TABLE {} DETACH PARTITION {}").format(sql.Identifier(table), part))
+    logger.info(f"✂️ Partição {name} desanexada de {table}")
+
+    try:
+        expected = _export_partition(conn, name, path)
+    except Exception:
+        # Falhou a exportação: devolve o mês à tabela viva antes de propagar o erro
+        conn.execute(
+            sql.SQL("ALTER TABLE {} ATTACH PARTITION {} FOR VALUES FROM (%s) TO (%s)").format(sql.Identifier(table), part),
+            (start, _month_start(start, 1)),
+        )
+        logger.error(f"Partição {name} reanexada após falha no arquivamento")
+        raise
+
+    conn.execute(sql.SQL("DROP TABLE {}").format(part))
+    logger.info(f"📦 {name}: {expected} mensagens arquivadas em {path}")
+    return expected
+
+
+def _export_partition(conn, name: str, path: str) -> int:
+    """COPY da partição para `path` (gzip), conferindo o número de linhas."""
+    part = sql.Identifier(name)
+    expected = conn.execute(sql.SQL("SELECT count(*) FROM {}").format(part)).fetchone()[0]
+    tmp_path = f"{path}.tmp"
+    written = 0
+    copy_sql = sql.SQL(
+        "COPY (SELECT id, session_id, message, created_at FROM {} ORDER BY id) TO STDOUT WITH (FORMAT csv, HEADER)"
+    ).format(part)
+    with conn.cursor() as cur, gzip.open(tmp_path, "wb") as fh:
+        with cur.copy(copy_sql) as copy:
+            for chunk in copy:
+                fh.write(chunk)
+                written += bytes(chunk).count(b"\n")
+
+    # Cabeçalho + uma linha por registro (o texto do jsonb não tem quebras de linha cruas)
+    if written < expected + 1:
+        os.remove(tmp_path)
+        raise RuntimeError(f"Arquivo de {name} incompleto ({written - 1} de {expected} linhas)")
+
+    os.replace(tmp_path, path)
+    return expected
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["ensure", "check", "archive"])
+    parser.add_argument("--table", default=settings.postgres_table_name)
+    parser.add_argument("--ahead", type=int, default=settings.postgres_partitions_ahead)
+    parser.add_argument("--months", type=int, default=settings.postgres_retention_months)
+    parser.add_argument("--dir", default=settings.postgres_archive_dir)
+    parser.add_argument("--dry-run", action="store_true", help="só lista as partições que seriam arquivadas")
+    args = parser.parse_args()
+
+    with psycopg.connect(settings.postgres_connection_string, autocommit=True) as conn:
+        if args.command == "ensure":
+            # Antes de criar os meses: uma partição nova falha se a DEFAULT tem linhas daquele mês
+            moved = drain_default(conn, args.table)
+            ensure_partitions(conn, args.table, args.ahead)
+            sys.exit(1 if moved else 0)
+
+        if args.command == "check":
+            name, rows = default_rows(conn, args.table)
+            if rows:
+                logger.error(f"⚠️ {sum(n for _, n in rows)} mensagens na partição {name}: rode 'ensure'")
+                sys.exit(1)
+            logger.info(f"Partição DEFAULT vazia ({name or 'inexistente'})")
+            return
+
+        names, cutoff = old_partitions(conn, args.table, args.months)
+        if not names:
+            logger.info(f"Nada a arquivar (corte: {cutoff})")
+            return
+        if args.dry_run:
+            for name, _ in names:
+                print(name)
+            return
+
+        total = 0
+        for name, start in names:
+            total += archive_partition(conn, args.table, name, start, args.dir)
+        logger.info(f"✅ Retenção concluída: {len(names)} partições, {total} mensagens (corte: {cutoff})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,20 @@
+"""
+Serviços de runtime do servidor (agendamento, filas e entrega)
+"""
+from .debounce import DebounceScheduler
+from .worker_pool import AgentWorkerPool, AgentJob
+from .whatsapp_delivery import WhatsAppDeliveryEngine
+from .media_ingest import MediaIngestor, MediaJob
+from .stream_queue import StreamConsumer, publish_buffer_event, apublish_buffer_event
+
+__all__ = [
+    'DebounceScheduler',
+    'AgentWorkerPool',
+    'AgentJob',
+    'WhatsAppDeliveryEngine',
+    'MediaIngestor',
+    'MediaJob',
+    'StreamConsumer',
+    'publish_buffer_event',
+    'apublish_buffer_event',
+]
@@ -0,0 +1,176 @@
+"""
+Janela adaptativa do buffer por telefone
+
+Aprende a cadência de digitação de cada cliente (intervalo entre
+mensagens) e fecha a janela num percentil dessa distribuição: quem
+digita rápido espera menos, quem manda mensagens picadas devagar não
+tem o turno quebrado em várias chamadas ao LLM.
+
+A distribuição fica no Redis num hash compacto por telefone
+(`msggap:{telefone}`): contadores de buckets log-espaçados, o horário
+da última mensagem e a janela em vigor. `aobserve` roda no event loop do
+webhook/worker e fala com o Redis via redis.asyncio (sem bloquear o loop).
+"""
+import bisect
+import time
+from typing import Dict, List, Optional, Tuple
+
+import redis
+
+from config.settings import settings
+from config.logger import setup_logger
+from config.metrics import metrics
+from tools.redis_tools import get_async_redis_client
+
+logger = setup_logger(__name__)
+
+# Limites superiores (segundos) dos buckets de intervalo entre mensagens
+GAP_BUCKETS: List[float] = [0.5, 1.0, 1.5, 2.0, 2.5, 3.0, 4.0, 5.0, 6.0, 8.0, 10.0, 12.0, 15.0, 20.0, 30.0, 45.0, 60.0]
+
+# Fallback em memória (Redis indisponível)
+_local_stats: Dict[str, Dict[str, str]] = {}
+
+
+def gap_key(telefone: str) -> str:
+    return f"msggap:{telefone}"
+
+
+class AdaptiveWindowPolicy:
+    """
+    Calcula a janela de silêncio de cada telefone.
+
+    - Intervalos acima de `session_gap_seconds` são início de conversa, não
+      cadência de digitação, e não entram na distribuição.
+    - Com menos de `min_samples` intervalos usa a janela padrão.
+    - Quando o total passa de `decay_at`, os contadores são divididos por 2
+      para a distribuição acompanhar mudanças de hábito.
+    """
+
+    def __init__(
+        self,
+        default_seconds: float = 4.0,
+        min_seconds: float = 1.5,
+        max_seconds: float = 12.0,
+        percentile: float = 0.9,
+        min_samples: int = 3,
+        session_gap_seconds: float = 60.0,
+        decay_at: int = 200,
+        ttl_seconds: int = 30 * 24 * 3600,
+    ):
+        self.default_seconds = default_seconds
+        self.min_seconds = min_seconds
+        self.max_seconds = max_seconds
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.session_gap_seconds = session_gap_seconds
+        self.decay_at = decay_at
+        self.ttl_seconds = ttl_seconds
+
+    # ----------------------------------------
+    # Cálculo
+    # ----------------------------------------
+
+    def window_from_counts(self, counts: List[int]) -> float:
+        """Janela = percentil da distribuição, limitado por [min, max]."""
+        total = sum(counts)
+        if total < self.min_samples:
+            return self.default_seconds
+        target = self.percentile * total
+        acc = 0
+        for upper, count in zip(GAP_BUCKETS, counts):
+            acc += count
+            if acc >= target:
+                return max(self.min_seconds, min(self.max_seconds, upper))
+        return self.max_seconds
+
+    # ----------------------------------------
+    # Observação
+    # ----------------------------------------
+
+    def update(self, stats: Dict[str, str], now: float) -> Tuple[Dict[str, float], float]:
+        """
+        Aplica a chegada de uma mensagem (em `now`) ao hash de cadência.
+        Retorna (campos a gravar, janela a aplicar). Não faz I/O.
+        """
+        counts = [int(stats.get(f"b{i}", 0)) for i in range(len(GAP_BUCKETS))]
+        last = float(stats.get("last", 0) or 0)
+        prev_window = float(stats.get("win", 0) or 0) or self.default_seconds
+
+        updates: Dict[str, float] = {"last": now}
+        gap = (now - last) if last else None
+        if gap is not None and gap <= self.session_gap_seconds:
+            idx = min(bisect.bisect_left(GAP_BUCKETS, gap), len(GAP_BUCKETS) - 1)
+            counts[idx] += 1
+            if sum(counts) > self.decay_at:
+                counts = [c // 2 for c in counts]
+                updates.update({f"b{i}": c for i, c in enumerate(counts)})
+            else:
+                updates[f"b{idx}"] = counts[idx]
+            self._record_effect(gap, prev_window)
+
+        window = self.window_from_counts(counts)
+        updates["win"] = window
+        return updates, window
+
+    async def aobserve(self, telefone: str) -> float:
+        """
+        Registra a chegada de uma mensagem e retorna a janela a aplicar.
+        Custa dois round trips ao Redis (leitura + pipeline de escrita), aguardados no event loop.
+        """
+        stats = await self._aload(telefone)
+        updates, window = self.update(stats, time.time())
+        await self._asave(telefone, updates)
+
+        metrics.observe("buffer.window_seconds", window)
+        return window
+
+    def _record_effect(self, gap: float, window: float) -> None:
+        """
+        Compara a janela adaptativa com a fixa para este intervalo:
+        - turns_avoided: a fixa teria fechado o turno, a adaptativa juntou
+        - turns_split: a adaptativa fechou antes do que a fixa fecharia
+        """
+        fixed = self.default_seconds
+        if fixed < gap <= window:
+            metrics.incr("buffer.turns_avoided")
+        elif window < gap <= fixed:
+            metrics.incr("buffer.turns_split")
+
+    # ----------------------------------------
+    # Armazenamento
+    # ----------------------------------------
+
+    async def _aload(self, telefone: str) -> Dict[str, str]:
+        client = await get_async_redis_client()
+        if client is None:
+            return dict(_local_stats.get(telefone, {}))
+        try:
+            return await client.hgetall(gap_key(telefone)) or {}
+        except redis.exceptions.RedisError as e:
+            logger.error(f"Erro ao ler cadência de {telefone}: {e}")
+            return {}
+
+    async def _asave(self, telefone: str, updates: Dict[str, float]) -> None:
+        client = await get_async_redis_client()
+        if client is None:
+            _local_stats.setdefault(telefone, {}).update({k: str(v) for k, v in updates.items()})
+            return
+        try:
+            pipe = client.pipeline(transaction=False)
+            pipe.hset(gap_key(telefone), mapping=updates)
+            pipe.expire(gap_key(telefone), self.ttl_seconds)
+            await pipe.execute()
+        except redis.exceptions.RedisError as e:
+            logger.error(f"Erro ao salvar cadência de {telefone}: {e}")
+
+
+def build_window_policy() -> Optional[AdaptiveWindowPolicy]:
+    """Política configurada no .env (None se a janela adaptativa estiver desligada)."""
+    if not settings.buffer_adaptive:
+        return None
+    return AdaptiveWindowPolicy(
+        default_seconds=settings.buffer_window_seconds,
+        min_seconds=settings.buffer_window_min_seconds,
+        max_seconds=settings.buffer_window_max_seconds,
+        percentile=settings.buffer_window_percentile,
+    )
@@ -0,0 +1,175 @@
+"""
+Serviço de compactação de memória em background
+
+O resumo deslizante (contagem + leitura da sessão + chamada extra ao LLM +
+regravação) sai do caminho da resposta ao cliente. Pedidos repetidos do
+mesmo telefone são coalescidos e o número de resumos simultâneos é limitado.
+
+`CompactionService` usa threads (caminho síncrono do agente);
+`AsyncCompactionService` é a mesma fila em tarefas asyncio (AGENT_ASYNC).
+"""
+import asyncio
+import queue
+import threading
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+
+from config.logger import setup_logger
+from config.metrics import metrics
+
+logger = setup_logger(__name__)
+
+
+class CompactionService:
+    """
+    Fila de compactação por sessão.
+
+    - `request(telefone)` é não-bloqueante e pode ser chamado de qualquer thread.
+    - Um telefone já na fila não é enfileirado de novo (coalescência); se o
+      pedido chega durante a compactação dele, roda mais uma vez ao final.
+    - `concurrency` threads limitam as chamadas de resumo simultâneas.
+    """
+
+    def __init__(self, compact: Callable[[str], None], concurrency: int = 2, max_queue: int = 10000):
+        self.compact = compact
+        self.concurrency = max(1, concurrency)
+
+        self._queue: "queue.Queue[str]" = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        self._queued: Dict[str, float] = {}  # telefone -> horário do primeiro pedido
+        self._running: Set[str] = set()
+        self._dirty: Set[str] = set()
+        self._threads: List[threading.Thread] = []
+
+    def start(self) -> None:
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.concurrency):
+                t = threading.Thread(target=self._worker, name=f"compaction-{i}", daemon=True)
+                t.start()
+                self._threads.append(t)
+        logger.info(f"🗜️ Compactação em background iniciada (concorrência={self.concurrency})")
+
+    def request(self, telefone: str) -> bool:
+        """Pede a compactação da sessão. Retorna False se a fila estiver cheia."""
+        with self._lock:
+            if telefone in self._queued:
+                metrics.incr("compaction.coalesced")
+                return True
+            if telefone in self._running:
+                self._dirty.add(telefone)
+                metrics.incr("compaction.coalesced")
+                return True
+            try:
+                self._queue.put_nowait(telefone)
+            except queue.Full:
+                metrics.incr("compaction.dropped")
+                return False
+            self._queued[telefone] = time.monotonic()
+            metrics.incr("compaction.requested")
+            metrics.set_gauge("compaction.queue_depth", self._queue.qsize())
+            return True
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    def _worker(self) -> None:
+        while True:
+            telefone = self._queue.get()
+            with self._lock:
+                requested_at = self._queued.pop(telefone, time.monotonic())
+                self._running.add(telefone)
+                metrics.set_gauge("compaction.queue_depth", self._queue.qsize())
+            metrics.observe("compaction.lag_seconds", time.monotonic() - requested_at)
+
+            started = time.monotonic()
+            try:
+                self.compact(telefone)
+                metrics.incr("compaction.completed")
+            except Exception as e:
+                metrics.incr("compaction.failed")
+                logger.error(f"Erro na compactação de {telefone}: {e}")
+            finally:
+                metrics.observe("compaction.run_seconds", time.monotonic() - started)
+                with self._lock:
+                    self._running.discard(telefone)
+                    rerun = telefone in self._dirty
+                    self._dirty.discard(telefone)
+                if rerun:
+                    self.request(telefone)
+
+
+class AsyncCompactionService:
+    """
+    Mesma política do `CompactionService` (coalescência por telefone, limite
+    de resumos simultâneos), com tarefas no event loop em vez de threads.
+    `request(telefone)` deve ser chamado a partir do event loop.
+    """
+
+    def __init__(self, compact: Callable[[str], Awaitable[None]], concurrency: int = 2, max_queue: int = 10000):
+        self.compact = compact
+        self.concurrency = max(1, concurrency)
+        self.max_queue = max_queue
+
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._queued: Dict[str, float] = {}
+        self._running: Set[str] = set()
+        self._dirty: Set[str] = set()
+        self._tasks: Set[asyncio.Task] = set()
+
+    def request(self, telefone: str) -> bool:
+        """Pede a compactação da sessão. Retorna False se a fila estiver cheia."""
+        if telefone in self._queued:
+            metrics.incr("compaction.coalesced")
+            return True
+        if telefone in self._running:
+            self._dirty.add(telefone)
+            metrics.incr("compaction.coalesced")
+            return True
+        if len(self._queued) >= self.max_queue:
+            metrics.incr("compaction.dropped")
+            return False
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.concurrency)
+
+        self._queued[telefone] = time.monotonic()
+        task = asyncio.get_running_loop().create_task(self._run(telefone))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        metrics.incr("compaction.requested")
+        metrics.set_gauge("compaction.queue_depth", len(self._queued))
+        return True
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._queued)
+
+    async def _run(self, telefone: str) -> None:
+        async with self._slots:
+            requested_at = self._queued.pop(telefone, time.monotonic())
+            self._running.add(telefone)
+            metrics.set_gauge("compaction.queue_depth", len(self._queued))
+            metrics.observe("compaction.lag_seconds", time.monotonic() - requested_at)
+
+            started = time.monotonic()
+            try:
+                await self.compact(telefone)
+                metrics.incr("compaction.completed")
+            except Exception as e:
+                metrics.incr("compaction.failed")
+                logger.error(f"Erro na compactação de {telefone}: {e}")
+            finally:
+                metrics.observe("compaction.run_seconds", time.monotonic() - started)
+                self._running.discard(telefone)
+                rerun = telefone in self._dirty
+                self._dirty.discard(telefone)
+        if rerun:
+            self.request(telefone)
+
+    async def stop(self) -> None:
+        """Cancela as compactações em andamento (shutdown)."""
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
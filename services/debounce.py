@@ -0,0 +1,156 @@
+"""
+Agendador de debounce por telefone (asyncio)
+
+Substitui a thread de polling por telefone: um único loop de timers
+mantém o prazo de silêncio de cada conversa e dispara o flush assim
+que a janela expira.
+"""
+import asyncio
+import heapq
+import itertools
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from config.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+FlushCallback = Callable[[str], Awaitable[None]]
+
+
+class DebounceScheduler:
+    """
+    Roda de timers única para o buffer de mensagens.
+
+    - `touch(chave)` (re)inicia o prazo da chave: agora + janela de silêncio.
+    - Quando o prazo vence sem novas mensagens, `on_flush(chave)` é chamado.
+    - `max_wait` limita o tempo total desde a primeira mensagem da janela,
+      para que um cliente que digita sem parar não fique sem resposta.
+
+    Os prazos ficam num heap (lazy deletion): cada `touch` empilha uma nova
+    entrada e as entradas antigas são descartadas quando chegam ao topo.
+    """
+
+    def __init__(
+        self,
+        on_flush: FlushCallback,
+        window_seconds: float = 4.0,
+        max_wait_seconds: float = 20.0,
+    ):
+        self.on_flush = on_flush
+        self.window_seconds = window_seconds
+        self.max_wait_seconds = max_wait_seconds
+
+        self._heap: List[Tuple[float, int, str]] = []
+        self._deadlines: Dict[str, float] = {}
+        self._first_seen: Dict[str, float] = {}
+        self._seq = itertools.count()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._task: Optional[asyncio.Task] = None
+
+    # ----------------------------------------
+    # Ciclo de vida
+    # ----------------------------------------
+
+    def start(self) -> None:
+        """Inicia o loop de timers no event loop atual."""
+        if self._task is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._task = self._loop.create_task(self._run())
+        logger.info(f"⏱️ Debounce iniciado (janela={self.window_seconds}s, máx={self.max_wait_seconds}s)")
+
+    async def stop(self) -> None:
+        """Para o loop de timers (flushes pendentes são descartados)."""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    # ----------------------------------------
+    # API
+    # ----------------------------------------
+
+    def touch(self, key: str, delay: Optional[float] = None, window: Optional[float] = None) -> None:
+        """
+        Reinicia o prazo de silêncio da chave.
+        - `window`: janela de silêncio específica (ex: adaptativa), ainda limitada pelo max_wait.
+        - `delay`: reagendamento explícito, sem limite de max_wait.
+        Deve ser chamado a partir do event loop (use `touch_threadsafe` em threads).
+        """
+        now = time.monotonic()
+        first = self._first_seen.setdefault(key, now)
+        if delay is None:
+            window = self.window_seconds if window is None else window
+            deadline = min(now + window, first + self.max_wait_seconds)
+        else:
+            # Reagendamento explícito: não é limitado pelo max_wait
+            deadline = now + delay
+
+        self._deadlines[key] = deadline
+        heapq.heappush(self._heap, (deadline, next(self._seq), key))
+        if self._wakeup is not None and self._heap[0][2] == key:
+            self._wakeup.set()
+
+    def touch_threadsafe(self, key: str, delay: Optional[float] = None, window: Optional[float] = None) -> None:
+        """Versão de `touch` para ser chamada fora do event loop."""
+        if self._loop is None:
+            raise RuntimeError("DebounceScheduler não iniciado")
+        self._loop.call_soon_threadsafe(self.touch, key, delay, window)
+
+    def cancel(self, key: str) -> bool:
+        """Descarta o flush agendado da chave (a entrada no heap vira obsoleta)."""
+        self._first_seen.pop(key, None)
+        return self._deadlines.pop(key, None) is not None
+
+    def keys(self) -> List[str]:
+        """Chaves com flush agendado."""
+        return list(self._deadlines)
+
+    def pending(self, key: str) -> bool:
+        """Indica se há um flush agendado para a chave."""
+        return key in self._deadlines
+
+    def __len__(self) -> int:
+        return len(self._deadlines)
+
+    # ----------------------------------------
+    # Loop interno
+    # ----------------------------------------
+
+    def _pop_due(self, now: float) -> List[str]:
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            deadline, _, key = heapq.heappop(self._heap)
+            # Entrada obsoleta (a chave foi tocada depois)
+            if self._deadlines.get(key) != deadline:
+                continue
+            del self._deadlines[key]
+            self._first_seen.pop(key, None)
+            due.append(key)
+        return due
+
+    async def _run(self) -> None:
+        while True:
+            now = time.monotonic()
+            for key in self._pop_due(now):
+                self._loop.create_task(self._flush(key))
+
+            self._wakeup.clear()
+            timeout = (self._heap[0][0] - now) if self._heap else None
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _flush(self, key: str) -> None:
+        try:
+            await self.on_flush(key)
+        except Exception as e:
+            logger.error(f"Erro no flush do buffer {key}: {e}")
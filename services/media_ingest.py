@@ -0,0 +1,223 @@
+"""
+Ingestão assíncrona de mídia (áudio, imagem e PDF)
+
+Download, transcrição e extração de PDF saem do caminho do webhook:
+o webhook responde na hora e o texto resolvido entra no buffer do
+telefone quando fica pronto. Cada telefone tem uma fila ordenada, então
+uma mensagem de texto enviada depois de um áudio continua depois dele.
+"""
+import asyncio
+import io
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, Optional
+
+import requests
+
+from config.settings import settings
+from config.logger import setup_logger
+from config.metrics import metrics
+from services.whatsapp_delivery import get_api_base_url, uaz_endpoint, uaz_headers
+
+try:
+    from pypdf import PdfReader
+except ImportError:
+    PdfReader = None
+
+logger = setup_logger(__name__)
+
+# on_ready(telefone, texto, agendar) -> chamado no event loop
+ReadyCallback = Callable[[str, str, bool], Awaitable[None]]
+# on_pending(telefone, delta) -> +1 ao receber a mensagem, -1 depois de bufferizada
+PendingCallback = Callable[[str, int], Awaitable[None]]
+
+
+# ============================================
+# Chamadas à UAZ API (bloqueantes, rodam no executor)
+# ============================================
+
+def get_media_url_uaz(message_id: str) -> Optional[str]:
+    if not message_id: return None
+    if not get_api_base_url(): return None
+    payload = {"id": message_id, "return_link": True, "return_base64": False}
+    try:
+        resp = requests.post(uaz_endpoint("/message/download"), headers=uaz_headers(), json=payload, timeout=15)
+        if resp.status_code == 200:
+            data = resp.json()
+            return data.get("fileURL") or data.get("url")
+    except Exception as e:
+        logger.error(f"Erro link mídia: {e}")
+    return None
+
+
+def process_pdf_uaz(message_id: str, url: Optional[str] = None) -> Optional[str]:
+    if not PdfReader: return "[PDF não suportado]"
+    url = url or get_media_url_uaz(message_id)
+    if not url: return None
+    try:
+        response = requests.get(url, timeout=20)
+        f = io.BytesIO(response.content)
+        reader = PdfReader(f)
+        text = "\n".join([p.extract_text() for p in reader.pages])
+        return re.sub(r'\s+', ' ', text).strip()
+    except Exception:
+        return None
+
+
+def transcribe_audio_uaz(message_id: str) -> Optional[str]:
+    if not message_id: return None
+    if not get_api_base_url(): return None
+    payload = {"id": message_id, "transcribe": True, "return_link": False, "openai_apikey": settings.openai_api_key}
+    try:
+        resp = requests.post(uaz_endpoint("/message/download"), headers=uaz_headers(), json=payload, timeout=25)
+        if resp.status_code == 200:
+            return resp.json().get("transcription")
+    except: pass
+    return None
+
+
+def needs_media(message_type: str, texto: Optional[str], mimetype: str = "") -> bool:
+    """Indica se a mensagem depende de download/transcrição para virar texto."""
+    if message_type == "audio":
+        return not texto
+    if message_type == "image":
+        return True
+    return message_type == "document" and "pdf" in (mimetype or "")
+
+
+def resolve_media_text(message_type: str, message_id: str, texto: Optional[str], mimetype: str = "") -> str:
+    """Converte a mídia recebida no texto que vai para o buffer do agente."""
+    if message_type == "audio":
+        trans = transcribe_audio_uaz(message_id)
+        return f"[Áudio]: {trans}" if trans else "[Áudio inaudível]"
+    if message_type == "image":
+        url = get_media_url_uaz(message_id)
+        caption = texto or ""
+        return f"{caption} [MEDIA_URL: {url}]" if url else f"{caption} [Imagem]"
+    if message_type == "document" and "pdf" in (mimetype or ""):
+        url = get_media_url_uaz(message_id)
+        text = process_pdf_uaz(message_id, url=url) or ""
+        return f"PDF Recebido. {text[:1000]} [MEDIA_URL: {url}]" if url else "[PDF]"
+    return texto or ""
+
+
+# ============================================
+# Ingestor
+# ============================================
+
+@dataclass
+class MediaJob:
+    """Mensagem aguardando resolução (mídia) ou ordenação (texto atrás de mídia)."""
+    telefone: str
+    message_type: str
+    message_id: Optional[str] = None
+    texto: Optional[str] = None
+    mimetype: str = ""
+    agendar: bool = True  # False durante cooldown: só empilha no buffer
+    enqueued_at: float = field(default_factory=time.monotonic)
+
+    @property
+    def is_media(self) -> bool:
+        return needs_media(self.message_type, self.texto, self.mimetype)
+
+
+class MediaIngestor:
+    """
+    Estágio de ingestão de mídia.
+
+    - `await submit(job)` só enfileira (não espera a mídia) e roda no event loop.
+    - Um executor dedicado (`concurrency` threads) limita downloads simultâneos.
+    - `has_pending(telefone)` permite adiar o flush do buffer enquanto houver
+      mídia do telefone em processamento (até o texto estar no buffer).
+    - `on_pending` espelha essa contagem fora do processo (ex.: Redis no modo
+      stream, em que o flush roda no worker).
+    """
+
+    def __init__(self, on_ready: ReadyCallback, concurrency: int = 4, lane_idle_seconds: float = 30.0,
+                 on_pending: Optional[PendingCallback] = None):
+        self.on_ready = on_ready
+        self.on_pending = on_pending
+        self.concurrency = max(1, concurrency)
+        self.lane_idle_seconds = lane_idle_seconds
+
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lanes: Dict[str, asyncio.Queue] = {}
+        self._pending: Dict[str, int] = {}
+
+    def start(self) -> None:
+        if self._executor is not None:
+            return
+        self._executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="media")
+        logger.info(f"🎧 Ingestão de mídia iniciada (concorrência={self.concurrency})")
+
+    async def stop(self) -> None:
+        if self._executor:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    async def submit(self, job: MediaJob) -> None:
+        if self._executor is None:
+            raise RuntimeError("MediaIngestor não iniciado")
+        lane = self._lanes.get(job.telefone)
+        if lane is None:
+            lane = self._lanes[job.telefone] = asyncio.Queue()
+            asyncio.get_running_loop().create_task(self._run_lane(job.telefone, lane))
+        self._pending[job.telefone] = self._pending.get(job.telefone, 0) + 1
+        lane.put_nowait(job)
+        metrics.incr(f"media.submitted.{job.message_type}")
+        metrics.set_gauge("media.pending", sum(self._pending.values()))
+        # Enfileira antes de aguardar: a ordem das mensagens do telefone não depende do Redis
+        if self.on_pending:
+            await self.on_pending(job.telefone, 1)
+
+    def has_pending(self, telefone: str) -> bool:
+        return self._pending.get(telefone, 0) > 0
+
+    async def _run_lane(self, telefone: str, lane: asyncio.Queue) -> None:
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                try:
+                    job = await asyncio.wait_for(lane.get(), timeout=self.lane_idle_seconds)
+                except asyncio.TimeoutError:
+                    if lane.empty():
+                        return
+                    continue
+
+                texto = job.texto or ""
+                if job.is_media:
+                    started = time.monotonic()
+                    try:
+                        texto = await loop.run_in_executor(
+                            self._executor, resolve_media_text,
+                            job.message_type, job.message_id, job.texto, job.mimetype,
+                        )
+                    except Exception as e:
+                        metrics.incr(f"media.failed.{job.message_type}")
+                        logger.error(f"Erro ao processar mídia de {telefone}: {e}")
+                    metrics.observe(f"media.resolve_seconds.{job.message_type}", time.monotonic() - started)
+                metrics.observe("media.total_seconds", time.monotonic() - job.enqueued_at)
+
+                try:
+                    if texto.strip():
+                        await self.on_ready(telefone, texto, job.agendar)
+                except Exception as e:
+                    logger.error(f"Erro ao bufferizar mídia de {telefone}: {e}")
+                finally:
+                    # Só deixa de contar depois que o texto está no buffer
+                    await self._settle(telefone)
+        finally:
+            self._lanes.pop(telefone, None)
+
+    async def _settle(self, telefone: str) -> None:
+        self._pending[telefone] -= 1
+        if self._pending[telefone] <= 0:
+            self._pending.pop(telefone, None)
+        metrics.set_gauge("media.pending", sum(self._pending.values()))
+        if self.on_pending:
+            try:
+                await self.on_pending(telefone, -1)
+            except Exception as e:
+                logger.error(f"Erro ao desmarcar mídia de {telefone}: {e}")
@@ -0,0 +1,313 @@
+"""
+Runtime de atendimento: buffer, pool do agente e entrega
+
+Compartilhado entre o servidor web (`server.py`) e os workers do modo
+stream (`worker.py`). Em `execution_mode=inline` tudo roda no processo
+web; em `stream` o web apenas bufferiza e publica eventos, e os workers
+fazem o debounce e executam o agente.
+"""
+import asyncio
+import random
+import re
+from typing import Optional
+
+from config.settings import settings
+from config.logger import setup_logger
+from config.metrics import metrics
+from agent_langgraph_simple import run_agent_langgraph as run_agent, arun_agent_langgraph as arun_agent, get_async_compaction_service
+from services.debounce import DebounceScheduler
+from services.buffer_window import build_window_policy
+from services.worker_pool import AgentWorkerPool
+from services.whatsapp_delivery import WhatsAppDeliveryEngine
+from services.media_ingest import MediaIngestor
+from services.stream_queue import apublish_buffer_event
+from memory.checkpointer import aclose_checkpointer
+from memory.db_pool import close_pools, close_async_pools
+from tools.http_client import close_async_client, close_session
+from tools.catalog import catalog_sync
+from tools.redis_tools import (
+    adecr_media_pending, ahas_media_pending, aincr_media_pending, apop_all_messages,
+    apush_message_to_buffer, close_async_redis_client, pop_all_messages,
+)
+
+logger = setup_logger(__name__)
+
+
+def is_stream_mode() -> bool:
+    return (settings.execution_mode or "inline").lower() == "stream"
+
+
+delivery_engine = WhatsAppDeliveryEngine(
+    timeout=settings.whatsapp_send_timeout,
+    max_connections=settings.whatsapp_max_connections,
+)
+
+def send_whatsapp_message(telefone: str, mensagem: str, first_delay: float = 0.0) -> bool:
+    """
+    Envia mensagem com suporte a pausas naturais (picotado).
+    Divide a mensagem onde houver quebra de linha dupla (\n\n).
+    As partes são enfileiradas no motor de entrega (não bloqueia o chamador).
+    """
+    return delivery_engine.send_text(telefone, mensagem, first_delay=first_delay)
+
+# --- Buffer & Process ---
+presence_sessions = {}
+# Telefones com turno do agente em andamento (evita dois turnos simultâneos)
+inflight_sessions = set()
+# Telefones que já receberam o aviso de sobrecarga e aguardam atendimento
+overload_notified = set()
+
+def send_presence(num, type_, delay: float = 0.0):
+    delivery_engine.send_presence(num, type_, delay=delay)
+
+def _segment_sender(tel: str, num: str):
+    """Callback de streaming: cada parte pronta vai para o motor de entrega."""
+    if not settings.agent_stream_output:
+        return None
+    sent = []
+
+    def on_segment(part: str):
+        if not sent:
+            send_presence(num, "paused")
+        delivery_engine.send_segment(tel, part, first=not sent)
+        sent.append(part)
+        # Continua "digitando" enquanto o agente termina o turno
+        send_presence(num, "composing")
+
+    return on_segment
+
+def _deliver_result(tel: str, num: str, res: dict):
+    # 3. Pausa antes de enviar
+    send_presence(num, "paused")
+    
+    # 4. Envia (picotado, na ordem, sem segurar o worker)
+    if not res.get("streamed"):
+        txt = res.get("output", "Erro no sistema.")
+        send_whatsapp_message(tel, txt, first_delay=0.5)
+
+def process_async(tel, msg):
+    num = re.sub(r"\D", "", tel)
+    try:
+        # 1. Delay leitura + Digitando... (timer no motor de entrega; a IA já começa)
+        send_presence(num, "composing", delay=random.uniform(1.5, 3.0))
+        
+        # 2. Processa IA (em streaming, cada parte sai assim que é gerada)
+        res = run_agent(tel, msg, on_segment=_segment_sender(tel, num))
+        _deliver_result(tel, num, res)
+
+    except Exception as e:
+        logger.error(f"Erro async: {e}")
+        send_presence(num, "paused")
+    finally:
+        presence_sessions.pop(num, None)
+
+async def aprocess_async(tel, msg):
+    """Mesmo fluxo de `process_async`, com o agente no event loop (AGENT_ASYNC)."""
+    num = re.sub(r"\D", "", tel)
+    try:
+        send_presence(num, "composing", delay=random.uniform(1.5, 3.0))
+        res = await arun_agent(tel, msg, on_segment=_segment_sender(tel, num))
+        _deliver_result(tel, num, res)
+
+    except Exception as e:
+        logger.error(f"Erro async: {e}")
+        send_presence(num, "paused")
+    finally:
+        presence_sessions.pop(num, None)
+
+def _join_buffer(msgs: list) -> str:
+    return " ".join([m for m in msgs if m.strip()])
+
+def _job_message(num: str, msg: Optional[str]) -> Optional[str]:
+    overload_notified.discard(num)
+    if msg is None:
+        msg = _join_buffer(pop_all_messages(num))
+    return msg
+
+def process_job(tel: str, msg: Optional[str] = None):
+    """
+    Turno executado pelo pool do agente.
+    Sem `msg`, consome o buffer do telefone e processa tudo como uma única mensagem.
+    """
+    msg = _job_message(re.sub(r"\D", "", tel), msg)
+    if msg:
+        process_async(tel, msg)
+
+async def aprocess_job(tel: str, msg: Optional[str] = None):
+    """Versão asyncio de `process_job` (o pool aguarda direto, sem thread; buffer via redis.asyncio)."""
+    num = re.sub(r"\D", "", tel)
+    overload_notified.discard(num)
+    if msg is None:
+        msg = _join_buffer(await apop_all_messages(num))
+    if msg:
+        await aprocess_async(tel, msg)
+
+agent_pool = AgentWorkerPool(
+    aprocess_job if settings.agent_async else process_job,
+    workers=settings.agent_workers,
+    queue_size=settings.agent_queue_size,
+)
+
+async def handle_overload(num: str, msg: Optional[str] = None):
+    """
+    Política de sobrecarga quando a fila do agente está cheia:
+    - reply: avisa o cliente (uma vez) e reagenda o buffer
+    - defer: apenas reagenda o buffer
+    - reject: descarta o turno
+    Mensagens que não estão no buffer (`msg`) não podem ser reagendadas.
+    """
+    policy = (settings.agent_overload_policy or "defer").lower()
+    metrics.incr(f"agent_pool.overload.{policy}")
+
+    if policy == "reject":
+        if msg is None:
+            await asyncio.to_thread(pop_all_messages, num)
+        logger.warning(f"🚦 Turno de {num} descartado por sobrecarga")
+        return
+
+    if policy == "reply" and num not in overload_notified:
+        overload_notified.add(num)
+        send_whatsapp_message(num, settings.agent_overload_message)
+
+    if msg is None:
+        buffer_scheduler.touch(num, delay=settings.agent_overload_retry_seconds)
+
+async def flush_buffer(num: str) -> Optional[asyncio.Future]:
+    """
+    Chamado pelo debounce quando a janela de silêncio do telefone expira.
+    Enfileira o turno no pool; o buffer só é consumido quando um worker o assume.
+    Retorna o Future do turno, ou None se nada foi enfileirado.
+    """
+    if media_ingestor.has_pending(num) or (is_stream_mode() and await ahas_media_pending(num)):
+        # Mídia ainda em processamento (neste processo ou, no modo stream, no web):
+        # tenta de novo na próxima janela. Não depende da ingestão rearmar o flush
+        # (em cooldown ela só empilha e o texto ficaria parado)
+        metrics.incr("buffer.flush_deferred_media")
+        buffer_scheduler.touch(num)
+        return None
+
+    if num in inflight_sessions:
+        # Turno anterior ainda em andamento: tenta de novo na próxima janela
+        buffer_scheduler.touch(num)
+        return None
+
+    future = agent_pool.submit(num)
+    if future is None:
+        await handle_overload(num)
+        return None
+
+    inflight_sessions.add(num)
+    future.add_done_callback(lambda _: inflight_sessions.discard(num))
+    return future
+
+buffer_scheduler = DebounceScheduler(
+    flush_buffer,
+    window_seconds=settings.buffer_window_seconds,
+    max_wait_seconds=settings.buffer_max_wait_seconds,
+)
+
+window_policy = build_window_policy()
+
+async def touch_buffer(num: str):
+    """Nova mensagem no buffer: reinicia a janela (adaptativa, se ligada)."""
+    window = await window_policy.aobserve(num) if window_policy else None
+    buffer_scheduler.touch(num, window=window)
+
+def buffer_ttl_seconds() -> int:
+    """
+    TTL do buffer (renovado a cada mensagem). No modo stream cobre a
+    recuperação de uma partição órfã: lease expirado, heartbeat vencido
+    (2x lease), reivindicação pelo novo dono e a janela máxima do debounce.
+    """
+    ttl = settings.buffer_ttl_seconds
+    if is_stream_mode():
+        recovery = 3 * settings.stream_lease_seconds + settings.buffer_max_wait_seconds
+        ttl = max(ttl, int(2 * recovery))
+    return ttl
+
+async def buffer_incoming(num: str, txt: str, agendar: bool = True):
+    """
+    Empilha a mensagem (já em texto) no buffer do telefone e reinicia a janela.
+    Com `agendar=False` (cooldown) apenas empilha.
+    """
+    if is_stream_mode():
+        # Web tier: o buffer fica no Redis e o worker dono da partição faz o debounce
+        if await apush_message_to_buffer(num, txt, buffer_ttl_seconds()):
+            if agendar:
+                await apublish_buffer_event(num)
+        elif agendar:
+            await apublish_buffer_event(num, txt)
+        return
+
+    if await apush_message_to_buffer(num, txt, buffer_ttl_seconds()):
+        if agendar:
+            presence_sessions[num] = True
+            await touch_buffer(num)
+    elif agendar and agent_pool.submit(num, txt) is None:
+        await handle_overload(num, txt)
+
+async def track_media_pending(num: str, delta: int):
+    """No modo stream, espelha no Redis a mídia pendente do web para o flush do worker."""
+    if not is_stream_mode():
+        return
+    if delta > 0:
+        await aincr_media_pending(num, settings.media_pending_ttl_seconds)
+    else:
+        await adecr_media_pending(num)
+
+media_ingestor = MediaIngestor(
+    buffer_incoming,
+    concurrency=settings.media_concurrency,
+    on_pending=track_media_pending,
+)
+
+
+async def start_web():
+    """Componentes do processo web (em modo stream, o agente roda nos workers)."""
+    delivery_engine.start()
+    media_ingestor.start()
+    if not is_stream_mode():
+        agent_pool.start()
+        buffer_scheduler.start()
+        if settings.catalog_enabled:
+            catalog_sync.start()
+
+
+async def stop_web():
+    await buffer_scheduler.stop()
+    await agent_pool.stop()
+    await media_ingestor.stop()
+    await delivery_engine.stop()
+    await asyncio.to_thread(catalog_sync.stop)
+    close_session()
+    if settings.agent_async:
+        await get_async_compaction_service().stop()
+        await aclose_checkpointer()
+    close_pools()
+    await close_async_pools()
+    await close_async_client()
+    await close_async_redis_client()
+
+
+async def start_worker():
+    """Componentes de um processo worker (modo stream)."""
+    delivery_engine.start()
+    agent_pool.start()
+    buffer_scheduler.start()
+    if settings.catalog_enabled:
+        catalog_sync.start()
+
+
+async def stop_worker():
+    await buffer_scheduler.stop()
+    await agent_pool.stop()
+    await delivery_engine.stop()
+    await asyncio.to_thread(catalog_sync.stop)
+    close_session()
+    if settings.agent_async:
+        await get_async_compaction_service().stop()
+        await aclose_checkpointer()
+    close_pools()
+    await close_async_pools()
+    await close_async_client()
+    await close_async_redis_client()
@@ -0,0 +1,322 @@
+"""
+Fila durável em Redis Streams (modo web + workers)
+
+No modo `stream` o servidor web apenas empilha a mensagem no buffer
+(`msgbuf:{telefone}`) e publica um evento "telefone com mensagens novas"
+numa partição do stream. Processos worker consomem as partições via
+consumer group, fazem o debounce e executam o agente.
+
+- Partição = crc32(telefone) % N: um telefone sempre cai na mesma partição.
+- Cada partição tem um único dono por vez (lease em Redis com renovação),
+  o que garante a ordem por telefone mesmo com vários workers.
+- Os eventos só recebem ACK depois que o turno que os consumiu termina;
+  ao assumir uma partição, o worker reivindica (XAUTOCLAIM) os pendentes
+  do dono anterior. Eventos são idempotentes: reprocessar só reagenda um
+  flush, e um buffer vazio não gera turno.
+- As partições são divididas igualmente entre os workers vivos (heartbeat).
+- Ao perder/devolver uma partição, `on_partition_lost` descarta o estado
+  local dela (timers de debounce, ACKs pendentes); o novo dono reivindica
+  os eventos sem ACK e refaz o debounce a partir do buffer no Redis.
+"""
+import asyncio
+import math
+import os
+import socket
+import time
+import zlib
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+import redis
+import redis.asyncio as aioredis
+
+from config.settings import settings
+from config.logger import setup_logger
+from config.metrics import metrics
+from tools.redis_tools import get_async_redis_client, get_redis_client
+
+logger = setup_logger(__name__)
+
+# on_entry(telefone, texto_opcional, (particao, entry_id))
+EntryCallback = Callable[[str, Optional[str], Tuple[int, str]], Awaitable[None]]
+# on_partition_lost(particao): lease perdido ou devolvido
+PartitionCallback = Callable[[int], Awaitable[None]]
+
+# Renova o lease somente se ainda for o dono
+_RENEW_LEASE = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('pexpire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+# Libera o lease somente se ainda for o dono
+_RELEASE_LEASE = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+def partition_for(telefone: str, partitions: Optional[int] = None) -> int:
+    partitions = partitions or settings.stream_partitions
+    return zlib.crc32(telefone.encode("utf-8")) % partitions
+
+
+def stream_key(partition: int) -> str:
+    return f"{settings.stream_prefix}:{partition}"
+
+
+def lease_key(partition: int) -> str:
+    return f"{settings.stream_prefix}:lease:{partition}"
+
+
+def workers_key() -> str:
+    return f"{settings.stream_prefix}:workers"
+
+
+def _event_fields(telefone: str, texto: Optional[str]) -> Dict[str, str]:
+    fields = {"telefone": telefone}
+    if texto:
+        fields["texto"] = texto
+    return fields
+
+
+def publish_buffer_event(telefone: str, texto: Optional[str] = None) -> bool:
+    """
+    Publica (lado web) o evento de mensagens novas para o telefone.
+    `texto` só é enviado quando a mensagem não pôde ir para o buffer.
+    """
+    client = get_redis_client()
+    if client is None:
+        return False
+    try:
+        client.xadd(
+            stream_key(partition_for(telefone)),
+            _event_fields(telefone, texto),
+            maxlen=settings.stream_maxlen,
+            approximate=True,
+        )
+        metrics.incr("stream.published")
+        return True
+    except redis.exceptions.RedisError as e:
+        logger.error(f"Erro ao publicar evento no stream: {e}")
+        return False
+
+
+async def apublish_buffer_event(telefone: str, texto: Optional[str] = None) -> bool:
+    """Versão async de `publish_buffer_event` (usada no webhook, sem bloquear o event loop)."""
+    client = await get_async_redis_client()
+    if client is None:
+        return False
+    try:
+        await client.xadd(
+            stream_key(partition_for(telefone)),
+            _event_fields(telefone, texto),
+            maxlen=settings.stream_maxlen,
+            approximate=True,
+        )
+        metrics.incr("stream.published")
+        return True
+    except redis.exceptions.RedisError as e:
+        logger.error(f"Erro ao publicar evento no stream: {e}")
+        return False
+
+
+class StreamConsumer:
+    """Consumidor de partições (lado worker)."""
+
+    def __init__(
+        self,
+        on_entry: EntryCallback,
+        partitions: Optional[int] = None,
+        group: Optional[str] = None,
+        consumer: Optional[str] = None,
+        lease_seconds: Optional[int] = None,
+        block_ms: int = 1000,
+        on_partition_lost: Optional[PartitionCallback] = None,
+    ):
+        self.on_entry = on_entry
+        self.on_partition_lost = on_partition_lost
+        self.partitions = partitions or settings.stream_partitions
+        self.group = group or settings.stream_group
+        self.consumer = consumer or f"{socket.gethostname()}-{os.getpid()}"
+        self.lease_seconds = lease_seconds or settings.stream_lease_seconds
+        self.block_ms = block_ms
+
+        self._client: Optional[aioredis.Redis] = None
+        self._owned: Set[int] = set()
+        self._task: Optional[asyncio.Task] = None
+        self._last_refresh = 0.0
+
+    # ----------------------------------------
+    # Ciclo de vida
+    # ----------------------------------------
+
+    async def start(self) -> None:
+        self._client = aioredis.Redis(
+            host=settings.redis_host,
+            port=settings.redis_port,
+            db=settings.redis_db,
+            password=settings.redis_password if settings.redis_password else None,
+            decode_responses=True,
+        )
+        for p in range(self.partitions):
+            try:
+                await self._client.xgroup_create(stream_key(p), self.group, id="0", mkstream=True)
+            except redis.exceptions.ResponseError as e:
+                if "BUSYGROUP" not in str(e):
+                    raise
+        self._task = asyncio.get_running_loop().create_task(self._run())
+        logger.info(f"📥 Consumidor de stream iniciado ({self.consumer}, partições={self.partitions})")
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._client:
+            for p in list(self._owned):
+                await self._release(p)
+            await self._client.zrem(workers_key(), self.consumer)
+            await self._client.aclose()
+            self._client = None
+
+    async def ack(self, entries: List[Tuple[int, str]]) -> None:
+        """Confirma (XACK) eventos já atendidos."""
+        if not entries or self._client is None:
+            return
+        by_partition: Dict[int, List[str]] = {}
+        for partition, entry_id in entries:
+            by_partition.setdefault(partition, []).append(entry_id)
+        try:
+            for partition, ids in by_partition.items():
+                await self._client.xack(stream_key(partition), self.group, *ids)
+            metrics.incr("stream.acked", len(entries))
+        except redis.exceptions.RedisError as e:
+            logger.error(f"Erro ao confirmar eventos do stream: {e}")
+
+    @property
+    def owned_partitions(self) -> Set[int]:
+        return set(self._owned)
+
+    async def holds_lease(self, partition: int) -> bool:
+        """Confere no Redis se o lease da partição ainda é deste worker."""
+        if partition not in self._owned or self._client is None:
+            return False
+        try:
+            return await self._client.get(lease_key(partition)) == self.consumer
+        except redis.exceptions.RedisError as e:
+            logger.error(f"Erro ao conferir lease da partição {partition}: {e}")
+            return False
+
+    # ----------------------------------------
+    # Loop
+    # ----------------------------------------
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                if time.monotonic() - self._last_refresh >= self.lease_seconds / 3:
+                    await self._refresh_leases()
+
+                if not self._owned:
+                    await asyncio.sleep(1)
+                    continue
+
+                streams = {stream_key(p): ">" for p in sorted(self._owned)}
+                resp = await self._client.xreadgroup(
+                    self.group, self.consumer, streams, count=100, block=self.block_ms
+                )
+                for stream, entries in resp or []:
+                    partition = int(stream.rsplit(":", 1)[1])
+                    await self._dispatch(partition, entries)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Erro no consumidor de stream: {e}")
+                await asyncio.sleep(1)
+
+    async def _dispatch(self, partition: int, entries) -> None:
+        for entry_id, fields in entries:
+            if not fields:
+                # Entrada removida pelo MAXLEN: nada a fazer além do ACK
+                await self.ack([(partition, entry_id)])
+                continue
+            metrics.incr("stream.consumed")
+            await self.on_entry(fields.get("telefone", ""), fields.get("texto"), (partition, entry_id))
+
+    # ----------------------------------------
+    # Leases
+    # ----------------------------------------
+
+    async def _refresh_leases(self) -> None:
+        self._last_refresh = time.monotonic()
+        lease_ms = self.lease_seconds * 1000
+        now = time.time()
+
+        # Heartbeat e workers vivos -> cota justa de partições
+        await self._client.zadd(workers_key(), {self.consumer: now})
+        await self._client.zremrangebyscore(workers_key(), 0, now - 2 * self.lease_seconds)
+        live = max(1, await self._client.zcard(workers_key()))
+        fair_share = math.ceil(self.partitions / live)
+
+        # Renova o que é nosso
+        for p in list(self._owned):
+            renewed = await self._client.eval(_RENEW_LEASE, 1, lease_key(p), self.consumer, lease_ms)
+            if not renewed:
+                self._owned.discard(p)
+                metrics.incr("stream.lease_lost")
+                logger.warning(f"Lease da partição {p} perdido")
+                await self._lost(p)
+
+        # Devolve o excedente (novo worker entrou)
+        while len(self._owned) > fair_share:
+            await self._release(max(self._owned))
+
+        # Assume partições livres até a cota
+        for p in range(self.partitions):
+            if len(self._owned) >= fair_share:
+                break
+            if p in self._owned:
+                continue
+            if await self._client.set(lease_key(p), self.consumer, nx=True, px=lease_ms):
+                self._owned.add(p)
+                logger.info(f"Partição {p} assumida por {self.consumer}")
+                await self._reclaim(p)
+
+        metrics.set_gauge("stream.owned_partitions", len(self._owned))
+
+    async def _release(self, partition: int) -> None:
+        self._owned.discard(partition)
+        await self._lost(partition)
+        try:
+            await self._client.eval(_RELEASE_LEASE, 1, lease_key(partition), self.consumer)
+        except redis.exceptions.RedisError as e:
+            logger.error(f"Erro ao liberar partição {partition}: {e}")
+
+    async def _lost(self, partition: int) -> None:
+        if self.on_partition_lost is None:
+            return
+        try:
+            await self.on_partition_lost(partition)
+        except Exception as e:
+            logger.error(f"Erro ao descartar estado da partição {partition}: {e}")
+
+    async def _reclaim(self, partition: int) -> None:
+        """Reivindica os eventos pendentes (sem ACK) deixados pelo dono anterior."""
+        start_id = "0-0"
+        while True:
+            resp = await self._client.xautoclaim(
+                stream_key(partition), self.group, self.consumer,
+                min_idle_time=0, start_id=start_id, count=100,
+            )
+            start_id, entries = resp[0], resp[1]
+            if entries:
+                metrics.incr("stream.reclaimed", len(entries))
+                await self._dispatch(partition, entries)
+            if not entries or start_id == "0-0":
+                break
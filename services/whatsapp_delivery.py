@@ -0,0 +1,230 @@
+"""
+Motor de entrega de mensagens WhatsApp (UAZ API)
+
+Cliente HTTP assíncrono com conexões keep-alive reaproveitadas.
+Cada telefone tem uma fila própria ("lane"): as partes de uma resposta
+e os sinais de presença saem na ordem em que foram enfileirados, e as
+pausas de humanização são timers no event loop, não `time.sleep`.
+"""
+import asyncio
+import re
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+from urllib.parse import urlparse
+
+import httpx
+
+from config.settings import settings
+from config.logger import setup_logger
+from config.metrics import metrics
+
+logger = setup_logger(__name__)
+
+
+def get_api_base_url() -> str:
+    return (settings.uaz_api_url or settings.whatsapp_api_url or "").strip().rstrip("/")
+
+
+def uaz_endpoint(path: str) -> str:
+    """Monta a URL de um endpoint na raiz do host da UAZ API."""
+    base = get_api_base_url()
+    try:
+        parsed = urlparse(base)
+        return f"{parsed.scheme}://{parsed.netloc}{path}"
+    except Exception:
+        return f"{base.split('/message')[0]}{path}"
+
+
+def uaz_headers() -> Dict[str, str]:
+    return {"Content-Type": "application/json", "token": (settings.whatsapp_token or "").strip()}
+
+
+def split_message_parts(mensagem: str) -> List[str]:
+    """LÓGICA DE PICOTAR: divide por \\n\\n e remove partes vazias."""
+    return [m.strip() for m in (mensagem or "").split("\n\n") if m.strip()]
+
+
+def reading_pause(texto: str) -> float:
+    """Pausa de humanização após uma parte: 1.5s a 4s conforme o tamanho do texto."""
+    return min(1.5 + (len(texto) / 45), 4.0)
+
+
+@dataclass
+class _Delivery:
+    kind: str  # "text" | "presence"
+    number: str
+    value: str
+    delay: Optional[float] = 0.0  # None = pausa conforme a parte anterior
+
+
+class WhatsAppDeliveryEngine:
+    """
+    Entrega assíncrona e ordenada por telefone.
+
+    Os métodos públicos podem ser chamados tanto do event loop quanto de
+    threads (workers do agente): nesse caso a entrega é repassada ao loop
+    com `call_soon_threadsafe` e a thread segue sem bloquear.
+    """
+
+    def __init__(self, timeout: float = 10.0, max_connections: int = 20, lane_idle_seconds: float = 30.0):
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.lane_idle_seconds = lane_idle_seconds
+
+        self._client: Optional[httpx.AsyncClient] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lanes: Dict[str, asyncio.Queue] = {}
+        # Última parte de texto enviada por telefone (para a próxima pausa)
+        self._last_part: Dict[str, str] = {}
+
+    # ----------------------------------------
+    # Ciclo de vida
+    # ----------------------------------------
+
+    def start(self) -> None:
+        if self._client is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._client = httpx.AsyncClient(
+            timeout=self.timeout,
+            limits=httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_connections,
+            ),
+        )
+        logger.info(f"📤 Motor de entrega WhatsApp iniciado (conexões={self.max_connections})")
+
+    async def stop(self) -> None:
+        if self._client is None:
+            return
+        await self._client.aclose()
+        self._client = None
+
+    # ----------------------------------------
+    # API
+    # ----------------------------------------
+
+    def send_text(self, telefone: str, mensagem: str, first_delay: float = 0.0) -> bool:
+        """
+        Enfileira uma resposta picotada em partes (\\n\\n) com pausas naturais.
+        Retorna False se não houver URL configurada ou o motor não estiver ativo.
+        """
+        if not get_api_base_url() or self._loop is None:
+            return False
+        parts = split_message_parts(mensagem)
+        if not parts:
+            return True
+        number = re.sub(r"\D", "", telefone or "")
+        for i, part in enumerate(parts):
+            delay = first_delay if i == 0 else reading_pause(parts[i - 1])
+            self._submit(_Delivery("text", number, part, delay))
+        return True
+
+    def send_segment(self, telefone: str, texto: str, first: bool = False) -> bool:
+        """
+        Enfileira uma parte isolada (saída em streaming).
+        A pausa antes dela é calculada a partir da parte anterior do mesmo telefone.
+        """
+        if not get_api_base_url() or self._loop is None:
+            return False
+        texto = (texto or "").strip()
+        if not texto:
+            return True
+        number = re.sub(r"\D", "", telefone or "")
+        self._submit(_Delivery("text", number, texto, 0.0 if first else None))
+        return True
+
+    def send_presence(self, telefone: str, presence: str, delay: float = 0.0) -> bool:
+        """Enfileira um sinal de presença ("composing", "paused"...)."""
+        if self._loop is None:
+            return False
+        number = re.sub(r"\D", "", telefone or "")
+        self._submit(_Delivery("presence", number, presence, delay))
+        return True
+
+    # ----------------------------------------
+    # Filas por telefone
+    # ----------------------------------------
+
+    def _submit(self, delivery: _Delivery) -> None:
+        if self._in_loop_thread():
+            self._enqueue(delivery)
+        else:
+            self._loop.call_soon_threadsafe(self._enqueue, delivery)
+
+    def _in_loop_thread(self) -> bool:
+        try:
+            return asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            return False
+
+    def _enqueue(self, delivery: _Delivery) -> None:
+        lane = self._lanes.get(delivery.number)
+        if lane is None:
+            lane = self._lanes[delivery.number] = asyncio.Queue()
+            self._loop.create_task(self._run_lane(delivery.number, lane))
+        lane.put_nowait(delivery)
+        metrics.set_gauge("whatsapp.lanes", len(self._lanes))
+
+    async def _run_lane(self, number: str, lane: asyncio.Queue) -> None:
+        try:
+            while True:
+                try:
+                    delivery = await asyncio.wait_for(lane.get(), timeout=self.lane_idle_seconds)
+                except asyncio.TimeoutError:
+                    if lane.empty():
+                        return
+                    continue
+
+                delay = delivery.delay
+                if delay is None:
+                    # Parte em streaming: pausa proporcional à parte anterior
+                    prev = self._last_part.get(number)
+                    delay = reading_pause(prev) if prev else 0.0
+                if delay > 0:
+                    await asyncio.sleep(delay)
+
+                if delivery.kind == "text":
+                    await self._post_text(delivery)
+                    self._last_part[number] = delivery.value
+                else:
+                    await self._post_presence(delivery)
+        finally:
+            self._lanes.pop(number, None)
+            self._last_part.pop(number, None)
+            metrics.set_gauge("whatsapp.lanes", len(self._lanes))
+
+    # ----------------------------------------
+    # HTTP
+    # ----------------------------------------
+
+    async def _post(
+        self,
+        metric: str,
+        url: str,
+        headers: Dict[str, str],
+        payload: Dict[str, str],
+        timeout: Optional[float] = None,
+    ) -> bool:
+        started = time.monotonic()
+        try:
+            resp = await self._client.post(url, headers=headers, json=payload, timeout=timeout or self.timeout)
+            ok = resp.status_code < 400
+            if not ok:
+                logger.error(f"Erro envio ({metric}): HTTP {resp.status_code}")
+        except Exception as e:
+            ok = False
+            logger.error(f"Erro envio ({metric}): {e}")
+        metrics.observe(f"whatsapp.{metric}_seconds", time.monotonic() - started)
+        metrics.incr(f"whatsapp.{metric}.{'ok' if ok else 'failed'}")
+        return ok
+
+    async def _post_text(self, delivery: _Delivery) -> bool:
+        payload = {"number": delivery.number, "text": delivery.value, "openTicket": "1"}
+        return await self._post("send", uaz_endpoint("/send/text"), uaz_headers(), payload)
+
+    async def _post_presence(self, delivery: _Delivery) -> bool:
+        url = f"{get_api_base_url()}/message/presence"
+        payload = {"number": delivery.number, "presence": delivery.value}
+        return await self._post("presence", url, {"token": settings.whatsapp_token}, payload, timeout=3)
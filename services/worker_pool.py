@@ -0,0 +1,140 @@
+"""
+Pool limitado de workers para execução do agente
+
+Número fixo de workers e fila limitada: em rajadas (ex: disparo de
+promoção) a vazão estabiliza no número de workers em vez de abrir
+centenas de chamadas simultâneas ao LLM.
+"""
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, List, Optional, Union
+
+from config.logger import setup_logger
+from config.metrics import metrics
+
+logger = setup_logger(__name__)
+
+# Handler síncrono (roda numa thread do pool) ou corrotina (roda no event loop)
+JobHandler = Callable[[str, Optional[str]], Union[None, Awaitable[None]]]
+
+
+@dataclass
+class AgentJob:
+    """Um turno do agente aguardando execução."""
+    telefone: str
+    mensagem: Optional[str] = None  # None = consumir o buffer do telefone
+    enqueued_at: float = field(default_factory=time.monotonic)
+    future: Optional[asyncio.Future] = None
+
+
+class AgentWorkerPool:
+    """
+    Executor do agente com backpressure.
+
+    - `workers` threads dedicadas executam `handler(telefone, mensagem)`;
+      se o handler for uma corrotina, os workers o aguardam direto no
+      event loop (sem threads).
+    - A fila aceita no máximo `queue_size` turnos; acima disso `submit`
+      retorna None e o chamador aplica a política de sobrecarga.
+    - Métricas: profundidade da fila, tempo de espera, workers ativos,
+      duração dos turnos e rejeições.
+    """
+
+    def __init__(self, handler: JobHandler, workers: int = 8, queue_size: int = 100):
+        self.handler = handler
+        self.workers = max(1, workers)
+        self.queue_size = max(1, queue_size)
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._tasks: List[asyncio.Task] = []
+        self._active = 0
+
+    # ----------------------------------------
+    # Ciclo de vida
+    # ----------------------------------------
+
+    def start(self) -> None:
+        """Inicia os workers no event loop atual."""
+        if self._tasks:
+            return
+        loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        if not asyncio.iscoroutinefunction(self.handler):
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="agent")
+        self._tasks = [loop.create_task(self._worker()) for _ in range(self.workers)]
+        logger.info(f"👷 Pool do agente iniciado (workers={self.workers}, fila={self.queue_size})")
+
+    async def stop(self) -> None:
+        """Cancela os workers; turnos já em execução terminam na thread."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._executor:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    # ----------------------------------------
+    # API
+    # ----------------------------------------
+
+    def submit(self, telefone: str, mensagem: Optional[str] = None) -> Optional[asyncio.Future]:
+        """
+        Enfileira um turno. Retorna um Future resolvido ao fim do turno,
+        ou None se a fila estiver cheia (sobrecarga).
+        """
+        if self._queue is None:
+            raise RuntimeError("AgentWorkerPool não iniciado")
+
+        job = AgentJob(telefone, mensagem, future=asyncio.get_running_loop().create_future())
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            metrics.incr("agent_pool.rejected")
+            logger.warning(f"🚦 Fila do agente cheia ({self.queue_size}); turno de {telefone} não aceito")
+            return None
+
+        metrics.incr("agent_pool.submitted")
+        metrics.set_gauge("agent_pool.queue_depth", self._queue.qsize())
+        return job.future
+
+    def is_full(self) -> bool:
+        return self._queue is not None and self._queue.full()
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize() if self._queue else 0
+
+    # ----------------------------------------
+    # Worker
+    # ----------------------------------------
+
+    async def _worker(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            job = await self._queue.get()
+            metrics.set_gauge("agent_pool.queue_depth", self._queue.qsize())
+            metrics.observe("agent_pool.wait_seconds", time.monotonic() - job.enqueued_at)
+
+            self._active += 1
+            metrics.set_gauge("agent_pool.active", self._active)
+            started = time.monotonic()
+            try:
+                if self._executor is None:
+                    await self.handler(job.telefone, job.mensagem)
+                else:
+                    await loop.run_in_executor(self._executor, self.handler, job.telefone, job.mensagem)
+                metrics.incr("agent_pool.completed")
+            except Exception as e:
+                metrics.incr("agent_pool.failed")
+                logger.error(f"Erro no worker do agente ({job.telefone}): {e}")
+            finally:
+                self._active -= 1
+                metrics.set_gauge("agent_pool.active", self._active)
+                metrics.observe("agent_pool.run_seconds", time.monotonic() - started)
+                if job.future and not job.future.done():
+                    job.future.set_result(None)
+                self._queue.task_done()
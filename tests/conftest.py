@@ -0,0 +1,12 @@
+"""
+Testes unitários (sem Redis, Postgres ou APIs externas).
+
+Uso: python -m pytest -q tests
+
+Os test_*.py da raiz são roteiros manuais contra os serviços reais e ficam
+fora desta suíte.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
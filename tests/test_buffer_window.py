@@ -0,0 +1,82 @@
+"""AdaptiveWindowPolicy: buckets de intervalo, percentil e decaimento (sem Redis)."""
+import pytest
+
+from services.buffer_window import GAP_BUCKETS, AdaptiveWindowPolicy
+
+
+def _counts(**buckets) -> list:
+    """Contadores por limite superior do bucket, ex: _counts(**{"2.0": 5})."""
+    counts = [0] * len(GAP_BUCKETS)
+    for upper, n in buckets.items():
+        counts[GAP_BUCKETS.index(float(upper))] = n
+    return counts
+
+
+def _policy(**kwargs) -> AdaptiveWindowPolicy:
+    params = dict(default_seconds=4.0, min_seconds=1.5, max_seconds=12.0, percentile=0.9, min_samples=3)
+    params.update(kwargs)
+    return AdaptiveWindowPolicy(**params)
+
+
+def test_poucas_amostras_usa_janela_padrao():
+    assert _policy().window_from_counts(_counts(**{"1.0": 2})) == 4.0
+
+
+def test_janela_no_percentil():
+    counts = _counts(**{"2.0": 9, "10.0": 1})
+    assert _policy().window_from_counts(counts) == 2.0
+    assert _policy(percentile=0.95).window_from_counts(counts) == 10.0
+
+
+def test_janela_limitada_por_min_e_max():
+    assert _policy().window_from_counts(_counts(**{"0.5": 10})) == 1.5
+    assert _policy().window_from_counts(_counts(**{"45.0": 10})) == 12.0
+
+
+def test_update_grava_o_bucket_do_intervalo():
+    policy = _policy()
+    updates, window = policy.update({"last": "100.0"}, 102.2)
+
+    assert updates["last"] == 102.2
+    assert updates[f"b{GAP_BUCKETS.index(2.5)}"] == 1
+    assert window == updates["win"] == 4.0  # ainda abaixo de min_samples
+
+
+def test_update_aprende_a_cadencia():
+    policy = _policy()
+    stats, now = {}, 1000.0
+    for gap in [0.0, 0.8, 0.9, 0.7, 1.0, 0.6]:
+        now += gap
+        updates, window = policy.update(stats, now)
+        stats.update({k: str(v) for k, v in updates.items()})
+
+    # Intervalos < 1s: percentil no bucket de 1.0s, limitado pelo mínimo
+    assert window == 1.5
+
+
+def test_intervalo_de_nova_conversa_nao_conta():
+    policy = _policy(session_gap_seconds=60.0)
+    updates, _ = policy.update({"last": "100.0"}, 400.0)
+    assert set(updates) == {"last", "win"}
+
+
+def test_primeira_mensagem_so_registra_o_horario():
+    updates, window = _policy().update({}, 50.0)
+    assert set(updates) == {"last", "win"}
+    assert window == 4.0
+
+
+def test_decaimento_divide_os_contadores():
+    policy = _policy(decay_at=10)
+    idx = GAP_BUCKETS.index(2.0)
+    stats = {"last": "100.0", f"b{idx}": "10"}
+    updates, _ = policy.update(stats, 101.8)
+
+    assert updates[f"b{idx}"] == 5  # (10 + 1) // 2
+    assert all(f"b{i}" in updates for i in range(len(GAP_BUCKETS)))
+
+
+@pytest.mark.parametrize("gap, bucket", [(0.2, 0.5), (0.5, 0.5), (0.51, 1.0), (59.0, 60.0)])
+def test_bucket_do_intervalo(gap, bucket):
+    updates, _ = _policy().update({"last": "100.0"}, 100.0 + gap)
+    assert updates[f"b{GAP_BUCKETS.index(bucket)}"] == 1
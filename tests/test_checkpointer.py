@@ -0,0 +1,103 @@
+"""BoundedMemorySaver: checkpoints por thread, orçamento de bytes (LRU) e TTL."""
+import operator
+from typing import Annotated, List, TypedDict
+
+from langgraph.graph import END, START, StateGraph
+
+from memory import checkpointer as checkpointer_module
+from memory.checkpointer import BoundedMemorySaver
+
+
+class _State(TypedDict):
+    items: Annotated[List[str], operator.add]
+
+
+def _graph(saver: BoundedMemorySaver):
+    graph = StateGraph(_State)
+    graph.add_node("eco", lambda state: {"items": ["x" * 200]})
+    graph.add_edge(START, "eco")
+    graph.add_edge("eco", END)
+    return graph.compile(checkpointer=saver)
+
+
+def _run(app, thread_id: str, turns: int = 1) -> None:
+    for _ in range(turns):
+        app.invoke({"items": []}, {"configurable": {"thread_id": thread_id}})
+
+
+def _state(app, thread_id: str):
+    return app.get_state({"configurable": {"thread_id": thread_id}}).values
+
+
+def test_mantem_so_os_ultimos_checkpoints():
+    saver = BoundedMemorySaver(max_bytes=10**9, ttl_seconds=0, keep_checkpoints=2)
+    app = _graph(saver)
+    _run(app, "t1", turns=5)
+
+    assert len(saver.storage["t1"][""]) == 2
+    # O estado continua completo: o último checkpoint acumula o canal
+    assert len(_state(app, "t1")["items"]) == 5
+
+
+def test_contabiliza_bytes_por_thread():
+    saver = BoundedMemorySaver(max_bytes=10**9, ttl_seconds=0)
+    app = _graph(saver)
+    _run(app, "t1")
+    _run(app, "t2", turns=3)
+
+    sizes = saver.thread_sizes()
+    assert list(sizes) == ["t2", "t1"]
+    assert saver.total_bytes == sum(sizes.values()) > 0
+
+
+def test_orcamento_despeja_a_thread_menos_recente():
+    saver = BoundedMemorySaver(max_bytes=10**9, ttl_seconds=0)
+    app = _graph(saver)
+    _run(app, "t1")
+    one_thread = saver.total_bytes
+
+    saver.max_bytes = int(one_thread * 2.5)
+    _run(app, "t2")
+    _state(app, "t1")  # leitura renova t1; t2 vira a menos recente
+    _run(app, "t3")
+
+    assert set(saver.thread_sizes()) == {"t1", "t3"}
+    assert _state(app, "t2") == {}
+    assert saver.total_bytes <= saver.max_bytes
+
+
+def test_thread_recem_escrita_nunca_e_despejada():
+    saver = BoundedMemorySaver(max_bytes=1, ttl_seconds=0)
+    app = _graph(saver)
+    _run(app, "t1")
+    _run(app, "t2")
+
+    assert set(saver.thread_sizes()) == {"t2"}
+    assert len(_state(app, "t2")["items"]) == 1
+
+
+def test_ttl_despeja_threads_ociosas(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(checkpointer_module.time, "monotonic", lambda: now[0])
+    saver = BoundedMemorySaver(max_bytes=10**9, ttl_seconds=60)
+    app = _graph(saver)
+    _run(app, "t1")
+
+    now[0] += 30
+    _run(app, "t2")
+    now[0] += 45  # t1 ociosa há 75s, t2 há 45s
+    _run(app, "t3")
+
+    assert set(saver.thread_sizes()) == {"t2", "t3"}
+
+
+def test_delete_thread_libera_os_bytes():
+    saver = BoundedMemorySaver(max_bytes=10**9, ttl_seconds=0)
+    app = _graph(saver)
+    _run(app, "t1")
+    _run(app, "t2")
+    saver.delete_thread("t1")
+
+    assert set(saver.thread_sizes()) == {"t2"}
+    assert saver.total_bytes == saver.thread_sizes()["t2"]
+    assert not any(key[0] == "t1" for key in saver.blobs)
@@ -0,0 +1,118 @@
+"""DebounceScheduler: heap de prazos, max_wait e reagendamento."""
+import asyncio
+
+import pytest
+
+from services import debounce
+from services.debounce import DebounceScheduler
+
+
+class _Clock:
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(debounce.time, "monotonic", clock)
+    return clock
+
+
+async def _noop(key: str) -> None:
+    pass
+
+
+def _scheduler(window: float = 4.0, max_wait: float = 20.0) -> DebounceScheduler:
+    return DebounceScheduler(_noop, window_seconds=window, max_wait_seconds=max_wait)
+
+
+def test_touch_reinicia_o_prazo(clock):
+    sched = _scheduler()
+    sched.touch("a")
+    clock.now += 3
+    sched.touch("a")
+
+    clock.now += 3  # 6s depois da primeira, 3s depois da última
+    assert sched._pop_due(clock.now) == []
+    assert sched.pending("a")
+
+    clock.now += 1
+    assert sched._pop_due(clock.now) == ["a"]
+    assert not sched.pending("a")
+
+
+def test_entradas_obsoletas_do_heap_sao_descartadas(clock):
+    sched = _scheduler()
+    for _ in range(5):
+        sched.touch("a")
+        clock.now += 1
+
+    assert len(sched._heap) == 5
+    clock.now += 10
+    assert sched._pop_due(clock.now) == ["a"]
+    assert sched._heap == []
+    assert len(sched) == 0
+
+
+def test_max_wait_limita_quem_digita_sem_parar(clock):
+    sched = _scheduler(window=4.0, max_wait=10.0)
+    started = clock.now
+    due = []
+    while not due:
+        sched.touch("a")
+        clock.now += 2  # sempre dentro da janela de silêncio
+        due = sched._pop_due(clock.now)
+
+    assert due == ["a"]
+    assert clock.now - started == pytest.approx(10.0)
+
+
+def test_janela_especifica_respeita_max_wait(clock):
+    sched = _scheduler(window=4.0, max_wait=5.0)
+    sched.touch("a", window=30.0)
+    assert sched._deadlines["a"] == pytest.approx(clock.now + 5.0)
+
+
+def test_delay_explicito_ignora_max_wait(clock):
+    sched = _scheduler(window=4.0, max_wait=5.0)
+    sched.touch("a")
+    sched.touch("a", delay=30.0)
+    assert sched._deadlines["a"] == pytest.approx(clock.now + 30.0)
+
+
+def test_ordem_por_prazo_e_cancelamento(clock):
+    sched = _scheduler()
+    sched.touch("a", window=3.0)
+    sched.touch("b", window=1.0)
+    sched.touch("c", window=2.0)
+    assert sched.cancel("c")
+    assert not sched.cancel("c")
+
+    clock.now += 5
+    assert sched._pop_due(clock.now) == ["b", "a"]
+
+
+def test_loop_dispara_flush_uma_vez():
+    flushed = []
+
+    async def on_flush(key: str) -> None:
+        flushed.append(key)
+
+    async def main():
+        sched = DebounceScheduler(on_flush, window_seconds=0.05, max_wait_seconds=1.0)
+        sched.start()
+        try:
+            for _ in range(3):
+                sched.touch("a")
+                await asyncio.sleep(0.02)
+            assert flushed == []
+            await asyncio.sleep(0.15)
+        finally:
+            await sched.stop()
+
+    asyncio.run(main())
+    assert flushed == ["a"]
@@ -0,0 +1,148 @@
+"""EanCache: L1 local, cache negativo e single-flight (Redis desligado)."""
+import asyncio
+import threading
+import time
+
+import pytest
+
+from tools import ean_cache as ean_cache_module
+from tools.ean_cache import EanCache
+
+
+@pytest.fixture(autouse=True)
+def sem_redis(monkeypatch):
+    async def no_async_client():
+        return None
+
+    monkeypatch.setattr(ean_cache_module, "get_redis_client", lambda: None)
+    monkeypatch.setattr(ean_cache_module, "get_async_redis_client", no_async_client)
+
+
+def test_hit_local_nao_consulta_o_erp():
+    cache = EanCache()
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        return [{"produto": "COCA COLA 2L"}]
+
+    assert cache.get_or_fetch("789", fetch) == [{"produto": "COCA COLA 2L"}]
+    assert cache.get_or_fetch("789", fetch) == [{"produto": "COCA COLA 2L"}]
+    assert len(calls) == 1
+
+
+def test_ean_inexistente_fica_em_cache():
+    cache = EanCache()
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        return None
+
+    assert cache.get_or_fetch("000", fetch) is None
+    assert cache.get("000") == (True, None)
+    assert cache.get_or_fetch("000", fetch) is None
+    assert len(calls) == 1
+
+
+def test_erro_nao_e_cacheado():
+    cache = EanCache()
+
+    def falha():
+        raise TimeoutError("ERP lento")
+
+    with pytest.raises(TimeoutError):
+        cache.get_or_fetch("789", falha)
+    assert cache.get("789") == (False, None)
+    assert cache.get_or_fetch("789", lambda: {"ok": True}) == {"ok": True}
+
+
+def test_lru_local_limitado():
+    cache = EanCache(local_size=2)
+    for ean in ("1", "2", "3"):
+        cache.set(ean, {"ean": ean})
+    assert cache.get("1") == (False, None)
+    assert cache.get("3") == (True, {"ean": "3"})
+
+
+def test_single_flight_entre_threads():
+    cache = EanCache()
+    calls = []
+    release = threading.Event()
+
+    def fetch():
+        calls.append(1)
+        release.wait(2)
+        return {"preco": 9.9}
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_fetch("789", fetch))) for _ in range(8)]
+    for t in threads:
+        t.start()
+    time.sleep(0.1)  # todas chegam com a primeira consulta em andamento
+    release.set()
+    for t in threads:
+        t.join(2)
+
+    assert len(calls) == 1
+    assert results == [{"preco": 9.9}] * 8
+
+
+def test_single_flight_propaga_erro_para_quem_aguardava():
+    cache = EanCache()
+    release = threading.Event()
+
+    def fetch():
+        release.wait(2)
+        raise ConnectionError("ERP fora")
+
+    errors = []
+
+    def consulta():
+        try:
+            cache.get_or_fetch("789", fetch)
+        except ConnectionError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=consulta) for _ in range(4)]
+    for t in threads:
+        t.start()
+    time.sleep(0.1)
+    release.set()
+    for t in threads:
+        t.join(2)
+
+    assert len(errors) == 4
+    assert cache._inflight == {}
+
+
+def test_single_flight_async():
+    cache = EanCache()
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return {"preco": 4.5}
+
+    async def main():
+        return await asyncio.gather(*(cache.aget_or_fetch("789", fetch) for _ in range(10)))
+
+    assert asyncio.run(main()) == [{"preco": 4.5}] * 10
+    assert len(calls) == 1
+    assert cache._ainflight == {}
+
+
+def test_single_flight_async_propaga_erro():
+    cache = EanCache()
+
+    async def fetch():
+        await asyncio.sleep(0.05)
+        raise ConnectionError("ERP fora")
+
+    async def main():
+        return await asyncio.gather(*(cache.aget_or_fetch("789", fetch) for _ in range(3)), return_exceptions=True)
+
+    results = asyncio.run(main())
+    assert all(isinstance(r, ConnectionError) for r in results)
+    assert cache._ainflight == {}
@@ -0,0 +1,54 @@
+"""estoque_preco_lote: concorrência limitada e prazo do turno nas threads do pool."""
+import threading
+import time
+
+from config.settings import settings
+from tools import http_tools
+from tools.http_client import deadline, remaining
+
+
+def test_prazo_chega_as_threads_e_pendentes_viram_omitidos(monkeypatch):
+    monkeypatch.setattr(settings, "ean_batch_concurrency", 2)
+    prazos = []
+    libera = threading.Event()
+
+    def consulta(ean_digits):
+        prazos.append(remaining())
+        if ean_digits == "3":
+            libera.wait(5)
+        return []
+
+    monkeypatch.setattr(http_tools, "_preco_um_ean", consulta)
+    started = time.monotonic()
+    try:
+        with deadline(0.5):
+            resultados, sem_resposta = http_tools._mapear_lote(["1", "2", "3", "4"])
+    finally:
+        libera.set()
+
+    assert time.monotonic() - started < 1.5
+    assert [e for e, _ in resultados] == ["1", "2", "4"]
+    assert sem_resposta == ["3"]
+    assert prazos and all(p is not None and p <= 0.5 for p in prazos)
+
+
+def test_concorrencia_limitada_sem_prazo(monkeypatch):
+    monkeypatch.setattr(settings, "ean_batch_concurrency", 2)
+    lock = threading.Lock()
+    ativos, pico = [0], [0]
+
+    def consulta(ean_digits):
+        with lock:
+            ativos[0] += 1
+            pico[0] = max(pico[0], ativos[0])
+        time.sleep(0.02)
+        with lock:
+            ativos[0] -= 1
+        return [{"ean": ean_digits}]
+
+    monkeypatch.setattr(http_tools, "_preco_um_ean", consulta)
+    resultados, sem_resposta = http_tools._mapear_lote([str(i) for i in range(6)])
+
+    assert [e for e, _ in resultados] == [str(i) for i in range(6)]
+    assert sem_resposta == []
+    assert pico[0] <= 2
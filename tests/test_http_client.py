@@ -0,0 +1,141 @@
+"""http_client: retentativa só em chamadas idempotentes e respeito ao prazo (Session simulada)."""
+import asyncio
+
+import httpx
+import pytest
+import requests
+
+from config.settings import settings
+from tools import http_client
+
+
+class _Response:
+    def __init__(self, status_code: int):
+        self.status_code = status_code
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class _Session:
+    """Devolve/levanta, em ordem, os resultados configurados."""
+
+    def __init__(self, *results):
+        self.results = list(results)
+        self.calls = []
+
+    def request(self, method, url, timeout=None, **kwargs):
+        self.calls.append((method, timeout))
+        result = self.results.pop(0) if len(self.results) > 1 else self.results[0]
+        if isinstance(result, Exception):
+            raise result
+        return _Response(result)
+
+
+@pytest.fixture(autouse=True)
+def sem_espera(monkeypatch):
+    monkeypatch.setattr(settings, "http_retries", 2)
+    monkeypatch.setattr(http_client, "_backoff", lambda attempt: 0.0)
+
+
+def _usar(monkeypatch, session: _Session) -> _Session:
+    monkeypatch.setattr(http_client, "get_session", lambda: session)
+    return session
+
+
+def test_get_repete_em_erro_de_rede(monkeypatch):
+    session = _usar(monkeypatch, _Session(requests.exceptions.ConnectionError("reset"), 200))
+    response = http_client.request("GET", "http://erp.local/produtos", endpoint="teste")
+
+    assert response.status_code == 200
+    assert len(session.calls) == 2
+
+
+def test_post_nunca_e_repetido(monkeypatch):
+    session = _usar(monkeypatch, _Session(requests.exceptions.ConnectionError("reset")))
+    with pytest.raises(requests.exceptions.ConnectionError):
+        http_client.request("POST", "http://erp.local/pedidos", endpoint="teste")
+    assert len(session.calls) == 1
+
+
+def test_post_nao_repete_status_5xx(monkeypatch):
+    session = _usar(monkeypatch, _Session(503))
+    response = http_client.request("POST", "http://erp.local/pedidos", endpoint="teste")
+
+    assert response.status_code == 503
+    assert len(session.calls) == 1
+
+
+def test_post_idempotente_explicito_repete(monkeypatch):
+    session = _usar(monkeypatch, _Session(requests.exceptions.Timeout("lento"), 502, 200))
+    response = http_client.request("POST", "http://sr.local/consulta", endpoint="teste", idempotent=True)
+
+    assert response.status_code == 200
+    assert len(session.calls) == 3
+
+
+def test_get_idempotente_false_nao_repete(monkeypatch):
+    session = _usar(monkeypatch, _Session(503))
+    http_client.request("GET", "http://erp.local/produtos", endpoint="teste", idempotent=False)
+    assert len(session.calls) == 1
+
+
+def test_esgota_as_retentativas_e_devolve_a_ultima_resposta(monkeypatch):
+    session = _usar(monkeypatch, _Session(503))
+    response = http_client.request("PUT", "http://erp.local/pedidos/1", endpoint="teste")
+
+    assert response.status_code == 503
+    assert len(session.calls) == settings.http_retries + 1
+
+
+def test_status_4xx_nao_e_repetido(monkeypatch):
+    session = _usar(monkeypatch, _Session(404))
+    assert http_client.request("GET", "http://erp.local/produtos", endpoint="teste").status_code == 404
+    assert len(session.calls) == 1
+
+
+def test_prazo_limita_os_timeouts(monkeypatch):
+    session = _usar(monkeypatch, _Session(200))
+    with http_client.deadline(0.5):
+        http_client.request("GET", "http://erp.local/produtos", endpoint="teste", read_timeout=30)
+
+    connect, read = session.calls[0][1]
+    assert connect <= 0.5 and read <= 0.5
+
+
+def test_prazo_esgotado_nao_chama_o_servidor(monkeypatch):
+    session = _usar(monkeypatch, _Session(200))
+    with http_client.deadline(0):
+        with pytest.raises(requests.exceptions.Timeout):
+            http_client.request("GET", "http://erp.local/produtos", endpoint="teste")
+    assert session.calls == []
+
+
+class _AsyncClient:
+    def __init__(self, *results):
+        self.session = _Session(*results)
+
+    async def request(self, method, url, timeout=None, **kwargs):
+        self.session.calls.append((method, timeout))
+        result = self.session.results.pop(0) if len(self.session.results) > 1 else self.session.results[0]
+        if isinstance(result, Exception):
+            raise result
+        return httpx.Response(result)
+
+
+@pytest.mark.parametrize("method, idempotent, expected_calls", [
+    ("GET", None, 3),
+    ("POST", None, 1),
+    ("POST", True, 3),
+])
+def test_arequest_so_repete_idempotentes(monkeypatch, method, idempotent, expected_calls):
+    client = _AsyncClient(httpx.ConnectError("reset"))
+    monkeypatch.setattr(http_client, "get_async_client", lambda: client)
+
+    async def main():
+        await http_client.arequest(method, "http://erp.local/x", endpoint="teste", idempotent=idempotent)
+
+    with pytest.raises(httpx.ConnectError):
+        asyncio.run(main())
+    assert len(client.session.calls) == expected_calls
@@ -0,0 +1,68 @@
+"""MediaIngestor: ordem por telefone e contagem de pendentes até o texto estar no buffer."""
+import asyncio
+
+from services import media_ingest
+from services.media_ingest import MediaIngestor, MediaJob
+
+
+def _ingestor(monkeypatch, on_ready, on_pending=None) -> MediaIngestor:
+    monkeypatch.setattr(media_ingest, "resolve_media_text", lambda message_type, *a: f"[{message_type}]")
+    ingestor = MediaIngestor(on_ready, concurrency=2, lane_idle_seconds=0.05, on_pending=on_pending)
+    ingestor.start()
+    return ingestor
+
+
+def test_pendente_ate_o_texto_entrar_no_buffer(monkeypatch):
+    vistos = []
+
+    async def main():
+        async def on_ready(telefone, texto, agendar):
+            await asyncio.sleep(0.05)  # push no Redis em andamento
+            vistos.append(ingestor.has_pending(telefone))
+
+        ingestor = _ingestor(monkeypatch, on_ready)
+        await ingestor.submit(MediaJob("5511", "audio", message_id="A1"))
+        await asyncio.sleep(0.2)
+        await ingestor.stop()
+        return ingestor
+
+    ingestor = asyncio.run(main())
+    assert vistos == [True]
+    assert not ingestor.has_pending("5511")
+
+
+def test_texto_atras_de_midia_mantem_a_ordem(monkeypatch):
+    buffer = []
+
+    async def main():
+        async def on_ready(telefone, texto, agendar):
+            buffer.append(texto)
+
+        ingestor = _ingestor(monkeypatch, on_ready)
+        await ingestor.submit(MediaJob("5511", "audio", message_id="A1"))
+        await ingestor.submit(MediaJob("5511", "text", texto="e feijão"))
+        await asyncio.sleep(0.2)
+        await ingestor.stop()
+
+    asyncio.run(main())
+    assert buffer == ["[audio]", "e feijão"]
+
+
+def test_on_pending_marca_e_desmarca_mesmo_com_falha(monkeypatch):
+    eventos = []
+
+    async def main():
+        async def on_ready(telefone, texto, agendar):
+            eventos.append("ready")
+            raise ConnectionError("Redis fora")
+
+        async def on_pending(telefone, delta):
+            eventos.append(delta)
+
+        ingestor = _ingestor(monkeypatch, on_ready, on_pending)
+        await ingestor.submit(MediaJob("5511", "image", message_id="I1"))
+        await asyncio.sleep(0.2)
+        await ingestor.stop()
+
+    asyncio.run(main())
+    assert eventos == [1, "ready", -1]
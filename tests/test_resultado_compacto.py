@@ -0,0 +1,93 @@
+"""_resultado_compacto: ordem por relevância, limite de itens e instruções por tipo_venda."""
+import json
+
+import pytest
+
+from config.settings import settings
+from tools.http_tools import INSTRUCOES_TIPO_VENDA, _processar_produto_para_agente, _resultado_compacto
+
+
+def _item(nome: str, qtd: int = 10, emb: str = "UN", **extra) -> dict:
+    bruto = {"id_produto": abs(hash(nome)) % 10**6, "produto": nome, "vl_produto": 9.9, "qtd_produto": qtd, "emb": emb}
+    bruto.update(extra)
+    return _processar_produto_para_agente(bruto)
+
+
+def _nomes(resultado: str) -> list:
+    return [i["produto"] for i in json.loads(resultado)["itens"]]
+
+
+def test_lista_vazia():
+    assert _resultado_compacto([], "arroz") == "[]"
+
+
+def test_disponiveis_primeiro():
+    itens = [_item("ARROZ TIO JOAO 5KG", qtd=0), _item("ARROZ CAMIL 1KG")]
+    assert _nomes(_resultado_compacto(itens, "arroz")) == ["ARROZ CAMIL 1KG", "ARROZ TIO JOAO 5KG"]
+
+
+def test_inativo_conta_como_indisponivel():
+    itens = [_item("FEIJAO CARIOCA 1KG", ativo=False), _item("FEIJAO PRETO 1KG")]
+    assert _nomes(_resultado_compacto(itens, "feijao")) == ["FEIJAO PRETO 1KG", "FEIJAO CARIOCA 1KG"]
+
+
+def test_mais_termos_da_consulta_depois_nome_mais_curto():
+    itens = [
+        _item("COCA COLA LATA 350ML"),
+        _item("GUARANA ANTARCTICA 2L"),
+        _item("COCA COLA 2L"),
+        _item("COCA COLA ZERO 2L"),
+    ]
+    assert _nomes(_resultado_compacto(itens, "coca cola 2l")) == [
+        "COCA COLA 2L",
+        "COCA COLA ZERO 2L",
+        "COCA COLA LATA 350ML",
+        "GUARANA ANTARCTICA 2L",
+    ]
+
+
+def test_consulta_ignora_acentos():
+    itens = [_item("PAO FRANCES KG"), _item("AÇÚCAR UNIÃO 1KG")]
+    assert _nomes(_resultado_compacto(itens, "açucar"))[0] == "AÇÚCAR UNIÃO 1KG"
+
+
+def test_limite_de_itens_e_omitidos(monkeypatch):
+    monkeypatch.setattr(settings, "tool_result_max_items", 3)
+    itens = [_item(f"BISCOITO {i:02d}") for i in range(8)]
+    resultado = json.loads(_resultado_compacto(itens, "biscoito"))
+
+    assert len(resultado["itens"]) == 3
+    assert resultado["omitidos"] == 5
+
+
+def test_sem_omitidos_dentro_do_limite(monkeypatch):
+    monkeypatch.setattr(settings, "tool_result_max_items", 3)
+    resultado = json.loads(_resultado_compacto([_item("BISCOITO OREO")], "biscoito"))
+    assert "omitidos" not in resultado
+
+
+def test_instrucoes_uma_vez_por_tipo_exibido(monkeypatch):
+    monkeypatch.setattr(settings, "tool_result_max_items", 3)
+    itens = [
+        _item("SALSICHA HOT DOG PCT 3KG", emb="PCT"),
+        _item("SALSICHA SADIA KG", emb="KG"),
+        _item("SALSICHA PERDIGAO KG", emb="KG"),
+        _item("SALSICHA LATA", qtd=0),
+    ]
+    resultado = json.loads(_resultado_compacto(itens, "salsicha"))
+
+    assert [i["tipo_venda"] for i in resultado["itens"]] == ["PESAVEL", "PESAVEL", "EMBALAGEM_FECHADA"]
+    # O item indisponível (UNITARIO) ficou de fora: sua instrução também
+    assert resultado["instrucoes"] == {t: INSTRUCOES_TIPO_VENDA[t] for t in ("PESAVEL", "EMBALAGEM_FECHADA")}
+    assert all("INSTRUCAO_IA" not in i for i in resultado["itens"])
+
+
+@pytest.mark.parametrize("consulta", [None, ""])
+def test_sem_consulta_ordena_por_disponibilidade_e_tamanho(consulta):
+    itens = [_item("ARROZ INTEGRAL URBANO 1KG"), _item("ARROZ 1KG", qtd=0), _item("ARROZ CAMIL 1KG")]
+    assert _nomes(_resultado_compacto(itens, consulta)) == ["ARROZ CAMIL 1KG", "ARROZ INTEGRAL URBANO 1KG", "ARROZ 1KG"]
+
+
+def test_json_compacto():
+    resultado = _resultado_compacto([_item("ARROZ CAMIL 1KG")], "arroz")
+    assert resultado == json.dumps(json.loads(resultado), ensure_ascii=False, separators=(",", ":"))
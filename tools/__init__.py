@@ -2,7 +2,7 @@
 Módulo de ferramentas do Agente de Supermercado
 """
 from .http_tools import estoque, pedidos, alterar, ean_lookup, estoque_preco
-from .redis_tools import push_message_to_buffer, get_buffer_length, pop_all_messages, set_agent_cooldown, is_agent_in_cooldown
+from .redis_tools import push_message_to_buffer, get_buffer_length, pop_all_messages, set_agent_cooldown, is_agent_in_cooldown, mark_message_seen, amark_message_seen
 from .time_tool import get_current_time
 
 __all__ = [
@@ -14,6 +14,8 @@ __all__ = [
     'pop_all_messages',
     'set_agent_cooldown',
     'is_agent_in_cooldown',
+    'mark_message_seen',
+    'amark_message_seen',
     'get_current_time',
     'ean_lookup',
     'estoque_preco'
@@ -0,0 +1,354 @@
+"""
+Snapshot local do catálogo de produtos com índice em memória
+
+Uma thread de sincronização baixa a lista completa de produtos do ERP
+(CATALOG_FULL_URL) a cada CATALOG_FULL_INTERVAL_SECONDS e, entre uma carga
+completa e outra, aplica as alterações de preço/estoque (CATALOG_DELTA_URL)
+a cada CATALOG_REFRESH_SECONDS. O índice guarda nomes normalizados, tokens,
+o mapa de EANs e o produto já classificado por `_processar_produto_para_agente`;
+`estoque`/`estoque_preco` respondem por ele sem ir ao ERP.
+
+Sem CATALOG_DELTA_URL a carga completa roda a cada CATALOG_MAX_AGE_SECONDS/2
+(no máximo), para o snapshot não vencer entre uma carga e outra. Produtos
+excluídos (tombstone) ou com `ativo=false` saem do índice.
+
+Snapshot vencido (mais velho que CATALOG_MAX_AGE_SECONDS) ou consulta sem
+resultado caem na consulta HTTP de sempre.
+"""
+import bisect
+import re
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from config.logger import setup_logger
+from config.metrics import metrics
+from config.settings import settings
+from tools.http_client import request
+from tools.http_tools import _normalizar, _processar_produto_para_agente, get_auth_headers
+
+logger = setup_logger(__name__)
+
+# Campos do ERP que podem trazer o código de barras
+_CAMPOS_EAN = ("ean", "cod_barras", "codigo_barras", "codigo_ean", "gtin")
+# Marcas de exclusão (tombstone) no delta do ERP
+_CAMPOS_EXCLUSAO = ("excluido", "removido", "deleted", "_deleted")
+_FALSOS = {"false", "0", "n", "nao", "não", "no"}
+
+
+def _tokens(texto: str) -> List[str]:
+    return [t for t in re.findall(r"\w+", _normalizar(texto)) if len(t) > 1]
+
+
+def _chave(produto: Dict[str, Any]) -> Optional[str]:
+    chave = produto.get("id_produto")
+    if chave is None:
+        chave = produto.get("id")
+    return str(chave) if chave is not None else None
+
+
+def _removido(produto: Dict[str, Any]) -> bool:
+    """Tombstone do delta ou produto inativo: não deve ficar no índice."""
+    if any(produto.get(campo) for campo in _CAMPOS_EXCLUSAO):
+        return True
+    ativo = produto.get("ativo", True)
+    return ativo is False or str(ativo).strip().lower() in _FALSOS
+
+
+def _eans(produto: Dict[str, Any]) -> Set[str]:
+    eans = set()
+    for campo in _CAMPOS_EAN:
+        digitos = "".join(filter(str.isdigit, str(produto.get(campo) or "")))
+        if digitos:
+            eans.add(digitos)
+            eans.add(digitos.lstrip("0"))  # EAN-13 x GTIN-14 com zeros à esquerda
+    return eans
+
+
+def _lista_produtos(data: Any) -> List[Dict[str, Any]]:
+    """Normaliza a resposta do ERP (lista ou objeto com a lista dentro) para uma lista de produtos."""
+    if isinstance(data, dict):
+        for campo in ("produtos", "data", "items", "itens"):
+            if isinstance(data.get(campo), list):
+                return data[campo]
+        return [data]
+    return data if isinstance(data, list) else []
+
+
+class CatalogIndex:
+    """
+    Índice em memória do catálogo.
+
+    Leituras e atualizações incrementais dividem um lock curto; uma carga
+    completa constrói um índice novo e o troca de uma vez (`CatalogSync`).
+    """
+
+    def __init__(self, produtos: Iterable[Dict[str, Any]] = ()):
+        self._lock = threading.Lock()
+        self._brutos: Dict[str, Dict[str, Any]] = {}
+        self._itens: Dict[str, Dict[str, Any]] = {}
+        self._tokens_item: Dict[str, List[str]] = {}
+        self._postings: Dict[str, Set[str]] = {}
+        self._vocabulario: List[str] = []  # tokens ordenados, para busca por prefixo
+        self._eans: Dict[str, Set[str]] = {}
+        self.updated_at = time.time()
+
+        for produto in produtos:
+            if not _removido(produto):
+                self._indexar(produto)
+        self._vocabulario = sorted(self._postings)
+
+    def __len__(self) -> int:
+        return len(self._itens)
+
+    def _indexar(self, produto: Dict[str, Any]) -> bool:
+        """Inclui/atualiza um produto; retorna True se o vocabulário mudou."""
+        chave = _chave(produto)
+        if chave is None:
+            return False
+        anterior = self._brutos.get(chave)
+        if anterior is not None:
+            produto = {**anterior, **produto}  # delta pode trazer só preço/estoque
+            self._desindexar(chave)
+
+        self._brutos[chave] = produto
+        self._itens[chave] = _processar_produto_para_agente(produto)
+
+        tokens = _tokens(self._itens[chave]["produto"])
+        self._tokens_item[chave] = tokens
+        novo_token = False
+        for token in tokens:
+            if token not in self._postings:
+                self._postings[token] = set()
+                novo_token = True
+            self._postings[token].add(chave)
+        for ean in _eans(produto):
+            self._eans.setdefault(ean, set()).add(chave)
+        return novo_token
+
+    def _desindexar(self, chave: str) -> None:
+        for token in self._tokens_item.pop(chave, []):
+            self._postings.get(token, set()).discard(chave)
+        for ean in _eans(self._brutos.get(chave, {})):
+            self._eans.get(ean, set()).discard(chave)
+
+    def _remover(self, chave: str) -> bool:
+        """Tira o produto do índice; retorna True se ele existia."""
+        if chave not in self._brutos:
+            return False
+        self._desindexar(chave)
+        del self._brutos[chave]
+        del self._itens[chave]
+        return True
+
+    def aplicar(self, produtos: Iterable[Dict[str, Any]]) -> int:
+        """
+        Atualização incremental (preço, estoque, produtos novos) e remoção de
+        tombstones / `ativo=false`. Retorna quantos foram aplicados.
+        """
+        aplicados = 0
+        with self._lock:
+            vocabulario_mudou = False
+            for produto in produtos:
+                chave = _chave(produto)
+                if chave is None:
+                    continue
+                if _removido({**self._brutos.get(chave, {}), **produto}):
+                    # Tokens sem produto ficam no vocabulário até a próxima carga completa (postings vazios)
+                    aplicados += int(self._remover(chave))
+                    continue
+                vocabulario_mudou |= self._indexar(produto)
+                aplicados += 1
+            if vocabulario_mudou:
+                self._vocabulario = sorted(self._postings)
+            self.updated_at = time.time()
+        return aplicados
+
+    def _candidatos(self, termo: str) -> Set[str]:
+        """Produtos com o token `termo`; sem token exato, os que começam com ele ("arro" acha "arroz")."""
+        exatos = self._postings.get(termo)
+        if exatos:
+            return exatos
+        encontrados: Set[str] = set()
+        i = bisect.bisect_left(self._vocabulario, termo)
+        while i < len(self._vocabulario) and self._vocabulario[i].startswith(termo):
+            encontrados |= self._postings.get(self._vocabulario[i], set())
+            i += 1
+        return encontrados
+
+    def buscar(self, consulta: str) -> List[Dict[str, Any]]:
+        """Produtos que casam com o maior número de termos da consulta (já classificados)."""
+        termos = _tokens(consulta)
+        if not termos:
+            return []
+        with self._lock:
+            acertos: Dict[str, int] = {}
+            for termo in termos:
+                for chave in self._candidatos(termo):
+                    acertos[chave] = acertos.get(chave, 0) + 1
+            if not acertos:
+                return []
+            melhor = max(acertos.values())
+            return [self._itens[c] for c, n in acertos.items() if n == melhor]
+
+    def por_ean(self, ean: str) -> List[Dict[str, Any]]:
+        digitos = "".join(filter(str.isdigit, ean or ""))
+        if not digitos:
+            return []
+        with self._lock:
+            chaves = self._eans.get(digitos) or self._eans.get(digitos.lstrip("0")) or set()
+            return [self._itens[c] for c in chaves]
+
+
+class CatalogSync:
+    """
+    Thread de sincronização do catálogo.
+
+    - Carga completa na partida e a cada `full_interval` segundos (sem
+      `delta_url`, no máximo a cada `max_age / 2`).
+    - Entre cargas, o delta (`?desde=<ISO-8601>`) a cada `refresh_interval`.
+    - `index()` devolve o índice apenas se estiver dentro de `max_age`.
+    - Métricas: catalog.snapshot_age_seconds, catalog.items, catalog.sync_seconds,
+      catalog.sync_failed, catalog.hit, catalog.miss.
+    """
+
+    def __init__(
+        self,
+        full_url: str,
+        delta_url: str = "",
+        full_interval: float = 3600.0,
+        refresh_interval: float = 120.0,
+        max_age: float = 900.0,
+    ):
+        self.full_url = (full_url or "").strip()
+        self.delta_url = (delta_url or "").strip()
+        self.max_age = max_age
+        self.refresh_interval = max(5.0, refresh_interval)
+        self.full_interval = full_interval
+        if not self.delta_url:
+            # Só a carga completa renova o snapshot: ela precisa vir antes de ele vencer
+            self.full_interval = min(full_interval, max_age / 2)
+            self.refresh_interval = min(self.refresh_interval, self.full_interval)
+
+        self._index: Optional[CatalogIndex] = None
+        self._last_full = 0.0
+        self._last_sync_at: Optional[datetime] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    # ----------------------------------------
+    # Ciclo de vida
+    # ----------------------------------------
+
+    def start(self) -> None:
+        if self._thread or not self.full_url:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="catalog-sync", daemon=True)
+        self._thread.start()
+        if self.delta_url:
+            logger.info(f"🗂️ Sincronização do catálogo iniciada (delta a cada {self.refresh_interval:.0f}s)")
+        else:
+            logger.info(f"🗂️ Sincronização do catálogo iniciada (sem delta: carga completa a cada {self.full_interval:.0f}s)")
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Sinaliza a parada e aguarda a thread até `timeout` (uma carga em andamento não é interrompida)."""
+        self._stop.set()
+        thread, self._thread = self._thread, None
+        if thread is None:
+            return
+        thread.join(timeout)
+        if thread.is_alive():
+            logger.warning(f"⚠️ Sincronização do catálogo não terminou em {timeout:g}s (segue como daemon)")
+
+    # ----------------------------------------
+    # Consulta
+    # ----------------------------------------
+
+    def age_seconds(self) -> Optional[float]:
+        return time.time() - self._index.updated_at if self._index else None
+
+    def index(self) -> Optional[CatalogIndex]:
+        """Índice atual, ou None se não houver snapshot ou ele estiver velho demais."""
+        idade = self.age_seconds()
+        if idade is None or idade > self.max_age:
+            return None
+        return self._index
+
+    def stats(self) -> Dict[str, Any]:
+        idade = self.age_seconds()
+        return {
+            "items": len(self._index) if self._index else 0,
+            "snapshot_age_seconds": round(idade, 1) if idade is not None else None,
+            "fresh": self.index() is not None,
+        }
+
+    # ----------------------------------------
+    # Sincronização
+    # ----------------------------------------
+
+    def _get(self, url: str, params: Optional[Dict[str, str]] = None) -> List[Dict[str, Any]]:
+        response = request(
+            "GET", url, endpoint="catalog", read_timeout=settings.catalog_sync_timeout,
+            headers=get_auth_headers(), params=params,
+        )
+        response.raise_for_status()
+        return _lista_produtos(response.json())
+
+    def sync_full(self) -> None:
+        started = time.monotonic()
+        sync_at = datetime.now(timezone.utc)
+        produtos = self._get(self.full_url)
+        self._index = CatalogIndex(produtos)
+        self._last_full = time.monotonic()
+        self._last_sync_at = sync_at
+        metrics.observe("catalog.sync_seconds.full", time.monotonic() - started)
+        metrics.set_gauge("catalog.items", len(self._index))
+        logger.info(f"🗂️ Catálogo carregado: {len(self._index)} produtos em {time.monotonic() - started:.1f}s")
+
+    def sync_delta(self) -> None:
+        started = time.monotonic()
+        sync_at = datetime.now(timezone.utc)
+        alterados = self._get(self.delta_url, params={"desde": self._last_sync_at.isoformat()})
+        aplicados = self._index.aplicar(alterados)
+        self._last_sync_at = sync_at
+        metrics.observe("catalog.sync_seconds.delta", time.monotonic() - started)
+        metrics.set_gauge("catalog.items", len(self._index))
+        if aplicados:
+            logger.info(f"🗂️ Catálogo: {aplicados} produto(s) atualizados")
+
+    def _tick(self) -> None:
+        if self._index is None or time.monotonic() - self._last_full >= self.full_interval:
+            self.sync_full()
+        elif self.delta_url:
+            # Sem endpoint de delta o snapshot só é renovado pela carga completa
+            self.sync_delta()
+
+    def _loop(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self._tick()
+            except Exception as e:
+                metrics.incr("catalog.sync_failed")
+                logger.error(f"Erro ao sincronizar catálogo: {e}")
+            idade = self.age_seconds()
+            if idade is not None:
+                metrics.set_gauge("catalog.snapshot_age_seconds", idade)
+            self._stop.wait(self.refresh_interval)
+
+
+catalog_sync = CatalogSync(
+    full_url=settings.catalog_full_url,
+    delta_url=settings.catalog_delta_url,
+    full_interval=settings.catalog_full_interval_seconds,
+    refresh_interval=settings.catalog_refresh_seconds,
+    max_age=settings.catalog_max_age_seconds,
+)
+
+
+def get_catalog() -> Optional[CatalogIndex]:
+    """Índice local pronto para consulta, ou None (catálogo desligado ou velho)."""
+    if not settings.catalog_enabled:
+        return None
+    return catalog_sync.index()
@@ -0,0 +1,278 @@
+"""
+Cache em dois níveis da consulta de preço/estoque por EAN
+
+`GetProdutosEAN/{ean}` é consultado a cada `estoque_preco`, e os mesmos EANs
+populares (Coca-Cola 2L, arroz) aparecem em centenas de conversas por
+minuto. Aqui a resposta do ERP passa por:
+
+- L1: LRU em memória do processo (EAN_CACHE_LOCAL_SIZE, EAN_CACHE_LOCAL_TTL_SECONDS)
+- L2: Redis compartilhado entre processos (EAN_CACHE_TTL_SECONDS)
+- cache negativo: 404 ("EAN não existe") fica EAN_CACHE_NEGATIVE_TTL_SECONDS
+- single-flight: misses simultâneos do mesmo EAN no processo geram uma
+  única chamada ao ERP; os demais aguardam o resultado dela
+
+No caminho asyncio só o L1 é consultado inline; o L2 usa redis.asyncio.
+Erros (timeout, 5xx) não são cacheados. Métricas por nível:
+ean_cache.local.hit/miss, ean_cache.redis.hit/miss, ean_cache.<nível>.hit_ratio,
+ean_cache.negative_hit, ean_cache.coalesced e ean_cache.upstream.
+"""
+import asyncio
+import json
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from config.logger import setup_logger
+from config.metrics import metrics
+from config.settings import settings
+from tools.redis_tools import get_async_redis_client, get_redis_client
+
+logger = setup_logger(__name__)
+
+# Valor gravado no Redis para EAN inexistente (404)
+_NEGATIVE = "null"
+
+
+def ean_key(ean: str) -> str:
+    return f"ean:{ean}"
+
+
+class _TierStats:
+    def __init__(self, name: str):
+        self.name = name
+        self.hits = 0
+        self.lookups = 0
+
+    def record(self, hit: bool) -> None:
+        self.lookups += 1
+        self.hits += int(hit)
+        metrics.incr(f"ean_cache.{self.name}.{'hit' if hit else 'miss'}")
+        metrics.set_gauge(f"ean_cache.{self.name}.hit_ratio", round(self.hits / self.lookups, 3))
+
+
+class EanCache:
+    """
+    Cache L1 (LRU local) + L2 (Redis) da resposta do ERP por EAN.
+
+    O valor cacheado é o JSON da resposta (lista/objeto) ou None para EAN
+    inexistente. `get_or_fetch` / `aget_or_fetch` recebem a função que
+    consulta o ERP: ela retorna o JSON, None em 404, ou levanta exceção.
+    """
+
+    def __init__(
+        self,
+        ttl_seconds: int = 60,
+        negative_ttl_seconds: int = 120,
+        local_size: int = 2048,
+        local_ttl_seconds: float = 10.0,
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.negative_ttl_seconds = negative_ttl_seconds
+        self.local_size = max(1, local_size)
+        self.local_ttl_seconds = local_ttl_seconds
+
+        self._lock = threading.Lock()
+        self._local: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._inflight: Dict[str, Future] = {}
+        self._ainflight: Dict[Tuple[int, str], asyncio.Future] = {}
+        self._local_stats = _TierStats("local")
+        self._redis_stats = _TierStats("redis")
+
+    # ----------------------------------------
+    # Níveis
+    # ----------------------------------------
+
+    def _local_get(self, ean: str) -> Tuple[bool, Any]:
+        with self._lock:
+            entry = self._local.get(ean)
+            if entry is not None and entry[0] > time.monotonic():
+                self._local.move_to_end(ean)
+                self._local_stats.record(True)
+                return True, entry[1]
+            if entry is not None:
+                del self._local[ean]
+            self._local_stats.record(False)
+            return False, None
+
+    def _local_set(self, ean: str, payload: Any) -> None:
+        ttl = self.ttl_seconds if payload is not None else self.negative_ttl_seconds
+        with self._lock:
+            self._local[ean] = (time.monotonic() + min(self.local_ttl_seconds, ttl), payload)
+            self._local.move_to_end(ean)
+            while len(self._local) > self.local_size:
+                self._local.popitem(last=False)
+
+    def _redis_get(self, ean: str) -> Tuple[bool, Any]:
+        client = get_redis_client()
+        if client is None:
+            return False, None
+        try:
+            raw = client.get(ean_key(ean))
+        except Exception as e:
+            logger.warning(f"Cache EAN indisponível (leitura): {e}")
+            return False, None
+        self._redis_stats.record(raw is not None)
+        if raw is None:
+            return False, None
+        return True, json.loads(raw)
+
+    def _redis_value(self, payload: Any) -> Tuple[str, int]:
+        if payload is None:
+            return _NEGATIVE, self.negative_ttl_seconds
+        return json.dumps(payload, ensure_ascii=False, separators=(",", ":")), self.ttl_seconds
+
+    def _redis_set(self, ean: str, payload: Any) -> None:
+        client = get_redis_client()
+        if client is None:
+            return
+        try:
+            value, ttl = self._redis_value(payload)
+            client.set(ean_key(ean), value, ex=ttl)
+        except Exception as e:
+            logger.warning(f"Cache EAN indisponível (escrita): {e}")
+
+    async def _aredis_get(self, ean: str) -> Tuple[bool, Any]:
+        client = await get_async_redis_client()
+        if client is None:
+            return False, None
+        try:
+            raw = await client.get(ean_key(ean))
+        except Exception as e:
+            logger.warning(f"Cache EAN indisponível (leitura): {e}")
+            return False, None
+        self._redis_stats.record(raw is not None)
+        if raw is None:
+            return False, None
+        return True, json.loads(raw)
+
+    async def _aredis_set(self, ean: str, payload: Any) -> None:
+        client = await get_async_redis_client()
+        if client is None:
+            return
+        try:
+            value, ttl = self._redis_value(payload)
+            await client.set(ean_key(ean), value, ex=ttl)
+        except Exception as e:
+            logger.warning(f"Cache EAN indisponível (escrita): {e}")
+
+    def get(self, ean: str) -> Tuple[bool, Any]:
+        """(encontrado, JSON|None) consultando L1 e depois L2 (um hit no L2 repõe o L1)."""
+        found, payload = self._local_get(ean)
+        if not found:
+            found, payload = self._redis_get(ean)
+            if found:
+                self._local_set(ean, payload)
+        if found and payload is None:
+            metrics.incr("ean_cache.negative_hit")
+        return found, payload
+
+    def set(self, ean: str, payload: Any) -> None:
+        self._local_set(ean, payload)
+        self._redis_set(ean, payload)
+
+    async def aget(self, ean: str) -> Tuple[bool, Any]:
+        """Versão async de `get`: L1 inline, L2 via redis.asyncio."""
+        found, payload = self._local_get(ean)
+        if not found:
+            found, payload = await self._aredis_get(ean)
+            if found:
+                self._local_set(ean, payload)
+        if found and payload is None:
+            metrics.incr("ean_cache.negative_hit")
+        return found, payload
+
+    async def aset(self, ean: str, payload: Any) -> None:
+        self._local_set(ean, payload)
+        await self._aredis_set(ean, payload)
+
+    def invalidate(self, ean: str) -> None:
+        with self._lock:
+            self._local.pop(ean, None)
+        client = get_redis_client()
+        if client is not None:
+            try:
+                client.delete(ean_key(ean))
+            except Exception as e:
+                logger.warning(f"Cache EAN indisponível (invalidação): {e}")
+
+    # ----------------------------------------
+    # Leitura com single-flight
+    # ----------------------------------------
+
+    def get_or_fetch(self, ean: str, fetch: Callable[[], Any]) -> Any:
+        found, payload = self.get(ean)
+        if found:
+            return payload
+
+        with self._lock:
+            future = self._inflight.get(ean)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._inflight[ean] = future
+        if not leader:
+            metrics.incr("ean_cache.coalesced")
+            return future.result(timeout=settings.ean_cache_wait_seconds)
+
+        try:
+            metrics.incr("ean_cache.upstream")
+            payload = fetch()
+            self.set(ean, payload)
+            future.set_result(payload)
+            return payload
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            if not future.done():
+                future.cancel()
+            with self._lock:
+                self._inflight.pop(ean, None)
+
+    async def aget_or_fetch(self, ean: str, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        found, payload = await self.aget(ean)
+        if found:
+            return payload
+
+        key = (id(asyncio.get_running_loop()), ean)
+        future = self._ainflight.get(key)
+        if future is not None:
+            metrics.incr("ean_cache.coalesced")
+            return await asyncio.wait_for(asyncio.shield(future), timeout=settings.ean_cache_wait_seconds)
+
+        future = asyncio.get_running_loop().create_future()
+        self._ainflight[key] = future
+        try:
+            metrics.incr("ean_cache.upstream")
+            payload = await fetch()
+            await self.aset(ean, payload)
+            future.set_result(payload)
+            return payload
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # marca como consumida (sem aviso quando ninguém aguardava)
+            raise
+        finally:
+            if not future.done():
+                future.cancel()
+            self._ainflight.pop(key, None)
+
+
+_ean_cache: Optional[EanCache] = None
+
+
+def get_ean_cache() -> Optional[EanCache]:
+    """Cache compartilhado (None se EAN_CACHE_ENABLED=false)."""
+    global _ean_cache
+    if not settings.ean_cache_enabled:
+        return None
+    if _ean_cache is None:
+        _ean_cache = EanCache(
+            ttl_seconds=settings.ean_cache_ttl_seconds,
+            negative_ttl_seconds=settings.ean_cache_negative_ttl_seconds,
+            local_size=settings.ean_cache_local_size,
+            local_ttl_seconds=settings.ean_cache_local_ttl_seconds,
+        )
+    return _ean_cache
@@ -0,0 +1,283 @@
+"""
+Camada HTTP compartilhada para o ERP e o Smart Responder
+
+Todas as chamadas de `tools/http_tools.py` (e a sincronização do catálogo)
+passam por aqui em vez de `requests.get/post/put` soltos:
+
+- keep-alive: uma `requests.Session` do processo (pools por host do urllib3)
+  e um `httpx.AsyncClient` por event loop no caminho asyncio
+- limite de conexões por host (HTTP_POOL_PER_HOST), com espera limitada
+  ao timeout de conexão
+- timeouts separados de conexão e leitura (HTTP_CONNECT_TIMEOUT / HTTP_READ_TIMEOUT)
+- retentativas com backoff exponencial e jitter (HTTP_RETRIES) só para
+  chamadas idempotentes: GET/PUT/DELETE por padrão, ou `idempotent=True`
+  (ex: consulta POST ao Smart Responder); pedidos (POST) nunca são repetidos
+- prazo do contexto (`deadline`): dentro do bloco, timeouts, esperas por
+  conexão e backoff nunca passam do tempo restante; é assim que o teto de
+  cada ferramenta síncrona (tools/tool_guard.py) é aplicado, sem thread extra
+- métricas por endpoint: http.<endpoint>.seconds, http.<endpoint>.status.<Nxx>,
+  http.<endpoint>.retries, http.<endpoint>.errors e http.<endpoint>.deadline
+
+As exceções continuam as nativas (`requests.exceptions.*` / `httpx.*`),
+então os tratamentos de timeout das ferramentas não mudam.
+"""
+import asyncio
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, Optional, Tuple
+from urllib.parse import urlsplit
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+from config.logger import setup_logger
+from config.metrics import metrics
+from config.settings import settings
+
+logger = setup_logger(__name__)
+
+_IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+_RETRY_STATUS = {429, 502, 503, 504}
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+_host_slots: Dict[str, threading.BoundedSemaphore] = {}
+
+# Cliente HTTP async por event loop (caminho asyncio do agente)
+_async_clients: Dict[int, httpx.AsyncClient] = {}
+_async_host_slots: Dict[Tuple[int, str], asyncio.Semaphore] = {}
+
+# Instante (time.monotonic) limite das chamadas feitas no contexto atual
+_deadline: ContextVar[Optional[float]] = ContextVar("http_deadline", default=None)
+
+
+# ============================================
+# Clientes
+# ============================================
+
+def get_session() -> requests.Session:
+    """Session compartilhada do processo (keep-alive por host)."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(
+                    pool_connections=settings.http_pool_hosts,
+                    pool_maxsize=settings.http_pool_per_host,
+                    max_retries=0,  # retentativas ficam em `request` (só idempotentes, com jitter)
+                )
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                _session = session
+    return _session
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """AsyncClient compartilhado do event loop atual (keep-alive entre chamadas)."""
+    loop_id = id(asyncio.get_running_loop())
+    client = _async_clients.get(loop_id)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=settings.http_async_max_connections,
+                max_keepalive_connections=settings.http_pool_per_host,
+            ),
+        )
+        _async_clients[loop_id] = client
+    return client
+
+
+def close_session() -> None:
+    """Fecha a Session síncrona (shutdown)."""
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+            _session = None
+
+
+async def close_async_client() -> None:
+    """Fecha o AsyncClient do event loop atual (shutdown)."""
+    client = _async_clients.pop(id(asyncio.get_running_loop()), None)
+    if client is not None:
+        await client.aclose()
+
+
+def _host(url: str) -> str:
+    return urlsplit(url).netloc
+
+
+def _slots(host: str) -> threading.BoundedSemaphore:
+    with _session_lock:
+        if host not in _host_slots:
+            _host_slots[host] = threading.BoundedSemaphore(max(1, settings.http_pool_per_host))
+        return _host_slots[host]
+
+
+def _aslots(host: str) -> asyncio.Semaphore:
+    key = (id(asyncio.get_running_loop()), host)
+    if key not in _async_host_slots:
+        _async_host_slots[key] = asyncio.Semaphore(max(1, settings.http_pool_per_host))
+    return _async_host_slots[key]
+
+
+# ============================================
+# Prazo
+# ============================================
+
+@contextmanager
+def deadline(seconds: float) -> Iterator[None]:
+    """Limita todas as chamadas HTTP do bloco (inclusive retentativas) a `seconds`."""
+    limite = time.monotonic() + seconds
+    atual = _deadline.get()
+    token = _deadline.set(limite if atual is None else min(atual, limite))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining() -> Optional[float]:
+    """Segundos restantes do prazo do contexto (None fora de `deadline`)."""
+    limite = _deadline.get()
+    return None if limite is None else limite - time.monotonic()
+
+
+def _timeouts(read_timeout: Optional[float], restante: Optional[float]) -> Tuple[float, float]:
+    """(conexão, leitura) limitados pelo prazo restante."""
+    connect, read = settings.http_connect_timeout, read_timeout or settings.http_read_timeout
+    if restante is not None:
+        connect, read = min(connect, restante), min(read, restante)
+    return connect, read
+
+
+# ============================================
+# Política de retentativa
+# ============================================
+
+def _backoff(attempt: int) -> float:
+    """Backoff exponencial com jitter completo: uniforme em [0, min(teto, base * 2^tentativa)]."""
+    return random.uniform(0, min(settings.http_backoff_max, settings.http_backoff_base * (2 ** attempt)))
+
+
+def _pause(attempt: int) -> float:
+    """Backoff da tentativa, sem passar do prazo restante."""
+    restante = remaining()
+    pausa = _backoff(attempt)
+    return pausa if restante is None else max(0.0, min(pausa, restante))
+
+
+def _retries(method: str, idempotent: Optional[bool]) -> int:
+    if idempotent is None:
+        idempotent = method.upper() in _IDEMPOTENT_METHODS
+    return max(0, settings.http_retries) if idempotent else 0
+
+
+def _record(endpoint: str, started: float, status: Optional[int] = None) -> None:
+    metrics.observe(f"http.{endpoint}.seconds", time.monotonic() - started)
+    if status is not None:
+        metrics.incr(f"http.{endpoint}.status.{status // 100}xx")
+
+
+# ============================================
+# Requisições
+# ============================================
+
+def request(
+    method: str,
+    url: str,
+    *,
+    endpoint: str,
+    idempotent: Optional[bool] = None,
+    read_timeout: Optional[float] = None,
+    **kwargs,
+) -> requests.Response:
+    """
+    `requests` pela Session compartilhada, com limite por host, timeouts
+    separados e retentativas (só idempotentes) em erro de rede, timeout,
+    429 e 502/503/504. Devolve a última resposta; exceções são as do requests.
+    """
+    retries = _retries(method, idempotent)
+    slots = _slots(_host(url))
+
+    for attempt in range(retries + 1):
+        restante = remaining()
+        if restante is not None and restante <= 0:
+            metrics.incr(f"http.{endpoint}.deadline")
+            raise requests.exceptions.Timeout(f"Prazo esgotado para {endpoint}")
+        timeout = _timeouts(read_timeout, restante)
+        started = time.monotonic()
+        if not slots.acquire(timeout=timeout[0]):
+            metrics.incr(f"http.{endpoint}.pool_exhausted")
+            raise requests.exceptions.ConnectTimeout(f"Pool HTTP esgotado para {_host(url)}")
+        try:
+            response = get_session().request(method, url, timeout=timeout, **kwargs)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            _record(endpoint, started)
+            if attempt >= retries:
+                metrics.incr(f"http.{endpoint}.errors")
+                raise
+            logger.warning(f"🔁 {endpoint}: {type(e).__name__}, tentativa {attempt + 2}/{retries + 1}")
+        else:
+            _record(endpoint, started, response.status_code)
+            if response.status_code not in _RETRY_STATUS or attempt >= retries:
+                return response
+            logger.warning(f"🔁 {endpoint}: HTTP {response.status_code}, tentativa {attempt + 2}/{retries + 1}")
+            response.close()
+        finally:
+            slots.release()
+
+        metrics.incr(f"http.{endpoint}.retries")
+        time.sleep(_pause(attempt))
+
+
+async def arequest(
+    method: str,
+    url: str,
+    *,
+    endpoint: str,
+    idempotent: Optional[bool] = None,
+    read_timeout: Optional[float] = None,
+    **kwargs,
+) -> httpx.Response:
+    """Versão async de `request` (httpx.AsyncClient do event loop); exceções são as do httpx."""
+    retries = _retries(method, idempotent)
+    slots = _aslots(_host(url))
+
+    for attempt in range(retries + 1):
+        restante = remaining()
+        if restante is not None and restante <= 0:
+            metrics.incr(f"http.{endpoint}.deadline")
+            raise httpx.TimeoutException(f"Prazo esgotado para {endpoint}")
+        connect, read = _timeouts(read_timeout, restante)
+        timeout = httpx.Timeout(read, connect=connect, pool=connect)
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(slots.acquire(), timeout=connect)
+        except asyncio.TimeoutError:
+            metrics.incr(f"http.{endpoint}.pool_exhausted")
+            raise httpx.PoolTimeout(f"Pool HTTP esgotado para {_host(url)}")
+        try:
+            response = await get_async_client().request(method, url, timeout=timeout, **kwargs)
+        except httpx.TransportError as e:
+            _record(endpoint, started)
+            if attempt >= retries:
+                metrics.incr(f"http.{endpoint}.errors")
+                raise
+            logger.warning(f"🔁 {endpoint}: {type(e).__name__}, tentativa {attempt + 2}/{retries + 1}")
+        else:
+            _record(endpoint, started, response.status_code)
+            if response.status_code not in _RETRY_STATUS or attempt >= retries:
+                return response
+            logger.warning(f"🔁 {endpoint}: HTTP {response.status_code}, tentativa {attempt + 2}/{retries + 1}")
+            await response.aclose()
+        finally:
+            slots.release()
+
+        metrics.incr(f"http.{endpoint}.retries")
+        await asyncio.sleep(_pause(attempt))
@@ -1,14 +1,26 @@
 """
 Ferramentas HTTP para interação com a API do Supermercado (Versão SaaS Universal)
 """
+import asyncio
+import re
+import unicodedata
 import requests
+import httpx
 import json
-from typing import Dict, Any, List, Optional
+import contextvars
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from urllib.parse import parse_qs, unquote, urlsplit
+from typing import Dict, Any, List, Optional, Tuple
 from config.settings import settings
 from config.logger import setup_logger
+from config.metrics import metrics
+from tools.ean_cache import get_ean_cache
+from tools.http_client import arequest, remaining, request
 
 logger = setup_logger(__name__)
 
+# Threads das consultas de `estoque_preco_lote`, compartilhadas entre os turnos
+_lote_executor = ThreadPoolExecutor(max_workers=max(1, settings.tool_max_workers), thread_name_prefix="ean-lote")
 
 def get_auth_headers() -> Dict[str, str]:
     """Retorna os headers de autenticação para as requisições"""
@@ -19,11 +31,28 @@ def get_auth_headers() -> Dict[str, str]:
     }
 
 
+# Instruções de venda, enviadas uma vez por tipo_venda presente no resultado
+INSTRUCOES_TIPO_VENDA: Dict[str, str] = {
+    "UNITARIO": "Venda normal por unidade. Preço fixo.",
+    "EMBALAGEM_FECHADA": (
+        "📦 Pacote/caixa fechado; o preço é por embalagem (campo unidade). "
+        "Se o cliente pediu 'uma unidade' (ex: 'uma salsicha'), PERGUNTE se ele quer o PACOTE FECHADO ou se prefere solto a granel."
+    ),
+    "PESAVEL": (
+        "⚖️ Peso variável (Açougue/Frios/Hortifrúti); o preço é por QUILO (KG). "
+        "1. Pedido por UNIDADE (ex: '2 calabresas', '3 maçãs'): ACEITE, AVISE que o valor é APROXIMADO e será confirmado na balança "
+        "e escreva a intenção original no campo 'observacao' do pedido (ex: 'CLIENTE QUER 2 UNIDADES'). "
+        "2. Pedido por VALOR (ex: '20 reais'): calcule o peso estimado e registre na observação."
+    ),
+}
+
+
 def _processar_produto_para_agente(produto_bruto: Dict[str, Any]) -> Dict[str, Any]:
     """
     MIDDLEWARE UNIVERSAL (SaaS):
-    Traduz o JSON técnico do ERP para instruções de venda que o Agente entende.
-    Classifica o produto entre PESÁVEL, PACOTE FECHADO ou UNITÁRIO.
+    Traduz o JSON técnico do ERP para o formato compacto que o Agente lê.
+    Classifica o produto entre PESÁVEL, PACOTE FECHADO ou UNITÁRIO; a
+    instrução de cada tipo vai uma única vez no resultado (INSTRUCOES_TIPO_VENDA).
     """
     # 1. Extração e Limpeza de Dados
     nome_sujo = produto_bruto.get("produto") or produto_bruto.get("nome") or produto_bruto.get("descricao") or "Produto sem nome"
@@ -62,77 +91,135 @@ def _processar_produto_para_agente(produto_bruto: Dict[str, Any]) -> Dict[str, A
     tem_kg_no_nome = "KG" in nome_sujo.upper()
     eh_pesavel = (is_fracionado or unidade_erp == "KG" or tem_kg_no_nome) and not eh_pacote
 
-    # 5. GERAÇÃO DA INSTRUÇÃO PARA A IA
+    # 5. Tipo de venda e unidade do preço
     tipo_venda = "UNITARIO"
     unidade_final = "UN"
-    instrucao = "Venda normal por unidade. Preço fixo."
-
     if eh_pacote:
         tipo_venda = "EMBALAGEM_FECHADA"
         unidade_final = unidade_erp if unidade_erp not in ["", "None"] else "PCT"
-        instrucao = (
-            f"📦 EMBALAGEM FECHADA: Este é um pacote/caixa fechado. "
-            f"Preço: R$ {preco_final:.2f} por {unidade_final}. "
-            f"Se o cliente pediu 'uma unidade' (ex: 'uma salsicha'), PERGUNTE se ele quer o PACOTE FECHADO ou se prefere solto a granel."
-        )
-
     elif eh_pesavel:
         tipo_venda = "PESAVEL"
         unidade_final = "KG"
-        instrucao = (
-            f"⚖️ PESO VARIÁVEL (Açougue/Frios/Hortifrúti): "
-            f"O preço R$ {preco_final:.2f} é por QUILO (KG). "
-            f"1. Se o cliente pedir por UNIDADE (ex: '2 calabresas', '3 maçãs'): "
-            f"   - ACEITE o pedido. "
-            f"   - AVISE que o valor é APROXIMADO e será confirmado na balança. "
-            f"   - No campo 'observacao' do pedido, escreva a intenção original (ex: 'CLIENTE QUER 2 UNIDADES'). "
-            f"2. Se pedir por VALOR (ex: '20 reais'): "
-            f"   - Calcule o peso estimado e registre na observação."
-        )
 
-    # 6. Montagem do JSON Final
+    # 6. Montagem do JSON Final (sem metadados de debug: cada campo custa tokens em toda chamada seguinte)
     return {
         "id": produto_bruto.get("id_produto") or produto_bruto.get("id"),
         "produto": nome_limpo,
-        "preco": float(preco_final),
+        "preco": round(float(preco_final), 2),
         "estoque_disponivel": disponivel,
         "tipo_venda": tipo_venda,           # UNITARIO, PESAVEL, EMBALAGEM_FECHADA
         "unidade": unidade_final,
-        "INSTRUCAO_IA": instrucao,          # <--- A IA lerá isso para saber como agir
-        
-        # Metadados originais ocultos (para debug se precisar)
-        "meta_original": nome_sujo,
-        "meta_emb": unidade_erp
     }
 
 
+def _normalizar(texto: str) -> str:
+    sem_acento = unicodedata.normalize("NFKD", texto or "").encode("ascii", "ignore").decode("ascii")
+    return sem_acento.lower()
+
+
+def _consulta_da_url(url: str) -> str:
+    """Termo buscado na URL de estoque (parâmetros da query string ou último trecho do caminho)."""
+    partes = urlsplit(url)
+    valores = [v for vs in parse_qs(partes.query).values() for v in vs if not v.isdigit()]
+    if valores:
+        return " ".join(valores)
+    return unquote(partes.path.rstrip("/").rsplit("/", 1)[-1])
+
+
+def _ordenar_por_relevancia(itens: List[Dict[str, Any]], consulta: Optional[str]) -> List[Dict[str, Any]]:
+    """Disponíveis primeiro; depois mais termos da consulta no nome e nome mais curto (mais específico)."""
+    termos = [t for t in re.findall(r"\w+", _normalizar(consulta or "")) if len(t) > 1]
+
+    def chave(item: Dict[str, Any]):
+        nome = _normalizar(item["produto"])
+        acertos = sum(1 for t in termos if t in nome)
+        return (not item["estoque_disponivel"], -acertos, len(nome))
+
+    return sorted(itens, key=chave)
+
+
+def _resultado_compacto(itens: List[Dict[str, Any]], consulta: Optional[str] = None) -> str:
+    """
+    JSON compacto para o agente: até TOOL_RESULT_MAX_ITEMS itens por relevância
+    e as instruções de venda uma vez por tipo_venda presente.
+    """
+    if not itens:
+        return "[]"
+    ordenados = _ordenar_por_relevancia(itens, consulta)
+    limite = max(1, settings.tool_result_max_items)
+    exibidos = ordenados[:limite]
+
+    resultado: Dict[str, Any] = {
+        "itens": exibidos,
+        "instrucoes": {t: INSTRUCOES_TIPO_VENDA[t] for t in dict.fromkeys(i["tipo_venda"] for i in exibidos)},
+    }
+    if len(ordenados) > limite:
+        resultado["omitidos"] = len(ordenados) - limite
+    return json.dumps(resultado, ensure_ascii=False, separators=(",", ":"))
+
+
+def _formatar_estoque(data: Any, consulta: Optional[str] = None) -> str:
+    """Resposta da busca por nome -> JSON compacto processado pelo middleware universal."""
+    # Normaliza para lista se vier objeto único
+    if isinstance(data, dict):
+        data = [data]
+    elif not isinstance(data, list):
+        data = []
+
+    # Aplica o Middleware Universal em cada item
+    itens_processados = [_processar_produto_para_agente(item) for item in data]
+    
+    logger.info(f"Estoque processado: {len(itens_processados)} produtos encontrados")
+    return _resultado_compacto(itens_processados, consulta)
+
+
+def _catalogo_local():
+    # Import tardio: tools.catalog depende deste módulo (middleware e headers)
+    from tools.catalog import get_catalog
+    return get_catalog()
+
+
+def _estoque_local(url: str) -> Optional[str]:
+    """Busca por nome no snapshot do catálogo; None = sem snapshot ou sem resultado (consulta o ERP)."""
+    indice = _catalogo_local()
+    if indice is None:
+        return None
+    consulta = _consulta_da_url(url)
+    itens = indice.buscar(consulta)
+    if not itens:
+        metrics.incr("catalog.miss")
+        return None
+    metrics.incr("catalog.hit")
+    logger.info(f"Estoque (catálogo local): {len(itens)} produtos para '{consulta}'")
+    return _resultado_compacto(itens, consulta)
+
+
+def _ean_local(ean_digits: str) -> Optional[str]:
+    """Consulta por EAN no snapshot do catálogo; None = sem snapshot ou EAN desconhecido."""
+    indice = _catalogo_local()
+    if indice is None:
+        return None
+    itens = indice.por_ean(ean_digits)
+    if not itens:
+        metrics.incr("catalog.miss")
+        return None
+    metrics.incr("catalog.hit")
+    return _resultado_compacto([i for i in itens if i["estoque_disponivel"]])
+
+
 def estoque(url: str) -> str:
     """
     Consulta o estoque (busca por nome) e aplica o middleware universal.
     """
+    local = _estoque_local(url)
+    if local is not None:
+        return local
     logger.info(f"Consultando estoque (SaaS): {url}")
     
     try:
-        response = requests.get(
-            url,
-            headers=get_auth_headers(),
-            timeout=10
-        )
+        response = request("GET", url, endpoint="estoque", headers=get_auth_headers())
         response.raise_for_status()
-        
-        data = response.json()
-        
-        # Normaliza para lista se vier objeto único
-        if isinstance(data, dict):
-            data = [data]
-        elif not isinstance(data, list):
-            data = []
-
-        # Aplica o Middleware Universal em cada item
-        itens_processados = [_processar_produto_para_agente(item) for item in data]
-        
-        logger.info(f"Estoque processado: {len(itens_processados)} produtos encontrados")
-        return json.dumps(itens_processados, indent=2, ensure_ascii=False)
+        return _formatar_estoque(response.json(), _consulta_da_url(url))
     
     except requests.exceptions.Timeout:
         msg = "Erro: Timeout ao consultar estoque. Tente novamente."
@@ -143,47 +230,76 @@ def estoque(url: str) -> str:
         return f"Erro técnico ao consultar estoque: {str(e)}"
 
 
-def estoque_preco(ean: str) -> str:
-    """
-    Consulta preço/estoque por EAN e aplica o middleware universal.
-    """
+def _url_ean(ean: str) -> Tuple[Optional[str], str]:
+    """(dígitos do EAN, URL de consulta); sem EAN válido retorna (None, mensagem de erro)."""
     base = (settings.estoque_ean_base_url or "").strip().rstrip("/")
     if not base:
-        return "Erro: URL de estoque EAN não configurada no .env"
+        return None, "Erro: URL de estoque EAN não configurada no .env"
 
     # Manter apenas dígitos do EAN
     ean_digits = "".join(filter(str.isdigit, ean))
     if not ean_digits:
-        return "Erro: EAN inválido (informe apenas números)."
+        return None, "Erro: EAN inválido (informe apenas números)."
 
-    url = f"{base}/{ean_digits}"
-    logger.info(f"Consultando EAN (SaaS): {url}")
+    return ean_digits, f"{base}/{ean_digits}"
 
-    try:
-        response = requests.get(url, headers=get_auth_headers(), timeout=10)
+
+def _itens_ean(data: Any) -> List[Dict[str, Any]]:
+    """Resposta da consulta por EAN -> itens disponíveis já processados."""
+    # Normaliza para lista
+    items = data if isinstance(data, list) else ([data] if isinstance(data, dict) else [])
+
+    # Aplica o Middleware Universal
+    # Filtramos apenas itens disponíveis para limpar a visão da IA,
+    # mas você pode remover o 'if' se quiser que a IA veja itens sem estoque.
+    itens_processados = []
+    for item in items:
+        processado = _processar_produto_para_agente(item)
+        if processado["estoque_disponivel"]: 
+            itens_processados.append(processado)
+    return itens_processados
+
+
+def _formatar_ean(data: Any, ean_digits: str) -> str:
+    """Resposta da consulta por EAN -> JSON compacto dos itens disponíveis."""
+    itens_processados = _itens_ean(data)
+    logger.info(f"EAN {ean_digits}: {len(itens_processados)} item(s) disponíveis")
+    return _resultado_compacto(itens_processados)
+
+
+def _consultar_ean(ean_digits: str, url: str) -> Any:
+    """JSON do ERP para o EAN (None = não existe), passando pelo cache L1/L2."""
+    def consultar() -> Any:
+        logger.info(f"Consultando EAN (SaaS): {url}")
+        response = request("GET", url, endpoint="estoque_ean", headers=get_auth_headers())
         
-        # Tratamento para APIs que retornam 404 quando produto não existe
+        # Tratamento para APIs que retornam 404 quando produto não existe (cache negativo)
         if response.status_code == 404:
-            return "[]" 
+            return None
             
         response.raise_for_status()
-        
-        data = response.json()
-        
-        # Normaliza para lista
-        items = data if isinstance(data, list) else ([data] if isinstance(data, dict) else [])
+        return response.json()
 
-        # Aplica o Middleware Universal
-        # Filtramos apenas itens disponíveis para limpar a visão da IA,
-        # mas você pode remover o 'if' se quiser que a IA veja itens sem estoque.
-        itens_processados = []
-        for item in items:
-            processado = _processar_produto_para_agente(item)
-            if processado["estoque_disponivel"]: 
-                itens_processados.append(processado)
+    cache = get_ean_cache()
+    return cache.get_or_fetch(ean_digits, consultar) if cache else consultar()
 
-        logger.info(f"EAN {ean_digits}: {len(itens_processados)} item(s) disponíveis")
-        return json.dumps(itens_processados, indent=2, ensure_ascii=False)
+
+def estoque_preco(ean: str) -> str:
+    """
+    Consulta preço/estoque por EAN e aplica o middleware universal.
+    """
+    ean_digits, url = _url_ean(ean)
+    if not ean_digits:
+        return url
+    local = _ean_local(ean_digits)
+    if local is not None:
+        return local
+
+    try:
+        data = _consultar_ean(ean_digits, url)
+        if data is None:
+            return "[]"
+        return _formatar_ean(data, ean_digits)
 
     except requests.exceptions.Timeout:
         return "Erro: Demorou muito para consultar o código de barras."
@@ -192,6 +308,121 @@ def estoque_preco(ean: str) -> str:
         return f"Erro técnico ao buscar produto pelo código: {str(e)}"
 
 
+def _eans_do_lote(eans: List[str]) -> Tuple[List[str], List[str]]:
+    """
+    EANs distintos do lote (só dígitos), na ordem pedida: (até EAN_BATCH_MAX_ITEMS, excedentes).
+    """
+    distintos = list(dict.fromkeys(d for d in ("".join(filter(str.isdigit, str(e))) for e in eans or []) if d))
+    limite = max(1, settings.ean_batch_max_items)
+    return distintos[:limite], distintos[limite:]
+
+
+def _resultado_lote(resultados: List[Tuple[str, Any]], omitidos: Optional[List[str]] = None) -> str:
+    """
+    Um JSON compacto para o lote: por EAN os itens disponíveis (ou o erro),
+    as instruções de venda uma vez por tipo_venda presente e os EANs não
+    consultados ("omitidos": além do limite do lote ou sem tempo no prazo).
+    """
+    linhas = []
+    tipos: Dict[str, None] = {}
+    for ean_digits, itens in resultados:
+        if isinstance(itens, str):
+            linhas.append({"ean": ean_digits, "erro": itens})
+            continue
+        linhas.append({"ean": ean_digits, "itens": itens})
+        tipos.update(dict.fromkeys(i["tipo_venda"] for i in itens))
+    resultado = {"resultados": linhas, "instrucoes": {t: INSTRUCOES_TIPO_VENDA[t] for t in tipos}}
+    if omitidos:
+        metrics.incr("tools.estoque_lote.omitidos", len(omitidos))
+        resultado["omitidos"] = omitidos
+        resultado["instrucao_omitidos"] = (
+            f"Os EANs em 'omitidos' não foram consultados (limite de {settings.ean_batch_max_items} por chamada "
+            f"ou tempo esgotado): consulte-os numa segunda chamada de estoque_lote."
+        )
+    return json.dumps(resultado, ensure_ascii=False, separators=(",", ":"))
+
+
+def _preco_um_ean(ean_digits: str) -> Any:
+    """Itens disponíveis do EAN ou a mensagem de erro (para o lote)."""
+    indice = _catalogo_local()
+    if indice is not None:
+        itens = indice.por_ean(ean_digits)
+        if itens:
+            metrics.incr("catalog.hit")
+            return [i for i in itens if i["estoque_disponivel"]]
+    _, url = _url_ean(ean_digits)
+    try:
+        data = _consultar_ean(ean_digits, url)
+        return _itens_ean(data) if data is not None else "não encontrado"
+    except requests.exceptions.Timeout:
+        return "tempo esgotado"
+    except Exception as e:
+        logger.error(f"Erro ao consultar EAN {ean_digits} (lote): {e}")
+        return "erro na consulta"
+
+
+def _mapear_lote(lote: List[str]) -> Tuple[List[Tuple[str, Any]], List[str]]:
+    """
+    `_preco_um_ean` de cada EAN no pool compartilhado, no máximo
+    EAN_BATCH_CONCURRENCY por lote: (resultados, EANs sem resposta no prazo).
+
+    Cada consulta roda numa cópia do contexto, então o prazo HTTP do turno
+    (`http_client.deadline`, aplicado por tool_guard) vale nas threads do pool.
+    Esgotado o prazo, os EANs pendentes voltam como omitidos em vez de segurar o turno.
+    """
+    fila = iter(lote)
+    pendentes: Dict[Future, str] = {}
+    resultados: Dict[str, Any] = {}
+
+    def proximo() -> None:
+        ean_digits = next(fila, None)
+        if ean_digits is not None:
+            ctx = contextvars.copy_context()
+            pendentes[_lote_executor.submit(ctx.run, _preco_um_ean, ean_digits)] = ean_digits
+
+    for _ in range(max(1, settings.ean_batch_concurrency)):
+        proximo()
+    while pendentes:
+        restante = remaining()
+        if restante is not None and restante <= 0:
+            break
+        prontos, _ = wait(pendentes, timeout=restante, return_when=FIRST_COMPLETED)
+        for future in prontos:
+            resultados[pendentes.pop(future)] = future.result()
+            proximo()
+
+    for future in pendentes:
+        future.cancel()  # as que já começaram terminam sozinhas (prazo HTTP), sem ninguém aguardar
+    sem_resposta = [e for e in lote if e not in resultados]
+    if sem_resposta:
+        metrics.incr("tools.estoque_lote.deadline", len(sem_resposta))
+        logger.warning(f"⏱️ Lote de EANs: {len(sem_resposta)} sem resposta no prazo")
+    return [(e, resultados[e]) for e in lote if e in resultados], sem_resposta
+
+
+def estoque_preco_lote(eans: List[str]) -> str:
+    """
+    Preço/estoque de vários EANs numa única chamada (lista de compras).
+    As consultas rodam em paralelo, no máximo EAN_BATCH_CONCURRENCY por vez;
+    EANs além de EAN_BATCH_MAX_ITEMS voltam em "omitidos".
+    """
+    lote, omitidos = _eans_do_lote(eans)
+    if not lote:
+        return "Erro: informe ao menos um EAN (apenas números)."
+    if not (settings.estoque_ean_base_url or "").strip():
+        return "Erro: URL de estoque EAN não configurada no .env"
+    logger.info(f"Consultando lote de {len(lote)} EAN(s)")
+
+    resultados, sem_resposta = _mapear_lote(lote)
+    return _resultado_lote(resultados, sem_resposta + omitidos)
+
+
+def _confirmacao_pedido(resp_json: Dict[str, Any]) -> str:
+    # Tenta extrair ID do pedido para confirmação
+    pedido_id = resp_json.get('id') or resp_json.get('numero_pedido') or 'N/A'
+    return f"✅ Pedido enviado com sucesso! (ID: {pedido_id})"
+
+
 def pedidos(json_body: str) -> str:
     """
     Envia um pedido finalizado para o painel.
@@ -203,19 +434,11 @@ def pedidos(json_body: str) -> str:
         # Validar se é JSON válido antes de enviar
         data = json.loads(json_body)
         
-        response = requests.post(
-            url,
-            headers=get_auth_headers(),
-            json=data,
-            timeout=10
-        )
+        # POST de pedido não é idempotente: nunca repetido automaticamente
+        response = request("POST", url, endpoint="pedidos", headers=get_auth_headers(), json=data)
         response.raise_for_status()
         
-        # Tenta extrair ID do pedido para confirmação
-        resp_json = response.json()
-        pedido_id = resp_json.get('id') or resp_json.get('numero_pedido') or 'N/A'
-        
-        return f"✅ Pedido enviado com sucesso! (ID: {pedido_id})"
+        return _confirmacao_pedido(response.json())
         
     except json.JSONDecodeError:
         return "Erro: O formato do pedido está incorreto (JSON inválido)."
@@ -235,12 +458,8 @@ def alterar(telefone: str, json_body: str) -> str:
     
     try:
         data = json.loads(json_body)
-        response = requests.put(
-            url,
-            headers=get_auth_headers(),
-            json=data,
-            timeout=10
-        )
+        # O PUT acrescenta itens ao pedido do telefone: repetir pode duplicar, então sem retentativa
+        response = request("PUT", url, endpoint="alterar", idempotent=False, headers=get_auth_headers(), json=data)
         response.raise_for_status()
         return "✅ Pedido atualizado com sucesso!"
         
@@ -249,17 +468,14 @@ def alterar(telefone: str, json_body: str) -> str:
         return f"Erro ao atualizar pedido: {str(e)}"
 
 
-def ean_lookup(query: str) -> str:
-    """
-    Consulta Smart Responder (Base de Conhecimento / RAG via Supabase).
-    Usa IA para identificar produtos por descrição ou imagem.
-    """
+def _smart_responder_request() -> Tuple[str, Optional[Dict[str, str]]]:
+    """(url, headers) do Smart Responder; sem configuração retorna (mensagem de erro, None)."""
     url = (settings.smart_responder_url or "").strip().replace("`", "")
     token = (settings.smart_responder_auth or settings.smart_responder_token or "").strip()
     apikey = (settings.smart_responder_apikey or "").strip()
     
     if not url or not token:
-        return "Erro: Configuração de IA (Smart Responder) não encontrada no .env"
+        return "Erro: Configuração de IA (Smart Responder) não encontrada no .env", None
 
     # Normaliza token Bearer
     auth_header = token if token.lower().startswith("bearer ") else f"Bearer {token}"
@@ -271,14 +487,29 @@ def ean_lookup(query: str) -> str:
     }
     if apikey:
         headers["apikey"] = apikey
+    return url, headers
+
+
+def ean_lookup(query: str) -> str:
+    """
+    Consulta Smart Responder (Base de Conhecimento / RAG via Supabase).
+    Usa IA para identificar produtos por descrição ou imagem.
+    """
+    url, headers = _smart_responder_request()
+    if not headers:
+        return url
 
     try:
         logger.info(f"Consultando IA RAG: {query[:50]}...")
-        resp = requests.post(url, headers=headers, json={"query": query}, timeout=15)
+        # Consulta (só leitura) via POST: pode ser repetida
+        resp = request(
+            "POST", url, endpoint="smart_responder", idempotent=True, read_timeout=15,
+            headers=headers, json={"query": query},
+        )
         
         # Tenta formatar se for JSON, senão devolve texto bruto
         try:
-            return json.dumps(resp.json(), indent=2, ensure_ascii=False)
+            return json.dumps(resp.json(), ensure_ascii=False, separators=(",", ":"))
         except:
             return resp.text
             
@@ -287,3 +518,157 @@ def ean_lookup(query: str) -> str:
     except Exception as e:
         logger.error(f"Erro RAG: {e}")
         return "Não consegui consultar a base de conhecimento no momento."
+
+
+# ============================================
+# Versões async (httpx.AsyncClient via http_client) para o caminho asyncio do agente
+# ============================================
+
+async def aestoque(url: str) -> str:
+    """Versão async de `estoque`."""
+    local = _estoque_local(url)
+    if local is not None:
+        return local
+    logger.info(f"Consultando estoque (SaaS): {url}")
+    
+    try:
+        response = await arequest("GET", url, endpoint="estoque", headers=get_auth_headers())
+        response.raise_for_status()
+        return _formatar_estoque(response.json(), _consulta_da_url(url))
+    
+    except httpx.TimeoutException:
+        msg = "Erro: Timeout ao consultar estoque. Tente novamente."
+        logger.error(msg)
+        return msg
+    except Exception as e:
+        logger.error(f"Erro em estoque: {e}")
+        return f"Erro técnico ao consultar estoque: {str(e)}"
+
+
+async def _aconsultar_ean(ean_digits: str, url: str) -> Any:
+    """Versão async de `_consultar_ean`."""
+    async def consultar() -> Any:
+        logger.info(f"Consultando EAN (SaaS): {url}")
+        response = await arequest("GET", url, endpoint="estoque_ean", headers=get_auth_headers())
+        if response.status_code == 404:
+            return None
+        response.raise_for_status()
+        return response.json()
+
+    cache = get_ean_cache()
+    return await cache.aget_or_fetch(ean_digits, consultar) if cache else await consultar()
+
+
+async def aestoque_preco(ean: str) -> str:
+    """Versão async de `estoque_preco`."""
+    ean_digits, url = _url_ean(ean)
+    if not ean_digits:
+        return url
+    local = _ean_local(ean_digits)
+    if local is not None:
+        return local
+
+    try:
+        data = await _aconsultar_ean(ean_digits, url)
+        if data is None:
+            return "[]"
+        return _formatar_ean(data, ean_digits)
+
+    except httpx.TimeoutException:
+        return "Erro: Demorou muito para consultar o código de barras."
+    except Exception as e:
+        logger.error(f"Erro ao consultar EAN: {e}")
+        return f"Erro técnico ao buscar produto pelo código: {str(e)}"
+
+
+async def _apreco_um_ean(ean_digits: str, vagas: asyncio.Semaphore) -> Any:
+    indice = _catalogo_local()
+    if indice is not None:
+        itens = indice.por_ean(ean_digits)
+        if itens:
+            metrics.incr("catalog.hit")
+            return [i for i in itens if i["estoque_disponivel"]]
+    _, url = _url_ean(ean_digits)
+    try:
+        async with vagas:
+            data = await _aconsultar_ean(ean_digits, url)
+        return _itens_ean(data) if data is not None else "não encontrado"
+    except httpx.TimeoutException:
+        return "tempo esgotado"
+    except Exception as e:
+        logger.error(f"Erro ao consultar EAN {ean_digits} (lote): {e}")
+        return "erro na consulta"
+
+
+async def aestoque_preco_lote(eans: List[str]) -> str:
+    """Versão async de `estoque_preco_lote`."""
+    lote, omitidos = _eans_do_lote(eans)
+    if not lote:
+        return "Erro: informe ao menos um EAN (apenas números)."
+    if not (settings.estoque_ean_base_url or "").strip():
+        return "Erro: URL de estoque EAN não configurada no .env"
+    logger.info(f"Consultando lote de {len(lote)} EAN(s)")
+
+    vagas = asyncio.Semaphore(max(1, settings.ean_batch_concurrency))
+    itens = await asyncio.gather(*(_apreco_um_ean(e, vagas) for e in lote))
+    return _resultado_lote(list(zip(lote, itens)), omitidos)
+
+
+async def apedidos(json_body: str) -> str:
+    """Versão async de `pedidos`."""
+    url = f"{settings.supermercado_base_url}/pedidos/"
+    logger.info(f"Enviando pedido: {url}")
+    
+    try:
+        data = json.loads(json_body)
+        response = await arequest("POST", url, endpoint="pedidos", headers=get_auth_headers(), json=data)
+        response.raise_for_status()
+        return _confirmacao_pedido(response.json())
+        
+    except json.JSONDecodeError:
+        return "Erro: O formato do pedido está incorreto (JSON inválido)."
+    except Exception as e:
+        logger.error(f"Erro ao enviar pedido: {e}")
+        return f"Erro ao enviar pedido para o sistema: {str(e)}"
+
+
+async def aalterar(telefone: str, json_body: str) -> str:
+    """Versão async de `alterar`."""
+    telefone_limpo = "".join(filter(str.isdigit, telefone))
+    url = f"{settings.supermercado_base_url}/pedidos/telefone/{telefone_limpo}"
+    
+    logger.info(f"Atualizando pedido telefone {telefone_limpo}")
+    
+    try:
+        data = json.loads(json_body)
+        response = await arequest("PUT", url, endpoint="alterar", idempotent=False, headers=get_auth_headers(), json=data)
+        response.raise_for_status()
+        return "✅ Pedido atualizado com sucesso!"
+        
+    except Exception as e:
+        logger.error(f"Erro ao atualizar pedido: {e}")
+        return f"Erro ao atualizar pedido: {str(e)}"
+
+
+async def aean_lookup(query: str) -> str:
+    """Versão async de `ean_lookup`."""
+    url, headers = _smart_responder_request()
+    if not headers:
+        return url
+
+    try:
+        logger.info(f"Consultando IA RAG: {query[:50]}...")
+        resp = await arequest(
+            "POST", url, endpoint="smart_responder", idempotent=True, read_timeout=15,
+            headers=headers, json={"query": query},
+        )
+        try:
+            return json.dumps(resp.json(), ensure_ascii=False, separators=(",", ":"))
+        except ValueError:
+            return resp.text
+            
+    except httpx.TimeoutException:
+        return "Erro: A consulta à base de conhecimento demorou muito."
+    except Exception as e:
+        logger.error(f"Erro RAG: {e}")
+        return "Não consegui consultar a base de conhecimento no momento."
@@ -1,11 +1,15 @@
 """
-Ferramentas Redis para buffer de mensagens e cooldown
+Ferramentas Redis para buffer de mensagens, deduplicação e cooldown
 Apenas funcionalidades essenciais mantidas
 """
+import asyncio
 import redis
+import redis.asyncio as aioredis
+import time
 from typing import Optional, Dict, List, Tuple
 from config.settings import settings
 from config.logger import setup_logger
+from config.metrics import metrics
 
 logger = setup_logger(__name__)
 
@@ -13,6 +17,10 @@ logger = setup_logger(__name__)
 _redis_client: Optional[redis.Redis] = None
 # Buffer local em memória (fallback quando Redis não está disponível)
 _local_buffer: Dict[str, List[str]] = {}
+# message_ids vistos localmente (fallback): id -> expiração (epoch)
+_local_seen: Dict[str, float] = {}
+# Clientes redis.asyncio por event loop (caminho quente do webhook/worker)
+_async_clients: Dict[int, aioredis.Redis] = {}
 
 
 def get_redis_client() -> Optional[redis.Redis]:
@@ -47,6 +55,40 @@ def get_redis_client() -> Optional[redis.Redis]:
     return _redis_client
 
 
+async def get_async_redis_client() -> Optional[aioredis.Redis]:
+    """
+    Retorna a conexão redis.asyncio do event loop atual.
+    Mesma política do cliente síncrono: None (fallback em memória) se o Redis não responder.
+    """
+    loop_id = id(asyncio.get_running_loop())
+    client = _async_clients.get(loop_id)
+    if client is None:
+        client = aioredis.Redis(
+            host=settings.redis_host,
+            port=settings.redis_port,
+            db=settings.redis_db,
+            password=settings.redis_password if settings.redis_password else None,
+            decode_responses=True,
+            socket_connect_timeout=5,
+            socket_timeout=5
+        )
+        try:
+            await client.ping()
+        except redis.exceptions.RedisError as e:
+            logger.error(f"Erro ao conectar ao Redis (async): {e}")
+            await client.aclose()
+            return None
+        _async_clients[loop_id] = client
+    return client
+
+
+async def close_async_redis_client() -> None:
+    """Fecha a conexão redis.asyncio do event loop atual (shutdown)."""
+    client = _async_clients.pop(id(asyncio.get_running_loop()), None)
+    if client is not None:
+        await client.aclose()
+
+
 # ============================================
 # Buffer de mensagens (concatenação por janela)
 # ============================================
@@ -56,6 +98,17 @@ def buffer_key(telefone: str) -> str:
     return f"msgbuf:{telefone}"
 
 
+def _push_local(telefone: str, mensagem: str) -> bool:
+    """Fallback em memória do buffer."""
+    msgs = _local_buffer.get(telefone)
+    if msgs is None:
+        _local_buffer[telefone] = [mensagem]
+    else:
+        msgs.append(mensagem)
+    logger.info(f"[fallback] Mensagem empilhada em memória para {telefone}")
+    return True
+
+
 def push_message_to_buffer(telefone: str, mensagem: str, ttl_seconds: int = 300) -> bool:
     """
     Empilha a mensagem recebida em uma lista no Redis para o telefone.
@@ -65,14 +118,7 @@ def push_message_to_buffer(telefone: str, mensagem: str, ttl_seconds: int = 300)
     """
     client = get_redis_client()
     if client is None:
-        # Fallback em memória
-        msgs = _local_buffer.get(telefone)
-        if msgs is None:
-            _local_buffer[telefone] = [mensagem]
-        else:
-            msgs.append(mensagem)
-        logger.info(f"[fallback] Mensagem empilhada em memória para {telefone}")
-        return True
+        return _push_local(telefone, mensagem)
 
     key = buffer_key(telefone)
     try:
@@ -87,6 +133,28 @@ def push_message_to_buffer(telefone: str, mensagem: str, ttl_seconds: int = 300)
         return False
 
 
+async def apush_message_to_buffer(telefone: str, mensagem: str, ttl_seconds: int = 300) -> bool:
+    """
+    Versão async de `push_message_to_buffer` (RPUSH + EXPIRE num único pipeline).
+    O TTL é renovado a cada mensagem: o buffer vive `ttl_seconds` após a última.
+    """
+    client = await get_async_redis_client()
+    if client is None:
+        return _push_local(telefone, mensagem)
+
+    key = buffer_key(telefone)
+    try:
+        pipe = client.pipeline(transaction=False)
+        pipe.rpush(key, mensagem)
+        pipe.expire(key, ttl_seconds)
+        await pipe.execute()
+        logger.info(f"Mensagem empilhada no buffer: {key}")
+        return True
+    except redis.exceptions.RedisError as e:
+        logger.error(f"Erro ao empilhar mensagem no Redis: {e}")
+        return False
+
+
 def get_buffer_length(telefone: str) -> int:
     """Retorna o tamanho atual do buffer de mensagens para o telefone."""
     client = get_redis_client()
@@ -107,11 +175,7 @@ def pop_all_messages(telefone: str) -> list[str]:
     """
     client = get_redis_client()
     if client is None:
-        # Fallback em memória
-        msgs = _local_buffer.get(telefone) or []
-        _local_buffer.pop(telefone, None)
-        logger.info(f"[fallback] Buffer consumido para {telefone}: {len(msgs)} mensagens")
-        return msgs
+        return _pop_local(telefone)
     key = buffer_key(telefone)
     try:
         pipe = client.pipeline()
@@ -126,6 +190,155 @@ def pop_all_messages(telefone: str) -> list[str]:
         return []
 
 
+async def apop_all_messages(telefone: str) -> list[str]:
+    """Versão async de `pop_all_messages` (LRANGE + DEL num pipeline do redis.asyncio)."""
+    client = await get_async_redis_client()
+    if client is None:
+        return _pop_local(telefone)
+    key = buffer_key(telefone)
+    try:
+        pipe = client.pipeline()
+        pipe.lrange(key, 0, -1)
+        pipe.delete(key)
+        msgs, _ = await pipe.execute()
+        msgs = [m for m in (msgs or []) if isinstance(m, str)]
+        logger.info(f"Buffer consumido para {telefone}: {len(msgs)} mensagens")
+        return msgs
+    except redis.exceptions.RedisError as e:
+        logger.error(f"Erro ao consumir buffer: {e}")
+        return []
+
+
+def _pop_local(telefone: str) -> list[str]:
+    """Fallback em memória do consumo do buffer."""
+    msgs = _local_buffer.pop(telefone, None) or []
+    logger.info(f"[fallback] Buffer consumido para {telefone}: {len(msgs)} mensagens")
+    return msgs
+
+
+# ============================================
+# Idempotência do webhook (message_id já visto)
+# ============================================
+
+def seen_key(message_id: str) -> str:
+    """Chave de deduplicação de entregas do webhook."""
+    return f"msgseen:{message_id}"
+
+
+def mark_message_seen(message_id: str, ttl_seconds: int = 3600) -> bool:
+    """
+    Registra o `message_id` e indica se é a primeira entrega.
+
+    - Usa `SET NX EX` (um único round trip): True se o id é novo,
+      False se é uma reentrega (duplicata) dentro do TTL.
+    - Sem `message_id` não há como deduplicar: sempre True.
+    """
+    if not message_id:
+        return True
+
+    client = get_redis_client()
+    if client is None:
+        is_new = _mark_seen_local(message_id, ttl_seconds)
+    else:
+        try:
+            is_new = bool(client.set(seen_key(message_id), "1", nx=True, ex=ttl_seconds))
+        except redis.exceptions.RedisError as e:
+            # Na dúvida, processa (melhor responder duas vezes do que nenhuma)
+            logger.error(f"Erro ao verificar duplicata: {e}")
+            return True
+
+    metrics.incr("dedup.miss" if is_new else "dedup.hit")
+    return is_new
+
+
+async def amark_message_seen(message_id: str, ttl_seconds: int = 3600) -> bool:
+    """Versão async de `mark_message_seen` (redis.asyncio, sem bloquear o event loop)."""
+    if not message_id:
+        return True
+
+    client = await get_async_redis_client()
+    if client is None:
+        is_new = _mark_seen_local(message_id, ttl_seconds)
+    else:
+        try:
+            is_new = bool(await client.set(seen_key(message_id), "1", nx=True, ex=ttl_seconds))
+        except redis.exceptions.RedisError as e:
+            logger.error(f"Erro ao verificar duplicata: {e}")
+            return True
+
+    metrics.incr("dedup.miss" if is_new else "dedup.hit")
+    return is_new
+
+
+def _mark_seen_local(message_id: str, ttl_seconds: int) -> bool:
+    """Fallback em memória do dedup (Redis indisponível)."""
+    now = time.time()
+    if len(_local_seen) > 10000:
+        for k in [k for k, exp in _local_seen.items() if exp <= now]:
+            _local_seen.pop(k, None)
+    is_new = _local_seen.get(message_id, 0) <= now
+    if is_new:
+        _local_seen[message_id] = now + ttl_seconds
+    return is_new
+
+
+# ============================================
+# Mídia pendente (modo stream: web e worker em processos diferentes)
+# ============================================
+
+# DECR que apaga a chave ao zerar (atômico: um INCR concorrente não se perde)
+_DECR_PENDING_SCRIPT = """
+local n = redis.call('DECR', KEYS[1])
+if n <= 0 then redis.call('DEL', KEYS[1]) end
+return n
+"""
+
+
+def media_pending_key(telefone: str) -> str:
+    """Chave do contador de mídias em processamento do telefone."""
+    return f"mediapend:{telefone}"
+
+
+async def aincr_media_pending(telefone: str, ttl_seconds: int) -> None:
+    """
+    Marca mais uma mídia do telefone em processamento (INCR + EXPIRE).
+    O TTL limita o adiamento do flush se o processo web cair antes do DECR.
+    """
+    client = await get_async_redis_client()
+    if client is None:
+        return
+    try:
+        pipe = client.pipeline(transaction=False)
+        pipe.incr(media_pending_key(telefone))
+        pipe.expire(media_pending_key(telefone), ttl_seconds)
+        await pipe.execute()
+    except redis.exceptions.RedisError as e:
+        logger.error(f"Erro ao marcar mídia pendente: {e}")
+
+
+async def adecr_media_pending(telefone: str) -> None:
+    """Desmarca uma mídia do telefone (a chave some ao chegar a zero)."""
+    client = await get_async_redis_client()
+    if client is None:
+        return
+    try:
+        await client.register_script(_DECR_PENDING_SCRIPT)(keys=[media_pending_key(telefone)])
+    except redis.exceptions.RedisError as e:
+        logger.error(f"Erro ao desmarcar mídia pendente: {e}")
+
+
+async def ahas_media_pending(telefone: str) -> bool:
+    """Indica se outro processo ainda está resolvendo mídia do telefone."""
+    client = await get_async_redis_client()
+    if client is None:
+        return False
+    try:
+        return int(await client.get(media_pending_key(telefone)) or 0) > 0
+    except redis.exceptions.RedisError as e:
+        logger.error(f"Erro ao consultar mídia pendente: {e}")
+        return False
+
+
 # ============================================
 # Cooldown do agente (pausa de automação)
 # ============================================
@@ -4,10 +4,11 @@ Ferramentas para manipulação de tempo e histórico
 import datetime
 import pytz
 import json
-import psycopg2
-from typing import List, Optional
+import psycopg
+from typing import List, Optional, Tuple
 from config.logger import setup_logger
 from config.settings import settings
+from memory.db_pool import connection, async_connection
 
 logger = setup_logger(__name__)
 
@@ -53,6 +54,89 @@ def get_current_time(timezone: str = "America/Sao_Paulo") -> str:
         return error_msg
 
 
+def _escape_like(value: str) -> str:
+    """Escapa curingas do LIKE digitados pelo cliente (%, _)."""
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def _history_query(telefone: str, keyword: Optional[str], indexed: bool = True) -> Tuple[str, tuple]:
+    """
+    Monta a consulta do histórico.
+
+    `indexed=True` usa a coluna gerada `content`, o `tsv` em português e os
+    índices da migração 002 (trigramas + session_id/created_at); `False` é a
+    forma antiga, extraindo o texto do JSON linha a linha.
+    """
+    content = "content" if indexed else "message->'data'->>'content'"
+    table = settings.postgres_table_name
+
+    if keyword:
+        # Full-text pega plurais/flexões; o ILIKE (trigramas) pega pedaços de palavra
+        match = f"{content} ILIKE %s"
+        params = (telefone, f"%{_escape_like(keyword)}%")
+        if indexed:
+            match = f"(tsv @@ plainto_tsquery('portuguese', %s) OR {match})"
+            params = (telefone, keyword, params[1])
+        query = f"""
+            SELECT message->>'type', {content}, created_at
+            FROM {table}
+            WHERE session_id = %s
+            AND {match}
+            ORDER BY created_at ASC
+            LIMIT 10
+        """
+        return query, params
+
+    query = f"""
+        SELECT message->>'type', {content}, created_at
+        FROM {table}
+        WHERE session_id = %s
+        ORDER BY created_at ASC
+        LIMIT 15
+    """
+    return query, (telefone,)
+
+
+def _formatar_historico(results: list, keyword: Optional[str], telefone_limpo: str) -> str:
+    """Linhas (tipo, conteúdo, created_at) -> resposta da ferramenta."""
+    if not results:
+        return "❌ Não encontrei mensagens anteriores. Talvez seja o início da nossa conversa."
+    
+    # Formatar resultado
+    mensagens_formatadas = []
+    for msg_type, content, created_at in results:
+        content = content or ''
+        
+        # Formatar horário
+        horario = created_at.strftime("%H:%M")
+        data = created_at.strftime("%d/%m")
+        
+        # Identificar quem enviou
+        remetente = "Você" if msg_type == "human" else "Ana"
+        
+        # Limitar tamanho da mensagem
+        if len(content) > 50:
+            content = content[:47] + "..."
+        
+        mensagens_formatadas.append(f"{horario} - {remetente}: {content}")
+    
+    # Criar resposta final
+    if keyword:
+        resumo = f"📋 Encontrei {len(mensagens_formatadas)} mensagens sobre '{keyword}':\n\n"
+    else:
+        resumo = f"📋 Últimas {len(mensagens_formatadas)} mensagens da nossa conversa:\n\n"
+    
+    resumo += "\n".join(mensagens_formatadas)
+    
+    # Adicionar informação sobre início da conversa
+    if results:
+        primeiro_horario = results[0][2].strftime("%H:%M")
+        resumo += f"\n\n⏰ Nossa conversa começou às {primeiro_horario}"
+    
+    logger.info(f"Histórico consultado para {telefone_limpo}: {len(mensagens_formatadas)} mensagens")
+    return resumo
+
+
 def search_message_history(telefone: str, keyword: str = None) -> str:
     """
     Busca mensagens anteriores do cliente com horários.
@@ -74,81 +158,23 @@ def search_message_history(telefone: str, keyword: str = None) -> str:
         # Sanitizar telefone
         telefone_limpo = ''.join(filter(str.isdigit, telefone))
         
-        # Conectar ao PostgreSQL
-        conn = psycopg2.connect(settings.postgres_connection_string)
-        cursor = conn.cursor()
-        
-        # Query base
-        if keyword:
-            # Buscar com palavra-chave
-            query = """
-                SELECT message, created_at 
-                FROM {} 
-                WHERE session_id = %s 
-                AND message->>'content' ILIKE %s
-                ORDER BY created_at ASC
-                LIMIT 10
-            """.format(settings.postgres_table_name)
-            cursor.execute(query, (telefone_limpo, f'%{keyword}%'))
-        else:
-            # Buscar todas as mensagens recentes
-            query = """
-                SELECT message, created_at 
-                FROM {} 
-                WHERE session_id = %s 
-                ORDER BY created_at ASC
-                LIMIT 15
-            """.format(settings.postgres_table_name)
-            cursor.execute(query, (telefone_limpo,))
+        # Conexão emprestada do pool compartilhado
+        with connection() as conn:
+            try:
+                with conn.cursor() as cursor:
+                    cursor.execute(*_history_query(telefone_limpo, keyword, indexed=True))
+                    results = cursor.fetchall()
+            except psycopg.errors.UndefinedColumn:
+                # Banco sem a migração 002: mesma busca extraindo do JSON (sem índice)
+                logger.warning("Colunas content/tsv ausentes (aplique migrations/002); busca sem índice")
+                conn.rollback()
+                with conn.cursor() as cursor:
+                    cursor.execute(*_history_query(telefone_limpo, keyword, indexed=False))
+                    results = cursor.fetchall()
         
-        results = cursor.fetchall()
+        return _formatar_historico(results, keyword, telefone_limpo)
         
-        if not results:
-            return "❌ Não encontrei mensagens anteriores. Talvez seja o início da nossa conversa."
-        
-        # Formatar resultado
-        mensagens_formatadas = []
-        for row in results:
-            msg_data = row[0]
-            created_at = row[1]
-            
-            # Extrair tipo e conteúdo
-            msg_type = msg_data.get('type', 'unknown')
-            content = msg_data.get('content', '')
-            
-            # Formatar horário
-            horario = created_at.strftime("%H:%M")
-            data = created_at.strftime("%d/%m")
-            
-            # Identificar quem enviou
-            remetente = "Você" if msg_type == "human" else "Ana"
-            
-            # Limitar tamanho da mensagem
-            if len(content) > 50:
-                content = content[:47] + "..."
-            
-            mensagens_formatadas.append(f"{horario} - {remetente}: {content}")
-        
-        cursor.close()
-        conn.close()
-        
-        # Criar resposta final
-        if keyword:
-            resumo = f"📋 Encontrei {len(mensagens_formatadas)} mensagens sobre '{keyword}':\n\n"
-        else:
-            resumo = f"📋 Últimas {len(mensagens_formatadas)} mensagens da nossa conversa:\n\n"
-        
-        resumo += "\n".join(mensagens_formatadas)
-        
-        # Adicionar informação sobre início da conversa
-        if results:
-            primeiro_horario = results[0][1].strftime("%H:%M")
-            resumo += f"\n\n⏰ Nossa conversa começou às {primeiro_horario}"
-        
-        logger.info(f"Histórico consultado para {telefone_limpo}: {len(mensagens_formatadas)} mensagens")
-        return resumo
-        
-    except psycopg2.Error as e:
+    except psycopg.Error as e:
         error_msg = f"❌ Erro ao acessar banco de dados: {str(e)}"
         logger.error(error_msg)
         return error_msg
@@ -157,3 +183,33 @@ def search_message_history(telefone: str, keyword: str = None) -> str:
         error_msg = f"❌ Erro ao buscar histórico: {str(e)}"
         logger.error(error_msg)
         return error_msg
+
+
+async def asearch_message_history(telefone: str, keyword: str = None) -> str:
+    """Versão async de `search_message_history` (pool async, sem thread)."""
+    try:
+        telefone_limpo = ''.join(filter(str.isdigit, telefone))
+
+        async with async_connection() as conn:
+            try:
+                async with conn.cursor() as cursor:
+                    await cursor.execute(*_history_query(telefone_limpo, keyword, indexed=True))
+                    results = await cursor.fetchall()
+            except psycopg.errors.UndefinedColumn:
+                logger.warning("Colunas content/tsv ausentes (aplique migrations/002); busca sem índice")
+                await conn.rollback()
+                async with conn.cursor() as cursor:
+                    await cursor.execute(*_history_query(telefone_limpo, keyword, indexed=False))
+                    results = await cursor.fetchall()
+
+        return _formatar_historico(results, keyword, telefone_limpo)
+
+    except psycopg.Error as e:
+        error_msg = f"❌ Erro ao acessar banco de dados: {str(e)}"
+        logger.error(error_msg)
+        return error_msg
+
+    except Exception as e:
+        error_msg = f"❌ Erro ao buscar histórico: {str(e)}"
+        logger.error(error_msg)
+        return error_msg
@@ -0,0 +1,136 @@
+"""
+Timeout por ferramenta e prazo por turno
+
+Quando o modelo pede várias consultas no mesmo passo (lista de compras com
+10 itens), o ToolNode do LangGraph já as executa em paralelo; aqui cada
+ferramenta ganha um teto próprio (TOOL_TIMEOUT_SECONDS) e todas respeitam o
+prazo do turno (AGENT_TURN_DEADLINE_SECONDS). Uma consulta que estoura vira
+uma mensagem de erro para o modelo, em vez de segurar o turno inteiro.
+
+O prazo do turno vive numa ContextVar: o LangGraph e o ToolNode copiam o
+contexto para as threads/tarefas que executam as ferramentas e o modelo.
+
+- asyncio: `asyncio.wait_for` cancela a ferramenta que estoura; o paralelismo
+  do passo é limitado por um semáforo do turno.
+- síncrono: a ferramenta roda na própria thread do ToolNode (paralelismo
+  limitado por `max_concurrency` na config do grafo). Não há thread extra:
+  o teto vira o prazo das chamadas HTTP dela (`http_client.deadline`), que
+  encurta timeouts e retentativas e faz a própria ferramenta devolver o erro
+  de tempo esgotado. Python não cancela threads: uma ferramenta síncrona que
+  trava fora do HTTP (ex: banco) não é interrompida, apenas contabilizada
+  como estouro quando termina.
+- modelo: `turn_remaining()` dá o tempo restante do turno, usado como
+  timeout de cada chamada ao LLM (agent_langgraph_simple.py).
+"""
+import asyncio
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, Optional
+
+from langchain_core.tools import StructuredTool
+
+from config.logger import setup_logger
+from config.metrics import metrics
+from config.settings import settings
+from tools.http_client import deadline as http_deadline
+
+logger = setup_logger(__name__)
+
+# Instante (time.monotonic) em que o turno atual deve terminar
+_turn_deadline: ContextVar[Optional[float]] = ContextVar("turn_deadline", default=None)
+# Vagas para ferramentas simultâneas no turno (caminho asyncio)
+_turn_slots: ContextVar[Optional[asyncio.Semaphore]] = ContextVar("turn_slots", default=None)
+
+
+class TurnDeadlineExceeded(TimeoutError):
+    """O turno do agente passou de AGENT_TURN_DEADLINE_SECONDS."""
+
+
+@contextmanager
+def turn_deadline(seconds: Optional[float] = None) -> Iterator[float]:
+    """Define o prazo das ferramentas e do modelo chamados dentro do bloco (um turno do agente)."""
+    seconds = settings.agent_turn_deadline_seconds if seconds is None else seconds
+    deadline = time.monotonic() + seconds
+    token = _turn_deadline.set(deadline)
+    slots_token = _turn_slots.set(asyncio.Semaphore(max(1, settings.tool_max_concurrency)))
+    try:
+        yield deadline
+    finally:
+        _turn_slots.reset(slots_token)
+        _turn_deadline.reset(token)
+
+
+def turn_remaining() -> Optional[float]:
+    """Segundos restantes do turno atual (None fora de `turn_deadline`)."""
+    deadline = _turn_deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def _budget(timeout: float) -> float:
+    """Tempo disponível para a próxima ferramenta: o menor entre o timeout dela e o que resta do turno."""
+    remaining = turn_remaining()
+    return timeout if remaining is None else min(timeout, remaining)
+
+
+def _timeout_message(name: str, budget: float) -> str:
+    return (
+        f"Erro: a consulta '{name}' não respondeu a tempo ({max(budget, 0):.0f}s). "
+        f"Siga com os resultados que já tem e avise o cliente sobre este item."
+    )
+
+
+def guard_tool(tool: StructuredTool, timeout: Optional[float] = None) -> StructuredTool:
+    """
+    Cópia da ferramenta com timeout próprio e respeito ao prazo do turno
+    (nas duas versões, `func` e `coroutine`).
+    """
+    timeout = settings.tool_timeout_seconds if timeout is None else timeout
+    name = tool.name
+    func, coroutine = tool.func, tool.coroutine
+
+    def guarded(*args, **kwargs):
+        budget = _budget(timeout)
+        if budget <= 0:
+            metrics.incr(f"tools.deadline_exceeded.{name}")
+            return _timeout_message(name, 0)
+        started = time.monotonic()
+        try:
+            with http_deadline(budget):
+                return func(*args, **kwargs)
+        finally:
+            elapsed = time.monotonic() - started
+            if elapsed >= budget:
+                metrics.incr(f"tools.timeout.{name}")
+                logger.warning(f"⏱️ Ferramenta {name} passou de {budget:.1f}s ({elapsed:.1f}s)")
+            metrics.observe(f"tools.seconds.{name}", elapsed)
+
+    async def _arun(*args, **kwargs):
+        budget = _budget(timeout)
+        if budget <= 0:
+            metrics.incr(f"tools.deadline_exceeded.{name}")
+            return _timeout_message(name, 0)
+        started = time.monotonic()
+        try:
+            return await asyncio.wait_for(coroutine(*args, **kwargs), timeout=budget)
+        except asyncio.TimeoutError:
+            metrics.incr(f"tools.timeout.{name}")
+            logger.warning(f"⏱️ Ferramenta {name} passou de {budget:.1f}s")
+            return _timeout_message(name, budget)
+        finally:
+            metrics.observe(f"tools.seconds.{name}", time.monotonic() - started)
+
+    async def aguarded(*args, **kwargs):
+        slots = _turn_slots.get()
+        if slots is None:
+            return await _arun(*args, **kwargs)
+        async with slots:
+            return await _arun(*args, **kwargs)
+
+    return StructuredTool(
+        name=name,
+        description=tool.description,
+        args_schema=tool.args_schema,
+        func=guarded if func else None,
+        coroutine=aguarded if coroutine else None,
+    )
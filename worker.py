@@ -0,0 +1,107 @@
+"""
+Worker do Agente de Supermercado (modo stream)
+
+Consome as partições do Redis Stream publicadas pelo servidor web,
+faz o debounce por telefone e executa o agente. Para escalar, suba
+mais processos worker (em qualquer nó): as partições são redistribuídas.
+
+Uso: EXECUTION_MODE=stream python worker.py
+"""
+import asyncio
+import signal
+from typing import Dict, List, Optional, Tuple
+
+from config.logger import setup_logger
+from config.metrics import metrics
+from services import runtime
+from services.stream_queue import StreamConsumer, partition_for
+
+logger = setup_logger(__name__)
+
+# Eventos aguardando ACK por telefone (confirmados ao fim do turno)
+pending_acks: Dict[str, List[Tuple[int, str]]] = {}
+consumer: Optional[StreamConsumer] = None
+
+
+async def _ack_if_owner(entries: List[Tuple[int, str]]) -> None:
+    """XACK só enquanto a partição for nossa; senão o novo dono (que reivindicou os eventos) confirma."""
+    if entries and await consumer.holds_lease(entries[0][0]):
+        await consumer.ack(entries)
+
+
+def _ack_when_done(future: asyncio.Future, entries: List[Tuple[int, str]]) -> None:
+    future.add_done_callback(lambda _: asyncio.ensure_future(_ack_if_owner(entries)))
+
+
+async def on_partition_lost(partition: int):
+    """Partição perdida/devolvida: descarta timers e ACKs pendentes dos telefones dela."""
+    nums = set(pending_acks) | set(runtime.buffer_scheduler.keys())
+    for num in nums:
+        if partition_for(num, consumer.partitions) != partition:
+            continue
+        runtime.buffer_scheduler.cancel(num)
+        pending_acks.pop(num, None)
+        runtime.presence_sessions.pop(num, None)
+
+
+async def on_entry(num: str, texto: Optional[str], entry: Tuple[int, str]):
+    """Evento de mensagens novas para o telefone (partição já é nossa)."""
+    if not num:
+        await consumer.ack([entry])
+        return
+
+    if texto:
+        # Mensagem que não coube no buffer: turno direto
+        future = runtime.agent_pool.submit(num, texto)
+        if future is None:
+            await runtime.handle_overload(num, texto)
+            await consumer.ack([entry])
+        else:
+            _ack_when_done(future, [entry])
+        return
+
+    pending_acks.setdefault(num, []).append(entry)
+    runtime.presence_sessions[num] = True
+    await runtime.touch_buffer(num)
+
+
+async def flush_and_ack(num: str):
+    """Flush do debounce no worker: o ACK dos eventos sai ao fim do turno."""
+    entries = pending_acks.pop(num, [])
+    if not await consumer.holds_lease(partition_for(num, consumer.partitions)):
+        # Lease perdido desde o agendamento: o novo dono refaz o flush a partir dos eventos
+        metrics.incr("stream.flush_not_owner")
+        return
+    future = await runtime.flush_buffer(num)
+    if future is not None:
+        _ack_when_done(future, entries)
+    elif runtime.buffer_scheduler.pending(num):
+        # Reagendado (turno em andamento ou sobrecarga): eventos seguem pendentes
+        pending_acks[num] = entries + pending_acks.get(num, [])
+    else:
+        await consumer.ack(entries)
+
+
+async def main():
+    global consumer
+    if not runtime.is_stream_mode():
+        logger.warning("EXECUTION_MODE não é 'stream': o servidor web continuará executando o agente localmente")
+
+    consumer = StreamConsumer(on_entry, on_partition_lost=on_partition_lost)
+    runtime.buffer_scheduler.on_flush = flush_and_ack
+    await runtime.start_worker()
+    await consumer.start()
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    await stop.wait()
+
+    logger.info("Encerrando worker...")
+    await consumer.stop()
+    await runtime.stop_worker()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())